@@ -0,0 +1,128 @@
+"""
+Content-addressed store of the files produced by the pipeline stages (encoded parts, exported videos).
+
+Every converter stage gets a key chained from the key of the previous stage, its type and config,
+and the hashes of the files it reads (see `BaseConverter.stage_key`). Artifacts are stored under
+`.cache/artifacts/<key><ext>` of the processed directory, so a rerun with unchanged inputs reuses them
+instead of rendering again. The store is capped by size and evicts the least recently used artifacts.
+
+    VIDMAKER_CACHE=0         disables the store
+    VIDMAKER_CACHE_MB=4096   size limit of the store of a directory
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import tool
+
+# Bump when the rendering changes, so that old artifacts are not reused
+CACHE_VERSION = 1
+
+ENABLED_ENV_VAR = "VIDMAKER_CACHE"
+SIZE_ENV_VAR = "VIDMAKER_CACHE_MB"
+DEFAULT_SIZE_MB = 4096
+
+def enabled():
+    return os.environ.get(ENABLED_ENV_VAR, "1").lower() not in ("0", "false", "no")
+
+def make_key(*parts):
+    """Stable hash of JSON-serializable parts (configs, file hashes, upstream keys)."""
+    data = json.dumps([CACHE_VERSION, *parts], sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+def _link_or_copy(source, target):
+    # A hard link costs nothing. It shares the inode with the store: ffmpeg -y truncates an existing
+    # file in place, so writers call detach() on their output first
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+
+def detach(path):
+    """
+    Removes `path` before a writer (ffmpeg) creates it again. A restored or stored file is a hard link
+    of the stored artifact, writing over it in place would corrupt the artifact.
+    """
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class ArtifactStore:
+    """Files addressed by key, evicted least recently used first when the store exceeds `max_bytes`."""
+
+    def __init__(self, directory, max_bytes=None):
+        self.directory = directory
+        if max_bytes is None:
+            max_bytes = int(float(os.environ.get(SIZE_ENV_VAR, DEFAULT_SIZE_MB)) * 1024 * 1024)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def path(self, key, ext):
+        return os.path.join(tool.get_cache_dir(self.directory, "artifacts"), f"{key}{ext}")
+
+    def get(self, key, ext):
+        """Path of the stored artifact, None if it is not in the store. Marks the artifact as recently used."""
+        path = self.path(key, ext)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def restore(self, key, ext, target):
+        """Places the stored artifact at `target`. :return: True if the artifact was in the store."""
+        path = self.get(key, ext)
+        if path is None:
+            return False
+        detach(target)
+        _link_or_copy(path, target)
+        return True
+
+    def put(self, key, ext, source):
+        """Adds the file `source` to the store (the file itself stays in place) and evicts old artifacts."""
+        path = self.path(key, ext)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        _link_or_copy(source, tmp_path)
+        os.replace(tmp_path, path)
+        self.evict()
+        return path
+
+    def evict(self):
+        """Removes the least recently used artifacts until the store fits into `max_bytes`."""
+        with self._lock:
+            cache_dir = tool.get_cache_dir(self.directory, "artifacts")
+            entries = []
+            for entry in os.scandir(cache_dir):
+                if entry.is_file() and not entry.name.endswith(".tmp"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total = sum(size for _, size, _ in entries)
+            removed = []
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                removed.append(path)
+            return removed
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def get_store(directory):
+    """Returns the artifact store of the directory, None if the store is disabled."""
+    if not enabled():
+        return None
+    key = os.path.abspath(directory)
+    with _stores_lock:
+        if key not in _stores:
+            _stores[key] = ArtifactStore(directory)
+        return _stores[key]
@@ -0,0 +1,299 @@
+import hashlib
+import json
+import os
+import threading
+import numpy as np
+import pcm_store
+import tool
+import tracing
+from model import AudioPart
+
+# Bump when the analysis algorithm changes, so that old sidecar files are not reused
+ANALYSIS_VERSION = 2
+
+# STFT frames computed at once by the streaming analysis: memory stays ~block_frames * n_fft floats for any audio length
+BLOCK_FRAMES = 256
+
+class BandAnalysis:
+    """
+    Per-frame band energies of a whole audio file.
+
+    `bands` is a float32 array (frames, bands, channels) with the mean STFT magnitude of every
+    frequency band, one frame every `hop_length` samples.
+    """
+
+    def __init__(self, bands, sample_rate, n_fft, hop_length, band_layout):
+        self.bands = bands
+        self.sample_rate = int(sample_rate)
+        self.n_fft = int(n_fft)
+        self.hop_length = int(hop_length)
+        self.band_layout = [tuple(band) for band in band_layout]
+
+    @property
+    def frame_rate(self):
+        return self.sample_rate / self.hop_length
+
+    def frame_range(self, audio_part: AudioPart):
+        """Range of analysis frames (start, stop) covering the audio part."""
+        start = int(round(audio_part.start_time * self.frame_rate))
+        if audio_part.end_time is None:
+            stop = len(self.bands)
+        else:
+            stop = int(round(audio_part.end_time * self.frame_rate)) + 1
+        return min(start, len(self.bands)), min(stop, len(self.bands))
+
+    def slice(self, audio_part: AudioPart):
+        """Band energies (frames, bands, channels) of the audio part, a view into the whole track."""
+        start, stop = self.frame_range(audio_part)
+        return self.bands[start:stop]
+
+    def save(self, path):
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp.npz"
+        np.savez(tmp_path, bands=self.bands, sample_rate=self.sample_rate, n_fft=self.n_fft,
+                 hop_length=self.hop_length, band_layout=np.array(self.band_layout, dtype=np.float64))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data["bands"], int(data["sample_rate"]), int(data["n_fft"]),
+                       int(data["hop_length"]), data["band_layout"].tolist())
+
+
+_analyses = {}
+_analysis_locks = {}
+_analysis_locks_guard = threading.Lock()
+
+def analysis_key(audio_file, sample_rate, n_fft, hop_length, band_layout):
+    """Cache key of an analysis: audio content, STFT parameters and band layout."""
+    description = {
+        "version": ANALYSIS_VERSION,
+        "audio": tool.file_hash(audio_file),
+        "sample_rate": int(sample_rate),
+        "n_fft": int(n_fft),
+        "hop_length": int(hop_length),
+        "bands": [[float(low), float(high)] for low, high in band_layout],
+    }
+    return hashlib.sha1(json.dumps(description, sort_keys=True).encode("utf-8")).hexdigest()
+
+def sidecar_path(audio_file, key):
+    return f"{audio_file}.{key[:12]}.analysis.npz"
+
+def get_band_analysis(audio_file, band_layout, fps, n_fft=2048, log=None, sample_rate=None) -> BandAnalysis:
+    """
+    Returns the band energies of the whole audio file with one analysis frame per video frame.
+
+    The analysis is computed once per audio file and parameters: it is shared in memory by all
+    split parts and persisted next to the audio file as an .npz sidecar for the next runs.
+
+    :param audio_file: Path of the audio file.
+    :param band_layout: List of frequency bands (low, high) in Hz.
+    :param fps: Video frame rate, the STFT hop is `sample_rate / fps` samples.
+    :param n_fft: FFT window size.
+    :param log: Optional HierarchicalLogger.
+    :param sample_rate: Sample rate of the analysed audio (`audio.sample_rate` of the visualizers), the native rate if None.
+    """
+    store = pcm_store.open_pcm_store(audio_file, log, sample_rate=sample_rate)
+    sample_rate = store.sample_rate
+    hop_length = int(sample_rate / fps)
+    key = analysis_key(audio_file, sample_rate, n_fft, hop_length, band_layout)
+
+    with _analysis_locks_guard:
+        lock = _analysis_locks.setdefault(key, threading.Lock())
+
+    # Parts processed in parallel wait for the first one instead of computing the same STFT
+    with lock:
+        if key in _analyses:
+            return _analyses[key]
+
+        path = sidecar_path(audio_file, key)
+        if os.path.exists(path):
+            if log:
+                log.log(f"[grey]📈 Using cached spectral analysis: [bold]{os.path.basename(path)}[/bold][/grey]")
+            analysis = BandAnalysis.load(path)
+        else:
+            if log:
+                log.log(f"[grey]📈 Computing spectral analysis of [bold]{audio_file}[/bold]: sr={sample_rate}, n_fft={n_fft}, hop={hop_length}[/grey]")
+            with tracing.span("band_analysis", cat="audio", n_fft=n_fft, hop_length=hop_length):
+                analysis = compute_band_analysis(store, band_layout, n_fft, hop_length)
+            analysis.save(path)
+
+        _analyses[key] = analysis
+        return analysis
+
+def compute_band_analysis(store: pcm_store.PcmStore, band_layout, n_fft, hop_length) -> BandAnalysis:
+    """Band energies of every channel, computed block by block from the PCM store."""
+    samples, sr = store.samples, store.sample_rate
+    averaging = band_matrix(fft_frequencies(sr, n_fft), band_layout)
+    # Mono audio is analysed as two identical channels
+    channels = max(2, samples.shape[1])
+    bands = np.zeros((stft_frame_count(len(samples), hop_length), len(band_layout), channels), dtype=np.float32)
+    for channel in range(channels):
+        column = samples[:, min(channel, samples.shape[1] - 1)]
+        for start, magnitudes in stream_stft(column, n_fft, hop_length):
+            bands[start:start + len(magnitudes), :, channel] = magnitudes @ averaging
+    return BandAnalysis(bands, sr, n_fft, hop_length, band_layout)
+
+def fft_frequencies(sample_rate, n_fft):
+    """Center frequencies of the STFT bins, as librosa.fft_frequencies."""
+    return np.fft.rfftfreq(n_fft, 1.0 / sample_rate)
+
+def band_matrix(frequencies, band_layout):
+    """
+    Matrix (bins, bands) averaging the STFT bins of every band [low, high): `magnitudes @ matrix`
+    gives the mean magnitude of each band, 0 for a band without bins.
+    """
+    matrix = np.zeros((len(frequencies), len(band_layout)), dtype=np.float32)
+    for i, (low, high) in enumerate(band_layout):
+        in_band = (frequencies >= low) & (frequencies < high)
+        if np.any(in_band):
+            matrix[in_band, i] = 1.0 / np.count_nonzero(in_band)
+    return matrix
+
+def hann_window(n_fft):
+    """Periodic Hann window, as the default window of librosa.stft."""
+    return (0.5 - 0.5 * np.cos(2 * np.pi * np.arange(n_fft) / n_fft)).astype(np.float32)
+
+def stft_frame_count(length, hop_length):
+    return 1 + length // hop_length
+
+def stream_stft(samples, n_fft, hop_length, block_frames=BLOCK_FRAMES):
+    """
+    STFT magnitudes of a 1D signal, block by block, equal to np.abs(librosa.stft(samples, n_fft, hop_length)).T
+    (centered frames, zero padding at both ends). Only the samples of one block are read at a time,
+    so the signal can be a memory-mapped file of any length.
+    :return: Generator of (first frame index, magnitudes (frames, n_fft // 2 + 1) float32).
+    """
+    length = len(samples)
+    n_frames = stft_frame_count(length, hop_length)
+    window = hann_window(n_fft)
+    pad = n_fft // 2
+    for first in range(0, n_frames, block_frames):
+        count = min(block_frames, n_frames - first)
+        # Samples of the block in padded coordinates, frame f starts at f * hop_length - pad
+        start = first * hop_length - pad
+        stop = (first + count - 1) * hop_length - pad + n_fft
+        segment = np.zeros(stop - start, dtype=np.float32)
+        src_start, src_stop = max(start, 0), min(stop, length)
+        if src_stop > src_start:
+            segment[src_start - start:src_stop - start] = samples[src_start:src_stop]
+        frames = np.lib.stride_tricks.sliding_window_view(segment, n_fft)[::hop_length][:count]
+        yield first, np.abs(np.fft.rfft(frames * window, axis=1)).astype(np.float32)
+
+
+class SpectrumStats:
+    """Mean, variance and maximum over time of every STFT bin, accumulated block by block in constant memory."""
+
+    def __init__(self, bins):
+        self.count = 0
+        self.sum = np.zeros(bins, dtype=np.float64)
+        self.sum_squares = np.zeros(bins, dtype=np.float64)
+        self.maximum = np.zeros(bins, dtype=np.float32)
+
+    def update(self, magnitudes):
+        """:param magnitudes: Block of STFT magnitudes (frames, bins)."""
+        values = magnitudes.astype(np.float64)
+        self.count += len(values)
+        self.sum += values.sum(axis=0)
+        self.sum_squares += np.square(values).sum(axis=0)
+        np.maximum(self.maximum, magnitudes.max(axis=0), out=self.maximum)
+
+    @property
+    def mean(self):
+        return self.sum / max(self.count, 1)
+
+    @property
+    def variance(self):
+        """Population variance, as np.var over the time axis."""
+        return np.maximum(self.sum_squares / max(self.count, 1) - np.square(self.mean), 0.0)
+
+    def save(self, path):
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp.npz"
+        np.savez(tmp_path, count=self.count, sum=self.sum, sum_squares=self.sum_squares, maximum=self.maximum)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            stats = cls(len(data["sum"]))
+            stats.count = int(data["count"])
+            stats.sum, stats.sum_squares, stats.maximum = data["sum"], data["sum_squares"], data["maximum"]
+        return stats
+
+@tracing.traced("spectrum_stats", cat="audio")
+def compute_spectrum_stats(store: pcm_store.PcmStore, n_fft=2048, hop_length=None) -> SpectrumStats:
+    """Statistics of the STFT of the mono mix of the store (mean of the channels, as librosa.load(mono=True))."""
+    hop_length = hop_length or n_fft // 4
+    samples = store.samples
+    stats = SpectrumStats(n_fft // 2 + 1)
+    mono = MonoMix(samples)
+    for _, magnitudes in stream_stft(mono, n_fft, hop_length):
+        stats.update(magnitudes)
+    return stats
+
+
+class MonoMix:
+    """Mean of the channels of a (samples, channels) array, computed only for the slices that are read."""
+
+    def __init__(self, samples):
+        self.samples = samples
+
+    def __len__(self):
+        return len(self.samples)
+
+    def __getitem__(self, key):
+        return self.samples[key].mean(axis=1, dtype=np.float32)
+
+
+_spectra = {}
+
+def get_spectrum_stats(audio_file, n_fft=2048, hop_length=None, log=None) -> SpectrumStats:
+    """
+    Returns the STFT statistics of the mono mix of the audio file, computed once per file and parameters
+    and persisted next to it as a .spectrum.npz sidecar.
+    """
+    store = pcm_store.open_pcm_store(audio_file, log)
+    hop_length = hop_length or n_fft // 4
+    key = analysis_key(audio_file, store.sample_rate, n_fft, hop_length, [])
+
+    with _analysis_locks_guard:
+        lock = _analysis_locks.setdefault(("spectrum", key), threading.Lock())
+
+    with lock:
+        if key in _spectra:
+            return _spectra[key]
+        path = f"{audio_file}.{key[:12]}.spectrum.npz"
+        if os.path.exists(path):
+            stats = SpectrumStats.load(path)
+        else:
+            if log:
+                log.log(f"[grey]📈 Computing spectrum statistics of [bold]{audio_file}[/bold]: n_fft={n_fft}, hop={hop_length}[/grey]")
+            stats = compute_spectrum_stats(store, n_fft=n_fft, hop_length=hop_length)
+            stats.save(path)
+        _spectra[key] = stats
+        return stats
+
+def suggest_bands(spectral_flux, frequencies, num_bands=4, num_intervals=499):
+    """
+    Frequency bands (low, high) in Hz with the most variable spectrum, sorted by frequency.
+
+    The frequency axis is cut into `num_intervals` equal intervals, the flux (variance over time)
+    of the STFT bins is summed per interval and the `num_bands` intervals with the largest sums win.
+    """
+    edges = np.linspace(frequencies[0], frequencies[-1], num=num_intervals + 1)
+    # Interval i holds the bins with edges[i] <= f < edges[i + 1], the last frequency is in none
+    intervals = np.digitize(frequencies, edges) - 1
+    valid = (intervals >= 0) & (intervals < num_intervals)
+    flux = np.bincount(intervals[valid], weights=spectral_flux[valid], minlength=num_intervals)
+    occupied = np.bincount(intervals[valid], minlength=num_intervals) > 0
+
+    candidates = np.flatnonzero(occupied)
+    # Stable sort: equal flux keeps the lower interval first
+    top = candidates[np.argsort(-flux[candidates], kind="stable")][:num_bands]
+    return [(round(edges[i]), round(edges[i + 1])) for i in sorted(top)]
+
+def suggest_frequency_bands(audio_file, num_bands=4, n_fft=2048, hop_length=None, log=None):
+    """Suggested frequency bands of an audio file, from the cached spectrum statistics."""
+    stats = get_spectrum_stats(audio_file, n_fft, hop_length, log)
+    frequencies = fft_frequencies(pcm_store.open_pcm_store(audio_file, log).sample_rate, n_fft)
+    return suggest_bands(stats.variance, frequencies, num_bands)
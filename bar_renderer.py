@@ -0,0 +1,96 @@
+import cv2
+import numpy as np
+
+
+def colormap_lut(colormap):
+    """RGB color (256, 3) of every level 0..255 of an OpenCV colormap, so that bars never call cv2.applyColorMap."""
+    bgr = cv2.applyColorMap(np.arange(256, dtype=np.uint8).reshape(-1, 1), colormap)
+    return np.ascontiguousarray(bgr[:, 0, ::-1])
+
+
+class BarStripRenderer:
+    """
+    Renders a row of equalizer bars into a strip: the smallest box of the frame containing all bars.
+
+    Bar geometry is computed once per clip. A frame is a few vectorized operations on the strip:
+    the height and color of every column come from the level of its bar, the fill is a comparison
+    of row numbers with the column heights. RGB, alpha mask and compositor regions of the same
+    frame share one rendering.
+    """
+
+    def __init__(self, position, bar_offsets, bar_width, max_height, levels, lut, anchor="bottom", opacity=1.0):
+        """
+        :param position: Top-left corner (x, y) of the strip in the frame.
+        :param bar_offsets: Left edge of every bar, relative to the strip.
+        :param bar_width: Width of a bar in pixels.
+        :param max_height: Height of a bar at level 1.0, also the strip height.
+        :param levels: Array (frames, bars) of bar levels in [0, 1].
+        :param lut: RGB color (256, 3) of every level.
+        :param anchor: "bottom" bars grow up from the strip bottom, "top" bars grow down from its top.
+        :param opacity: Opacity of the bars, the rest of the strip is transparent.
+        """
+        self.position = (int(position[0]), int(position[1]))
+        self.levels = np.clip(np.asarray(levels, dtype=np.float32), 0, 1)
+        self.num_frames = len(self.levels)
+        self.height = max(1, int(max_height))
+        self.lut = np.asarray(lut, dtype=np.uint8)
+        self.anchor = anchor
+        self.alpha_value = np.uint8(round(255 * opacity))
+
+        bar_offsets = np.asarray(bar_offsets, dtype=np.int64)
+        self.width = int(bar_offsets.max() + bar_width) if len(bar_offsets) else 1
+        # Bar of every strip column, -1 for the gaps between bars
+        self.column_bar = np.full(self.width, -1, dtype=np.int64)
+        for bar, offset in enumerate(bar_offsets):
+            self.column_bar[offset:offset + bar_width] = bar
+        self.bar_columns = self.column_bar >= 0
+        self.rows = np.arange(self.height)[:, None]
+        self._last_rendered = (None, None)
+
+    def _clamp(self, frame_idx):
+        return min(max(int(frame_idx), 0), self.num_frames - 1)
+
+    def render(self, frame_idx):
+        """:return: Read-only (rgb (h, w, 3), alpha (h, w) uint8) of the strip."""
+        frame_idx = self._clamp(frame_idx)
+        last_idx, last = self._last_rendered
+        if last_idx == frame_idx:
+            return last
+
+        levels = self.levels[frame_idx]
+        column_levels = np.where(self.bar_columns, levels[self.column_bar], 0)
+        heights = (column_levels * self.height).astype(np.int64)
+        if self.anchor == "top":
+            filled = self.rows < heights
+        else:
+            filled = self.rows >= self.height - heights
+        colors = self.lut[(column_levels * 255).astype(np.uint8)]
+
+        rgb = np.where(filled[:, :, None], colors[None, :, :], np.uint8(0)).astype(np.uint8)
+        alpha = filled.astype(np.uint8) * self.alpha_value
+        rgb.flags.writeable = False
+        alpha.flags.writeable = False
+        self._last_rendered = (frame_idx, (rgb, alpha))
+        return rgb, alpha
+
+    def render_region(self, frame_idx):
+        """Region (x, y, rgb, alpha) of the strip for compositor.set_regions."""
+        rgb, alpha = self.render(frame_idx)
+        return (self.position[0], self.position[1], rgb, alpha)
+
+
+def render_frame(size, strips, frame_idx):
+    """Full RGB frame (black background) of several strips."""
+    frame = np.zeros((size[1], size[0], 3), dtype=np.uint8)
+    for strip in strips:
+        x, y, rgb, alpha = strip.render_region(frame_idx)
+        frame[y:y + rgb.shape[0], x:x + rgb.shape[1]] = rgb
+    return frame
+
+def render_mask(size, strips, frame_idx):
+    """Full float mask in [0, 1] of several strips."""
+    mask = np.zeros((size[1], size[0]), dtype=np.float32)
+    for strip in strips:
+        x, y, rgb, alpha = strip.render_region(frame_idx)
+        mask[y:y + alpha.shape[0], x:x + alpha.shape[1]] = alpha / np.float32(255)
+    return mask
@@ -0,0 +1,295 @@
+"""
+Benchmark of the converters and of the full pipeline on synthetic inputs.
+
+Generates a stereo tone/noise track, JPEG slides and a GIF in a work directory, runs the pipeline
+converter by converter (as main.process_directory does, with the artifact store disabled) and measures
+every stage: build time, rendered frames per second and peak memory. Results are written as JSON and compared
+with a stored baseline, the script exits with code 1 when a metric regresses beyond the tolerance.
+
+    python benchmark.py --duration 20 --slides 6
+    python benchmark.py --update-baseline          # store the results as the new baseline
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import wave
+import numpy as np
+from rich.console import Console
+from rich.table import Table
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+console = Console()
+
+DEFAULT_BASELINE = "benchmark_baseline.json"
+
+def peak_rss_mb():
+    """Peak resident memory of the process and its finished children (ffmpeg) in MB, None if unknown."""
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return round(peak / scale, 1)
+
+# ---------------------------------------------------------------- synthetic inputs
+
+def generate_track(path, duration, sample_rate=44100, seed=0):
+    """
+    Writes a stereo track: beating bass and mid tones on the left, noise bursts and a high tone on the right,
+    so every frequency band of the visualizers moves. The WAV is encoded to MP3 as real inputs are.
+    """
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(duration * sample_rate)) / sample_rate
+    beat = 0.5 + 0.5 * np.sin(2 * np.pi * 2 * t) ** 2
+    left = 0.5 * beat * np.sin(2 * np.pi * 60 * t) + 0.2 * np.sin(2 * np.pi * 440 * t)
+    bursts = (np.sin(2 * np.pi * 0.5 * t) > 0).astype(np.float64)
+    right = 0.3 * bursts * rng.standard_normal(len(t)) + 0.2 * np.sin(2 * np.pi * 3000 * t)
+    samples = np.clip(np.stack([left, right], axis=1), -1, 1)
+
+    wav_path = os.path.splitext(path)[0] + ".wav"
+    with wave.open(wav_path, "wb") as f:
+        f.setnchannels(2)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes((samples * 32767).astype("<i2").tobytes())
+
+    from moviepy.config import get_setting
+    subprocess.run([get_setting("FFMPEG_BINARY"), "-v", "error", "-y", "-i", wav_path, "-b:a", "192k", path], check=True)
+    os.remove(wav_path)
+
+def generate_slides(directory, count, size, seed=0):
+    """Writes `count` JPEG slides with gradients, shapes and noise (so that they do not compress to nothing)."""
+    import cv2
+    rng = np.random.default_rng(seed)
+    width, height = size
+    y, x = np.mgrid[0:height, 0:width]
+    for i in range(count):
+        image = np.zeros((height, width, 3), dtype=np.uint8)
+        image[..., 0] = (x * 255 // width + i * 40) % 256
+        image[..., 1] = (y * 255 // height + i * 70) % 256
+        image[..., 2] = 128
+        for _ in range(20):
+            center = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+            color = tuple(int(c) for c in rng.integers(0, 256, 3))
+            cv2.circle(image, center, int(rng.integers(10, height // 4)), color, -1)
+        image = cv2.add(image, rng.integers(0, 24, image.shape, dtype=np.uint8))
+        cv2.imwrite(os.path.join(directory, f"slide_{i + 1:03d}.jpg"), image, [cv2.IMWRITE_JPEG_QUALITY, 90])
+
+def generate_gif(path, frames=12, size=200):
+    """Writes an animated GIF: a pulsing disc on black, keyed out by the image overlay."""
+    from PIL import Image, ImageDraw
+    images = []
+    for i in range(frames):
+        image = Image.new("RGB", (size, size), "black")
+        radius = size // 4 + int(size // 6 * np.sin(2 * np.pi * i / frames))
+        ImageDraw.Draw(image).ellipse(
+            (size // 2 - radius, size // 2 - radius, size // 2 + radius, size // 2 + radius), fill=(255, 200, 40))
+        images.append(image)
+    images[0].save(path, save_all=True, append_images=images[1:], duration=80, loop=0)
+
+# ---------------------------------------------------------------- pipeline
+
+def pipeline_config(args, gif_file):
+    """Converters of the benchmarked pipeline, in the main.process_directory format."""
+    quality = {"fps": args.fps, "codec": "libx264", "preset": args.preset}
+    return [
+        {"type": "AudioReaderConverter"},
+        {"type": "SlideshowCreatorConverter", "config": {
+            "slideshow": {"height": args.height, "duration": args.slide_duration},
+            "transition": {"fade_in": 0.5, "fade_out": 0.5, "fade_in_first_image": False}}},
+        {"type": "SplitConverter", "config": {"parts": args.parts}},
+        {"type": "TwoSpotsVisualizationConverter", "config": {
+            "visualization": {"fps": args.fps, "colormap": "COLORMAP_SUMMER"}}},
+        {"type": "ChannelBarsVisualizer", "config": {
+            "visualization": {"fps": args.fps, "colormap": "COLORMAP_JET"},
+            "frequency_bands": [60, 250, 500, 2000, 6000]}},
+        {"type": "EqualizerBarsConverter", "config": {
+            "visualization": {"fps": args.fps, "num_bars": 60, "opacity": 0.8}}},
+        {"type": "ImageOverlayConverter", "config": {
+            "image": {"path": gif_file, "position": {"x": "left", "y": "bottom"}}}},
+        {"type": "TextOverlayConverter", "config": {
+            "text": "Benchmark\nTrack", "position": {"x": "center", "y": "10pt"},
+            "font": {"name": "Arial", "size": 64, "color": "white"}, "contour": {"color": "black", "size": 3},
+            "transition": {"fade_in": 1.0, "fade_out": 1.0}}},
+        {"type": "JoinConverter", "config": quality},
+        {"type": "AudioReaderConverter"},
+        {"type": "VideoExportConverter", "config": {"output_file": "benchmark.mp4", "quality": quality}},
+    ]
+
+def measure_frames(clips, frames):
+    """Renders `frames` frames spread over the clips and returns the frame rate."""
+    per_clip = max(1, frames // max(1, len(clips)))
+    rendered = 0
+    start = time.perf_counter()
+    for clip in clips:
+        for t in np.linspace(0, clip.duration, per_clip, endpoint=False):
+            clip.get_frame(t)
+            rendered += 1
+    elapsed = time.perf_counter() - start
+    return rendered / elapsed if elapsed > 0 else None
+
+# Converters whose output clips are worth rendering frame by frame
+RENDERED_CONVERTERS = ("SlideshowCreatorConverter", "TwoSpotsVisualizationConverter", "ChannelBarsVisualizer",
+                       "EqualizerBarsConverter", "ImageOverlayConverter", "TextOverlayConverter")
+
+def run_pipeline(directory, converters, args):
+    import main
+    import resources
+    from hierarchical_logger import HierarchicalLogger
+
+    # Same metadata as main.process_directory gives the first task of a directory
+    metadata = {"task_prefix": "task1_"}
+    logger = HierarchicalLogger(directory=directory, file_prefix=metadata["task_prefix"])
+    metadata["resources"] = resources.ResourceBudget()
+    results = {}
+    clips = []
+    measuring_seconds = 0.0
+    pipeline_start = time.perf_counter()
+    for position, converter_data in enumerate(converters):
+        converter_type = converter_data["type"]
+        name = f"{position + 1:02d}_{converter_type}"
+        converter = main.create_converter(converter_type, directory, converter_data.get("config", {}), logger)
+        metadata["stage_key"] = converter.stage_key(metadata.get("stage_key"))
+        start = time.perf_counter()
+        try:
+            clips = converter.process(clips, metadata)
+        except Exception as e:
+            results[name] = {"error": f"{type(e).__name__}: {e}"}
+            console.print(f"[red]❌ {converter_type} failed: {e}[/red]")
+            break
+        stage = {"build_seconds": round(time.perf_counter() - start, 3)}
+        if converter_type in RENDERED_CONVERTERS and args.frames > 0:
+            measuring_start = time.perf_counter()
+            stage["render_fps"] = round(measure_frames(clips, args.frames), 2)
+            measuring_seconds += time.perf_counter() - measuring_start
+        stage["peak_rss_mb"] = peak_rss_mb()
+        results[name] = stage
+
+    # The frames rendered for the measurements are not part of the pipeline time
+    total_seconds = time.perf_counter() - pipeline_start - measuring_seconds
+    results["pipeline"] = {"total_seconds": round(total_seconds, 3), "peak_rss_mb": peak_rss_mb()}
+    # The log file is in the working directory, removed after the run
+    logger.flush()
+    return results
+
+# ---------------------------------------------------------------- baseline
+
+def compare(results, baseline, tolerance, min_seconds=0.05):
+    """
+    Compares the results with the baseline.
+    Seconds and memory must not grow, frames per second must not drop, by more than `tolerance` (0.2 = 20%).
+    Changes of durations below `min_seconds` are timer noise and never count as regressions.
+    :return: List of regressions (stage, metric, baseline, current, change).
+    """
+    regressions = []
+    table = Table(title="📊 Benchmark vs baseline")
+    for column in ("Stage", "Metric", "Baseline", "Current", "Change"):
+        table.add_column(column)
+
+    for stage, metrics in results["results"].items():
+        base_metrics = baseline.get("results", {}).get(stage, {})
+        for metric, value in metrics.items():
+            base = base_metrics.get(metric)
+            if not isinstance(value, (int, float)) or not isinstance(base, (int, float)) or base == 0:
+                continue
+            change = (value - base) / base
+            higher_is_better = metric.endswith("_fps")
+            regressed = (-change if higher_is_better else change) > tolerance
+            if metric.endswith("_seconds") and value - base < min_seconds:
+                regressed = False
+            color = "red" if regressed else "green"
+            table.add_row(stage, metric, f"{base}", f"{value}", f"[{color}]{change:+.1%}[/{color}]")
+            if regressed:
+                regressions.append((stage, metric, base, value, change))
+    console.print(table)
+    return regressions
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the converters and the full pipeline on synthetic inputs.")
+    parser.add_argument("--duration", type=float, default=20, help="Length of the synthetic track in seconds")
+    parser.add_argument("--slides", type=int, default=6, help="Number of generated JPEG slides")
+    parser.add_argument("--slide-size", default="1920x1080", help="Size of the generated slides, WxH")
+    parser.add_argument("--slide-duration", type=float, default=4, help="Duration of one slide in seconds")
+    parser.add_argument("--height", type=int, default=720, help="Slideshow height")
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--parts", type=int, default=2, help="Parts of the SplitConverter")
+    parser.add_argument("--preset", default="ultrafast", help="x264 preset of the join and the export")
+    parser.add_argument("--frames", type=int, default=60, help="Frames rendered to measure frames/sec of a stage, 0 to skip")
+    parser.add_argument("--workdir", help="Directory for the synthetic inputs (default: a temporary directory)")
+    parser.add_argument("--keep", action="store_true", help="Keep the work directory")
+    parser.add_argument("--output", default="benchmark_results.json", help="JSON file with the results")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="JSON baseline to compare with")
+    parser.add_argument("--update-baseline", action="store_true", help="Store the results as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed regression, 0.2 = 20%%")
+    parser.add_argument("--min-seconds", type=float, default=0.05, help="Duration changes below this are ignored")
+    args = parser.parse_args(argv)
+
+    # Parts and exports restored from the artifact store of a kept work directory would measure the cache
+    import artifact_cache
+    os.environ[artifact_cache.ENABLED_ENV_VAR] = "0"
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="vidmaker_benchmark_")
+    os.makedirs(workdir, exist_ok=True)
+    console.rule(f"Benchmark in {workdir}")
+    try:
+        start = time.perf_counter()
+        generate_track(os.path.join(workdir, "track.mp3"), args.duration)
+        generate_slides(workdir, args.slides, tuple(int(v) for v in args.slide_size.split("x")))
+        gif_file = os.path.join(workdir, "overlay.gif")
+        generate_gif(gif_file)
+        console.print(f"[grey]🧪 Synthetic inputs generated in {time.perf_counter() - start:.1f} s[/grey]")
+
+        results = {
+            "environment": {
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+                "numpy": np.__version__,
+            },
+            "parameters": {k: v for k, v in vars(args).items() if k not in ("workdir", "keep", "output", "baseline", "update_baseline", "tolerance", "min_seconds")},
+            "results": run_pipeline(workdir, pipeline_config(args, gif_file), args),
+        }
+    finally:
+        if not args.keep and not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    console.print(f"[green]✅ Results written to {args.output}[/green]")
+
+    failed = [stage for stage, metrics in results["results"].items() if "error" in metrics]
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        console.print(f"[green]✅ Baseline updated: {args.baseline}[/green]")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("parameters") != results["parameters"]:
+            console.print("[yellow]⚠️ Baseline was measured with other parameters, the comparison is not meaningful[/yellow]")
+        regressions = compare(results, baseline, args.tolerance, args.min_seconds)
+        if regressions:
+            for stage, metric, base, value, change in regressions:
+                console.print(f"[red]❌ Regression: {stage} {metric} {base} -> {value} ({change:+.1%})[/red]")
+            return 1
+    else:
+        console.print(f"[yellow]⚠️ No baseline found at {args.baseline}, run with --update-baseline to store one[/yellow]")
+
+    if failed:
+        console.print(f"[red]❌ Failed stages: {', '.join(failed)}[/red]")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
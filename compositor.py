@@ -0,0 +1,235 @@
+import numpy as np
+from moviepy.audio.AudioClip import CompositeAudioClip
+from moviepy.video.VideoClip import VideoClip
+from moviepy.video.compositing.CompositeVideoClip import CompositeVideoClip
+import tracing
+
+
+class LayeredCompositeClip(VideoClip):
+    """
+    Composite of an opaque background clip and overlay layers, blended with uint8 alpha.
+
+    Only the bounding box of every layer is blended, in place, with fixed-point alpha, so the cost
+    of an overlay depends on its area and not on the frame size. Untouched pixels come from the
+    background frame as they are: when no layer is playing the background frame itself is returned.
+
+    A layer may describe what it draws at clip time `t` with `set_regions`, otherwise its frame
+    and mask are blended as one region at the clip position. Everything below an opaque full-frame
+    region is skipped, and when all clips have a valid `frame_key` (see set_frame_key) the last composed frame is reused.
+    Use `composite_clips`, which falls back to moviepy's CompositeVideoClip when the clips can not
+    be composed this way.
+    """
+
+    def __init__(self, clips, size=None):
+        VideoClip.__init__(self)
+        self.bg = clips[0]
+        self.clips = clips[1:]
+        self.size = size or self.bg.size
+
+        fpss = [c.fps for c in clips if getattr(c, 'fps', None)]
+        self.fps = max(fpss) if fpss else None
+
+        # As CompositeVideoClip, the background is one of the clips for the duration and the audio
+        ends = [c.end for c in clips]
+        if None not in ends:
+            self.duration = self.end = max(ends)
+
+        audioclips = [c.audio for c in clips if c.audio is not None]
+        if audioclips:
+            self.audio = CompositeAudioClip(audioclips)
+
+        # Frames of this clip are new arrays, the next compositor can blend into them in place
+        self.frames_writable = True
+        self._last_frame = (None, None)
+        self.make_frame = tracing.traced("composite", cat="frame")(self._make_frame)
+        set_frame_key(self)
+
+    def frame_key(self, t):
+        """Key equal for all times with the same frame, None if unknown (a clip has no frame_key)."""
+        keys = []
+        for c in [self.bg] + self.clips:
+            if c is not self.bg and not c.is_playing(t):
+                continue
+            key = clip_frame_key(c, t - c.start)
+            if key is None:
+                return None
+            keys.append((id(c), key))
+        return tuple(keys)
+
+    def _make_frame(self, t):
+        key = self.frame_key(t)
+        if key is not None and self._last_frame[0] == key:
+            return self._last_frame[1]
+
+        regions = []
+        for layer in self.clips:
+            if layer.is_playing(t):
+                regions.extend(layer_regions(layer, t, self.size))
+
+        # Start from the last opaque full-frame region, nothing below it is visible
+        frame, source = None, self.bg
+        for i in range(len(regions) - 1, -1, -1):
+            x, y, rgb, alpha = regions[i]
+            if alpha is None and x == 0 and y == 0 and tuple(rgb.shape[1::-1]) == tuple(self.size):
+                frame, source, regions = rgb, None, regions[i + 1:]
+                break
+        if frame is None:
+            frame = self.bg.get_frame(t)
+
+        owned = frame.flags.writeable and getattr(source, "frames_writable", False) and frame.dtype == np.uint8
+        if regions:
+            # Copy the background only when something is drawn on it, and only if it is shared
+            if not owned:
+                frame = np.array(frame, dtype=np.uint8)
+                owned = True
+            for x, y, rgb, alpha in regions:
+                blend_region(frame, x, y, rgb, alpha)
+
+        if not owned and frame.flags.writeable:
+            # A frame passed through from another clip must not be modified by the next compositor
+            frame = frame.view()
+            frame.flags.writeable = False
+        if key is not None:
+            # The frame is kept for the next times with the same key, it must not be modified downstream
+            frame.flags.writeable = False
+            self._last_frame = (key, frame)
+        return frame
+
+
+def composite_clips(clips, size=None):
+    """
+    Composes clips like CompositeVideoClip(clips, size), the first clip being the background.
+
+    The uint8 LayeredCompositeClip is used when the background covers the whole frame for the whole
+    duration and has no mask, otherwise moviepy's CompositeVideoClip is returned.
+    """
+    bg = clips[0]
+    size = size or bg.size
+    covers_frame = (
+        len(clips) > 1
+        and tuple(bg.size) == tuple(size)
+        and bg.mask is None
+        and not bg.ismask
+        and bg.start == 0
+        and list(resolve_position(bg, 0, size)) == [0, 0]
+    )
+    if covers_frame:
+        ends = [c.end for c in clips[1:]]
+        if bg.end is not None and (None in ends or bg.end < max(ends)):
+            covers_frame = False
+    if not covers_frame:
+        return CompositeVideoClip(clips, size=size)
+    return LayeredCompositeClip(clips, size=size)
+
+
+def set_regions(clip, regions):
+    """
+    Declares what a clip draws, so that compositors blend only those regions.
+
+    :param regions: Function of the clip time returning a list of (x, y, rgb, alpha) in clip
+        coordinates: `rgb` is a uint8 array (h, w, 3), `alpha` a uint8 array (h, w) or None if opaque.
+    :return: The clip itself. The regions are ignored once the frame or mask function of the clip changes (fx, fl).
+    """
+    clip.regions = regions
+    clip.regions_key = _regions_key(clip)
+    return clip
+
+
+def set_frame_key(clip):
+    """
+    Declares that `clip.frame_key(t)` is equal for times with identical frames, so compositors reuse them.
+    :return: The clip itself. The key is ignored once the frame or mask function of the clip changes
+        (subclip shifts the time, fx, fl), as the regions are.
+    """
+    clip.frame_key_source = _regions_key(clip)
+    return clip
+
+
+def clip_frame_key(clip, t):
+    """`clip.frame_key(t)` if it still describes the frames of the clip, None otherwise."""
+    source = getattr(clip, "frame_key_source", None)
+    if source is None or source != _regions_key(clip):
+        return None
+    return clip.frame_key(t)
+
+
+def _regions_key(clip):
+    return (clip.make_frame, clip.mask.make_frame if clip.mask is not None else None)
+
+
+def resolve_position(clip, t, frame_size):
+    """Top-left corner (x, y) of a clip on a frame, as VideoClip.blit_on places it."""
+    wf, hf = frame_size
+    wi, hi = clip.size
+    pos = clip.pos(t)
+
+    # preprocess short writings of the position
+    if isinstance(pos, str):
+        pos = {'center': ['center', 'center'],
+               'left': ['left', 'center'],
+               'right': ['right', 'center'],
+               'top': ['center', 'top'],
+               'bottom': ['center', 'bottom']}[pos]
+    else:
+        pos = list(pos)
+
+    # is the position relative (given in % of the clip's size) ?
+    if clip.relative_pos:
+        for i, dim in enumerate([wf, hf]):
+            if not isinstance(pos[i], str):
+                pos[i] = dim * pos[i]
+
+    if isinstance(pos[0], str):
+        pos[0] = {'left': 0, 'center': (wf - wi) / 2, 'right': wf - wi}[pos[0]]
+    if isinstance(pos[1], str):
+        pos[1] = {'top': 0, 'center': (hf - hi) / 2, 'bottom': hf - hi}[pos[1]]
+
+    return int(pos[0]), int(pos[1])
+
+
+def layer_regions(layer, t, frame_size):
+    """Regions (x, y, rgb, alpha) drawn by a layer at composite time `t`, in frame coordinates."""
+    ct = t - layer.start
+    x0, y0 = resolve_position(layer, ct, frame_size)
+
+    if getattr(layer, "regions", None) is not None and getattr(layer, "regions_key", None) == _regions_key(layer):
+        return [(x0 + x, y0 + y, rgb, alpha) for x, y, rgb, alpha in layer.regions(ct)]
+
+    rgb = layer.get_frame(ct)
+    alpha = None
+    if layer.mask is not None:
+        mask = layer.mask.get_frame(ct)
+        if rgb.shape[:2] != mask.shape[:2]:
+            rgb = layer.fill_array(rgb, mask.shape)
+        alpha = (np.asarray(mask, dtype=np.float32) * 255 + 0.5).astype(np.uint8)
+    if rgb.dtype != np.uint8:
+        rgb = rgb.astype(np.uint8)
+    return [(x0, y0, rgb, alpha)]
+
+
+def blend_region(frame, x, y, rgb, alpha=None):
+    """
+    Blends a region over the frame in place: frame = rgb * alpha + frame * (255 - alpha), in uint8 fixed point.
+    The region is clipped to the frame.
+    """
+    hf, wf = frame.shape[:2]
+    h, w = rgb.shape[:2]
+    x1, y1 = max(0, -x), max(0, -y)
+    x2, y2 = min(w, wf - x), min(h, hf - y)
+    if x1 >= x2 or y1 >= y2:
+        return
+
+    target = frame[y + y1:y + y2, x + x1:x + x2]
+    source = rgb[y1:y2, x1:x2]
+    if alpha is None:
+        target[...] = source
+        return
+
+    a = alpha[y1:y2, x1:x2, None].astype(np.uint16)
+    blended = source * a
+    blended += target * (255 - a)
+    blended += 128
+    # Exact rounded division by 255
+    blended += blended >> 8
+    blended >>= 8
+    target[...] = blended
@@ -0,0 +1,55 @@
+"""
+Registry of the converters by the type name used in config.yaml.
+
+Converter modules import moviepy, librosa, cv2 and PIL, so they are imported only when a converter
+of their type is created. The time spent importing every module is kept in `import_times`.
+"""
+import importlib
+import os
+import subprocess
+import sys
+import threading
+import time
+
+CONVERTERS = {
+    "AudioReaderConverter": "converters.audio_reader_converter:AudioReaderConverter",
+    "SlideshowCreatorConverter": "converters.slideshow_creator_converter:SlideshowCreatorConverter",
+    "TextOverlayConverter": "converters.text_overlay_converter:TextOverlayConverter",
+    "ImageOverlayConverter": "converters.image_overlay_converter:ImageOverlayConverter",
+    "SplitConverter": "converters.split_converter:SplitConverter",
+    "TwoSpotsVisualizationConverter": "converters.two_basses_visualization_convertor:TwoSpotsVisualizationConverter",
+    "ChannelBarsVisualizer": "converters.channel_bars_visualizer:ChannelBarsVisualizer",
+    "EqualizerBarsConverter": "converters.equalizer_bars_converter:EqualizerBarsConverter",
+    "JoinConverter": "converters.join_converter:JoinConverter",
+    "VideoExportConverter": "converters.video_export_converter:VideoExportConverter",
+}
+
+# Converter type -> seconds spent importing its module (0 if the module was already imported by another one)
+import_times = {}
+_lock = threading.Lock()
+
+def converter_names():
+    return list(CONVERTERS)
+
+def is_known(converter_type):
+    return converter_type in CONVERTERS
+
+def get_converter_class(converter_type):
+    """Imports the module of the converter type on first use. :return: The converter class, None for an unknown type."""
+    target = CONVERTERS.get(converter_type)
+    if target is None:
+        return None
+    module_name, class_name = target.split(":")
+    with _lock:
+        start = time.perf_counter()
+        module = importlib.import_module(module_name)
+        import_times.setdefault(converter_type, time.perf_counter() - start)
+    return getattr(module, class_name)
+
+def measure_import_time(converter_type):
+    """Seconds needed to import the converter in a fresh interpreter, with all its dependencies."""
+    module_name = CONVERTERS[converter_type].split(":")[0]
+    code = f"import time; start = time.perf_counter(); import {module_name}; print(time.perf_counter() - start)"
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run([sys.executable, "-c", code], cwd=root, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+    return float(result.stdout.decode().strip().splitlines()[-1])
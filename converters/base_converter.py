@@ -1,13 +1,40 @@
+from __future__ import annotations
 from abc import ABC, abstractmethod
-from concurrent.futures import ThreadPoolExecutor
-from hierarchical_logger import HierarchicalLogger
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import os
+import cloudpickle
+import artifact_cache
+import resources
+from hierarchical_logger import HierarchicalLogger, flush as flush_logs
+import tracing
 from rich.console import Console
 import time
-from tool import transform_to_MMSS
-from moviepy.editor import VideoClip
+from tool import transform_to_MMSS, file_hash
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from moviepy.editor import VideoClip
+
+def _run_pickled(payload):
+    """
+    Runs a converter method in a worker process.
+    Clip graphs contain closures (make_frame functions), so they travel with cloudpickle.
+    Trace events of the worker are sent back with the result.
+    """
+    # A forked worker starts with a copy of the events of the main process
+    tracing.drain()
+    method, args = cloudpickle.loads(payload)
+    result = method(*args)
+    # Worker processes exit without atexit handlers, queued log messages must be written now
+    flush_logs()
+    return cloudpickle.dumps((result, tracing.drain()))
 
 class BaseConverter(ABC):
     config = {}
+    # Bump in a converter when its output changes for the same config and inputs
+    stage_version = 1
+    # True in converters whose convert renders the frames (encodes the parts), see get_parallel_config
+    renders_frames = False
     
     def __init__(self, directory, config, logger: HierarchicalLogger):
         """
@@ -20,6 +47,21 @@ class BaseConverter(ABC):
         self.mylog = logger
         self.log = logger.sub_logger()
 
+    def input_files(self):
+        """
+        Files of the directory read by the converter, their content is part of the stage key.
+        Converters reading only the clips of the previous stage return an empty list.
+        """
+        return []
+
+    def stage_key(self, upstream_key=None):
+        """
+        Cache key of the stage output: chained from the key of the previous stage, the converter type,
+        its config and the hashes of its input files. Equal keys mean equal clips.
+        """
+        input_hashes = [(os.path.basename(f), file_hash(f)) for f in self.input_files() if os.path.isfile(f)]
+        return artifact_cache.make_key(upstream_key, self.__class__.__name__, self.stage_version, self.config, input_hashes)
+
     def _convert(self, clip: VideoClip, metadata, index):
         """
         Abstract method that all derived converters must implement.
@@ -28,12 +70,15 @@ class BaseConverter(ABC):
         :param metadata: Common metadata shared between converters.
         :return: Processed clip or list of processed clips.
         """
-        time.sleep(index * 1.0)
         # Клонируем метаданные для каждого клипа
         metadata = metadata.copy()
         metadata["index"] = index
 
-        result = self.convert(clip, metadata, index)
+        # Worker processes get the thread counts of the phase with the metadata
+        if metadata.get("resources") is not None:
+            metadata["resources"].apply()
+        with tracing.span(f"{self.__class__.__name__}.convert", cat="part", part=index):
+            result = self.convert(clip, metadata, index)
         result.filename = clip.filename
         return result
 
@@ -48,11 +93,56 @@ class BaseConverter(ABC):
         """
         pass
 
+    def get_parallel_config(self, num_clips, budget: resources.ResourceBudget = None):
+        """
+        Reads the `parallel` section of the converter configuration:
+            parallel:
+              backend: process  # thread (default) or process
+              workers: 4        # default: one worker per clip up to the cores of the job budget
+
+        Only `convert` runs in the worker processes. Visualizers and overlays only build the moviepy
+        clip there, their frames are rendered later by the converter that encodes the parts, so the
+        process backend speeds up JoinConverter only and is ignored (with a warning) by the others.
+        :param budget: Resource budget of the job, sizes the workers when they are not configured.
+        :return: Tuple (backend, workers), workers is None for the executor default.
+        """
+        parallel = self.config.get('parallel', {}) or {}
+        backend = parallel.get('backend', 'thread')
+        if backend not in ('thread', 'process'):
+            raise ValueError(f"Unknown parallel backend: {backend}. Use 'thread' or 'process'.")
+        if backend == 'process' and not self.renders_frames:
+            self.log.warn(f"{self.__class__.__name__} does not render frames, the process backend would not speed it up. "
+                          f"Set it on JoinConverter, using the thread backend")
+            backend = 'thread'
+        workers = parallel.get('workers')
+        if workers is None and budget is not None:
+            workers = budget.workers(num_clips)
+        if workers is None and backend == 'process':
+            workers = min(num_clips, os.cpu_count() or 1)
+        return backend, workers
+
     def process_async(self, clips, metadata, method):
         converter_name = self.__class__.__name__
-        with ThreadPoolExecutor() as executor:
-            self.mylog.log(f"{converter_name}: [blue]Multiple clips detected, processing in parallel[/blue]")
-            self.log_clip_conversion(converter_name)
+        budget = metadata.get("resources")
+        backend, workers = self.get_parallel_config(len(clips), budget)
+        if budget is not None:
+            budget.enter(resources.PHASE_RENDER, min(workers, len(clips)))
+            self.mylog.log(f"[grey]⚙️ {budget.describe()}[/grey]")
+        self.mylog.log(f"{converter_name}: [blue]Multiple clips detected, processing in parallel ({backend} backend, {workers or 'default'} workers)[/blue]")
+        self.log_clip_conversion(converter_name)
+
+        if backend == 'process':
+            # Each part is rendered in its own process, so GIL-bound frame rendering really runs in parallel
+            payloads = [cloudpickle.dumps((method, (clip, metadata, i))) for i, clip in enumerate(clips)]
+            results = []
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                for payload in executor.map(_run_pickled, payloads):
+                    result, events = cloudpickle.loads(payload)
+                    tracing.merge(events)
+                    results.append(result)
+            return results
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
             func = lambda clip, i: method(clip, metadata, i)
             results = list(executor.map(func, clips, range(len(clips))))
         return results
@@ -69,12 +159,15 @@ class BaseConverter(ABC):
         converter_name = self.__class__.__name__
 
         if len(clips) > 1:
-            return self.process_async(clips, metadata, self._convert)
+            results = self.process_async(clips, metadata, self._convert)
         else:
             self.mylog.log(f"{converter_name}: [blue]Single clip detected, processing sequentially[/blue]")
+            if metadata.get("resources") is not None:
+                metadata["resources"].enter(resources.PHASE_RENDER, 1)
             self.log_clip_conversion(converter_name)
             first_clip = clips[0] if len(clips) > 0 else None
-            results = [self.convert(first_clip, metadata, 0)]
+            with tracing.span(f"{converter_name}.convert", cat="part", part=0):
+                results = [self.convert(first_clip, metadata, 0)]
 
         self.log_execution_time(start_time)
         return results
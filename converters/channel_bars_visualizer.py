@@ -1,88 +1,109 @@
 import numpy as np
 import cv2
-from moviepy.editor import AudioFileClip
-from PIL import Image, ImageDraw, ImageFont
+from moviepy.video.VideoClip import VideoClip
+from rich.table import Table
 from .base_converter import BaseConverter
+import audio_analysis
+import compositor
 import tool
+import tracing
+from bar_renderer import BarStripRenderer, colormap_lut, render_frame, render_mask
 
-class ChannelBarsVisualizer(BaseConverter):  # Assuming BasicConvert is your provided base class
+class ChannelBarsVisualizer(BaseConverter):
+    """
+    Per-frame bars of the frequency bands of each channel: the left channel in the bottom left corner,
+    the right channel mirrored in the bottom right corner.
 
-    num_bars_per_channel = 4  # four bars for each channel
-    font = ImageFont.load_default()  # Font for bar height labels
+        visualization:
+          fps: 60
+          colormap: COLORMAP_JET
+          bar_height_scale: 0.8   # level of the loudest frame of the track
+          max_height_percent: 25  # bar height at full level, percent of the frame height
+          bar_width: 20           # pixels at 1024 px frame height
+          spacing: 10
+          opacity: 1.0
+        frequency_bands: [60, 250, 500, 2000]  # band edges from 20 Hz, or [[low, high], ...], or [{band: [low, high]}, ...]
+        audio:
+          sample_rate: 48000      # rate the audio is analysed at, default: the rate of the audio file
+    """
 
-    def convert(self, clip, metadata):
-        # Extract audio data from the video clip
-        fps = self.config.get('visualization', {}).get('fps', 60)
-        sample_rate = self.config.get('audio', {}).get('sample_rate', 48000)
+    def convert(self, clip: VideoClip, metadata, index: int = 0):
+        if not clip:
+            self.log.error("No existing clips found. Cannot add channel bars without clips.")
+            raise ValueError("No existing clips found to add channel bars.")
 
-        audio = clip.audio
-        audio_data, sample_rate = tool.load_audio_from_videoclip(audio, self.log, fps, metadata=metadata, sample_rate=sample_rate)
-        
-        # Configuration parameters
-        colormap_name = self.config.get('visualization', {}).get('colormap', 'COLORMAP_JET')
-        bar_height_scale = self.config.get('visualization', {}).get('bar_height_scale', 0.8)
-        
-        # Visualization image size
-        image_size = clip.size
-        bar_width = self.config.get('visualization', {}).get('bar_width', 20)
-        spacing = self.config.get('visualization', {}).get('spacing', 10)
+        visualization = self.config.get('visualization', {})
+        fps = visualization.get('fps', 60)
+        colormap_name = visualization.get('colormap', 'COLORMAP_JET')
+        colormap = getattr(cv2, colormap_name, cv2.COLORMAP_JET)
+        bar_height_scale = visualization.get('bar_height_scale', 0.8)
+        max_height_percent = visualization.get('max_height_percent', 25)
+        opacity = visualization.get('opacity', 1.0)
 
-        # Color map from OpenCV
-        colormap = getattr(cv2, colormap_name)
-        
-        # Define frequency bands for each bar (frequency ranges)
-        frequency_bands = self.config.get('frequency_bands', [60, 250, 500, 2000])
+        size = clip.size
+        resize_factor = size[1] / 1024
+        bar_width = max(1, round(visualization.get('bar_width', 20) * resize_factor))
+        spacing = max(0, round(visualization.get('spacing', 10) * resize_factor))
+        band_layout = self.band_layout(self.config.get('frequency_bands', [60, 250, 500, 2000]))
 
-        # Create an image to draw the visualization on
-        image = Image.new("RGB", image_size, "black")
-        draw = ImageDraw.Draw(image)
-        
-        # Split audio data into left and right channels
-        left_channel, right_channel = np.split(audio_data, 2)
-        
-        # Calculate amplitude for each bar based on frequency bands
-        left_bars = self.calculate_frequency_bounce(left_channel, frequency_bands, bar_height_scale)
-        right_bars = self.calculate_frequency_bounce(right_channel, frequency_bands, bar_height_scale)
-        
-        # Draw bars for both channels
-        self.draw_bars(draw, left_bars, side="left", colormap=colormap, size=image_size)
-        self.draw_bars(draw, right_bars, side="right", colormap=colormap, size=image_size)
-        
-        return image
+        # Band energies of the whole track are computed once and shared by all split parts
+        audio_part = metadata["audio_parts"][index]
+        sample_rate = (self.config.get('audio') or {}).get('sample_rate')
+        analysis = audio_analysis.get_band_analysis(audio_part.audio_file, band_layout, fps=fps, n_fft=2048, log=self.log,
+                                                    sample_rate=sample_rate)
+        # Levels are normalized over the whole track, so that they do not jump between parts
+        max_amp = analysis.bands.max() or 1e-6
+        levels = analysis.slice(audio_part) / max_amp * bar_height_scale
 
-    
-    def calculate_frequency_bounce(self, channel_data, frequency_bands, scale):
-        """ Calculate amplitude for each frequency band (Frequency Bounce) """
-        amplitudes = []
-        
-        for band in frequency_bands:
-            # Filter data by frequency
-            band_data = channel_data[::band]  # Approximate filter, can be refined for accuracy
-            amplitude = np.mean(np.abs(band_data)) * scale
-            amplitudes.append(amplitude)
-        
-        return amplitudes
+        # The bars of both channels must fit side by side
+        step = bar_width + spacing
+        num_bars = len(band_layout)
+        if 2 * num_bars * step > size[0]:
+            step = max(1, size[0] // (2 * num_bars))
+            bar_width = max(1, step - spacing)
+        max_height = max(1, int(size[1] * max_height_percent / 100))
+        offsets = np.arange(num_bars) * step
+        strip_width = int(offsets[-1] + bar_width)
+        y = size[1] - max_height
+
+        lut = colormap_lut(colormap)
+        strips = [
+            # Left channel, low bands at the left edge
+            BarStripRenderer((0, y), offsets, bar_width, max_height, levels[:, :, 0], lut, opacity=opacity),
+            # Right channel, mirrored: low bands at the right edge
+            BarStripRenderer((size[0] - strip_width, y), strip_width - bar_width - offsets, bar_width, max_height,
+                             levels[:, :, 1], lut, opacity=opacity),
+        ]
 
-    def draw_bars(self, draw: ImageDraw, amplitudes, side="left", colormap=cv2.COLORMAP_JET):
-        """ Draw bars on the image using OpenCV ColorMap """
-        for idx, amplitude in enumerate(amplitudes):
-            # Determine color for each bar based on amplitude
-            color_value = int((amplitude / max(amplitudes)) * 255)
-            color = cv2.applyColorMap(np.array([[color_value]], dtype=np.uint8), colormap)[0][0]
-            color_tuple = (int(color[0]), int(color[1]), int(color[2]))
+        table = Table(title="📊 Channel Bars")
+        table.add_column("↔Range", justify="center")
+        table.add_column("Max Left", justify="center")
+        table.add_column("Max Right", justify="center")
+        for i, (low, high) in enumerate(band_layout):
+            table.add_row(f"{low:.0f}-{high:.0f} Hz", f"{levels[:, i, 0].max():.2f}", f"{levels[:, i, 1].max():.2f}")
+        self.log.print(table)
+        self.log.log(f"[grey]🎨 Colormap {tool.get_colormap_name(colormap)}, bars ↔{bar_width} ↕{max_height} px, {num_bars} per channel[/grey]")
 
-            # Define the x-position for each bar
-            if side == "left":
-                x_pos = idx * (self.config['visualization']['bar_width'] + self.config['visualization']['spacing'])
-            else:
-                x_pos = self.config['visualization']['image_width'] - (idx + 1) * (self.config['visualization']['bar_width'] + self.config['visualization']['spacing'])
+        def frame_index(t):
+            return int(t * fps)
 
-            y_top = draw.size[1] - amplitude
-            y_bottom = draw.size[1]
+        bars_clip = VideoClip(tracing.traced("channel_bars.make_frame", cat="frame")(
+            lambda t: render_frame(size, strips, frame_index(t))), duration=clip.duration).set_fps(fps)
+        mask_clip = VideoClip(lambda t: render_mask(size, strips, frame_index(t)), ismask=True, duration=clip.duration).set_fps(fps)
+        bars_clip = bars_clip.set_mask(mask_clip)
+        # The compositor blends only the two strips
+        compositor.set_regions(bars_clip, lambda t: [strip.render_region(frame_index(t)) for strip in strips])
 
-            # Draw the rectangle for each bar
-            draw.rectangle([x_pos, y_top, x_pos + self.config['visualization']['bar_width'], y_bottom], fill=color_tuple)
+        return compositor.composite_clips([clip, bars_clip])
 
-            # Add height label below each bar
-            text_position = (x_pos, y_bottom + 5)
-            draw.text(text_position, f"{int(amplitude)}", fill="white", font=self.font)
+    @staticmethod
+    def band_layout(frequency_bands):
+        """Frequency bands (low, high) from the config: band edges starting at 20 Hz, pairs or `band` entries."""
+        if all(isinstance(band, (int, float)) for band in frequency_bands):
+            edges = [20] + list(frequency_bands)
+            return [(float(low), float(high)) for low, high in zip(edges[:-1], edges[1:])]
+        layout = []
+        for band in frequency_bands:
+            low, high = band['band'] if isinstance(band, dict) else band
+            layout.append((float(low), float(high)))
+        return layout
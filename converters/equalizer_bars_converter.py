@@ -0,0 +1,84 @@
+import numpy as np
+import cv2
+from moviepy.video.VideoClip import VideoClip
+from .base_converter import BaseConverter
+import audio_analysis
+import compositor
+import tool
+import tracing
+from bar_renderer import BarStripRenderer, colormap_lut, render_frame, render_mask
+
+class EqualizerBarsConverter(BaseConverter):
+    """
+    Two equalizers of thin bars hanging from the top edge: the left channel in the top left corner
+    (low frequencies at the edge), the right channel mirrored in the top right corner.
+
+        visualization:
+          fps: 24
+          colormap: COLORMAP_JET
+          num_bars: 60                 # bars per channel, log-spaced from the lowest to the highest frequency
+          equalizer_width_percent: 10  # width of each equalizer, percent of the frame width
+          max_bar_height_percent: 90   # bar height at full level, percent of the frame height
+          opacity: 1.0
+    """
+
+    def convert(self, clip: VideoClip, metadata, index: int = 0):
+        if not clip:
+            self.log.error("No existing clips found. Cannot add equalizer bars without clips.")
+            raise ValueError("No existing clips found to add equalizer bars.")
+
+        visualization = self.config.get('visualization', {})
+        fps = visualization.get('fps', 24)
+        colormap = getattr(cv2, visualization.get('colormap', 'COLORMAP_JET'), cv2.COLORMAP_JET)
+        num_bars = visualization.get('num_bars', 60)
+        equalizer_width_percent = visualization.get('equalizer_width_percent', 10)
+        max_bar_height_percent = visualization.get('max_bar_height_percent', 90)
+        opacity = visualization.get('opacity', 1.0)
+
+        # Спектр читается из PCM store блоками (n_fft 4096 для лучшего разрешения по частоте),
+        # энергии столбиков кешируются вместе с анализом
+        audio_part = metadata["audio_parts"][index]
+        n_fft = 4096
+        band_layout = self.band_layout(audio_part.sample_rate, n_fft, num_bars)
+        analysis = audio_analysis.get_band_analysis(audio_part.audio_file, band_layout, fps, n_fft=n_fft, log=self.log)
+        # Нормализуем амплитуды по всему треку, чтобы уровни не прыгали между частями
+        max_amp = analysis.bands.max() or 1e-6
+        levels = analysis.slice(audio_part) / max_amp
+
+        size = clip.size
+        equalizer_width = int(size[0] * equalizer_width_percent / 100)
+        step = max(1, equalizer_width // num_bars)
+        # Один пиксель между столбиками
+        bar_width = max(1, step - 1)
+        max_bar_height = max(1, int(size[1] * max_bar_height_percent / 100))
+        offsets = np.arange(num_bars) * step
+        strip_width = int(offsets[-1] + bar_width)
+
+        lut = colormap_lut(colormap)
+        strips = [
+            # Левый канал: низкие частоты у левого края
+            BarStripRenderer((0, 0), offsets, bar_width, max_bar_height, levels[:, :, 0], lut, anchor="top", opacity=opacity),
+            # Правый канал зеркально: низкие частоты у правого края
+            BarStripRenderer((size[0] - strip_width, 0), strip_width - bar_width - offsets, bar_width, max_bar_height,
+                             levels[:, :, 1], lut, anchor="top", opacity=opacity),
+        ]
+        self.log.log(f"[grey]🎨 Colormap {tool.get_colormap_name(colormap)}, {num_bars} bars ↔{bar_width} ↕{max_bar_height} px per channel[/grey]")
+
+        def frame_index(t):
+            return int(t * fps)
+
+        # RGB, маска и регионы компоновщика одного кадра используют один рендер полос
+        bars_clip = VideoClip(tracing.traced("equalizer_bars.make_frame", cat="frame")(
+            lambda t: render_frame(size, strips, frame_index(t))), duration=clip.duration).set_fps(fps)
+        mask_clip = VideoClip(lambda t: render_mask(size, strips, frame_index(t)), ismask=True, duration=clip.duration).set_fps(fps)
+        bars_clip = bars_clip.set_mask(mask_clip)
+        compositor.set_regions(bars_clip, lambda t: [strip.render_region(frame_index(t)) for strip in strips])
+
+        return compositor.composite_clips([clip, bars_clip])
+
+    @staticmethod
+    def band_layout(sample_rate, n_fft, num_bars):
+        """Log-spaced bands (low, high) from the first FFT bin above 0 Hz to the Nyquist frequency."""
+        frequencies = audio_analysis.fft_frequencies(sample_rate, n_fft)
+        freq_bins = np.logspace(np.log10(frequencies[1]), np.log10(frequencies[-1]), num=num_bars + 1)
+        return list(zip(freq_bins[:-1], freq_bins[1:]))
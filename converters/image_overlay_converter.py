@@ -1,13 +1,20 @@
 from .base_converter import BaseConverter
-from moviepy.editor import ImageClip, CompositeVideoClip, VideoFileClip
-from moviepy.video.fx import all as vfx
 from rich.console import Console
 import os
 import tool
+import compositor
+import gif_cache
 
 console = Console()
 
 class ImageOverlayConverter(BaseConverter):
+    # 2: the overlay timing of looping GIFs changed (baked GIF frames)
+    stage_version = 2
+
+    def input_files(self):
+        image_path = self.config.get('image', {}).get('path')
+        return [image_path] if image_path else []
+
     def convert(self, clip, metadata, index: int):
         """
         Adds an image overlay to each video clip in the list.
@@ -48,8 +55,6 @@ class ImageOverlayConverter(BaseConverter):
             
         tool.inspect_clip("slideshow", slideshow, self.log)
 
-        has_mask = False
-        
         if duration is None:
             if start_time < 0:
                 duration = -start_time
@@ -64,36 +69,22 @@ class ImageOverlayConverter(BaseConverter):
         if position is None:
             position = ("left", "bottom")
         else:
-            def convert_position(value):
-                if isinstance(value, str):
-                    if value.endswith('pt'):
-                        return int(value.replace('pt', ''))
-                    elif value.endswith('%'):
-                        return float(value.replace('%', '')) / 100
-                    elif value == 'center':
-                        return 'center'
-                return value
-                
-            x_pos = convert_position(position['x'])
-            y_pos = convert_position(position['y'])
+            x_pos = tool.convert_position(position['x'], slideshow.w)
+            y_pos = tool.convert_position(position['y'], slideshow.h)
             position = (x_pos, y_pos)
         
+        # Кадры GIF декодируются, масштабируются и получают альфу один раз, затем берутся из кеша
+        gif = gif_cache.get_gif_frames(gif_file, resize * 0.5, log=self.log)
         gif_clip = (
-            VideoFileClip(gif_file, has_mask)
-            .loop(duration=duration)
-            .resize(resize * 0.5)
+            gif_cache.GifClip(gif, duration)
             .set_position(position)
             .set_start(start_time)
         )
-
-        tool.inspect_clip("gif_clip", gif_clip, self.log)   
+        tool.inspect_clip("gif_clip", gif_clip, self.log)
 
         self.log.log(f"GIF: Duration: {start_time:3.0f} -> {start_time + duration:3.0f} secs")
-        # gif_clip = gif_clip.mask_color(color=[0, 0, 0], thr=100, s=5)
-        gif_clip = gif_clip.fx(vfx.mask_color, color=[0, 0, 0], thr=100, s=5)
-        tool.inspect_clip("gif_clip", gif_clip, self.log)   
-        
-        final_video = CompositeVideoClip([slideshow, gif_clip])
+
+        final_video = compositor.composite_clips([slideshow, gif_clip])
         tool.inspect_clip("final_video", final_video, self.log)   
 
         return final_video
@@ -1,17 +1,31 @@
 import os
+import subprocess
 from .base_converter import BaseConverter
-from moviepy.editor import concatenate_videoclips, VideoFileClip
+from moviepy.config import get_setting
+from moviepy.video.compositing.concatenate import concatenate_videoclips
+from moviepy.video.io.VideoFileClip import VideoFileClip
 from rich.console import Console
-from moviepy.editor import VideoClip
+from moviepy.video.VideoClip import VideoClip
+import artifact_cache
+import frame_sink
+import tool
+import tracing
 
 console = Console()
 
 class JoinConverter(BaseConverter):
+    # Parts are rendered and encoded in convert, they may run in worker processes
+    renders_frames = True
+
     def process(self, clips, metadata):
         """
         Joins multiple video clips into a single video clip by first saving
         each clip as a temporary file using specified config settings, and then 
         concatenating them into one final clip.
+
+        With `mode: copy` (default) the parts are encoded with identical settings and a closed GOP
+        and concatenated by the ffmpeg concat demuxer with stream copy, without decoding them again.
+        `mode: compose` (or parts with different stream parameters) uses concatenate_videoclips.
         
         Parameters:
             clips (list): A list of VideoClip objects to be joined.
@@ -40,6 +54,9 @@ class JoinConverter(BaseConverter):
         self.fps = self.config.get("fps", 24)
         self.codec = self.config.get("codec", "libx264")
         self.preset = self.config.get("preset", "medium")
+        self.mode = self.config.get("mode", "copy")
+        self.container = self.config.get("container", ".mp4")
+        self.prefix = metadata.get("task_prefix", "")
         temp_files = []
 
         # Save each clip as a temporary file
@@ -47,6 +64,18 @@ class JoinConverter(BaseConverter):
 
         # Load temporary files and concatenate
         console.print(temp_files)
+        if self.mode == "copy":
+            joined_file = self.concat_stream_copy(temp_files, metadata)
+            if joined_file:
+                metadata["temp_files"] = temp_files + [joined_file, self.concat_list_path()]
+                metadata["joined_file"] = joined_file
+                joined_clip = VideoFileClip(joined_file)
+                # The export may copy the joined stream, as long as no converter changes its frames
+                metadata["joined_clip"] = joined_clip
+                console.print(f"[green]Successfully joined {len(temp_files)} clips without re-encoding, duration {joined_clip.duration} seconds.[/green]")
+                console.print(f"Joined clip size: ↔{joined_clip.w} ↕{joined_clip.h} ")
+                return [joined_clip]
+
         video_clips = [VideoFileClip(f) for f in temp_files]
         console.print(f"First clip size: ↔{video_clips[0].w} ↕{video_clips[0].h} ")
         joined_clip = concatenate_videoclips(video_clips, method="compose")
@@ -63,7 +92,22 @@ class JoinConverter(BaseConverter):
         return [joined_clip]
 
     def convert(self, clip: VideoClip, metadata, index):
-        temp_filename = os.path.join(self.directory, clip.filename)
+        temp_filename = os.path.join(self.directory, self.prefix + clip.filename)
+        ffmpeg_params = None
+        if self.mode == "copy":
+            # Identical container for all parts and a closed GOP: every part starts with an IDR
+            # frame and does not reference the previous one, so the streams can be cut together
+            temp_filename = os.path.splitext(temp_filename)[0] + self.container
+            ffmpeg_params = ["-flags", "+cgop"]
+
+        # A part with unchanged inputs is taken from the artifact store, parts written before a crash are kept there too
+        store = artifact_cache.get_store(self.directory) if metadata.get("stage_key") else None
+        part_key = artifact_cache.make_key(metadata.get("stage_key"), "part", index)
+        extension = os.path.splitext(temp_filename)[1]
+        if store is not None and store.restore(part_key, extension, temp_filename):
+            self.log.log(f"[green]♻️ Part [bold]{index + 1}[/bold] is unchanged, reusing it from the cache: {temp_filename}[/green]")
+            return temp_filename
+
         self.log.log(f"[yellow]Saving clip as temporary file: {temp_filename}. Clip duration: [bold]{clip.duration}[/bold] secs [/yellow]")
         self.log.log(f"[grey]🎥 Saving with parameters: fps=[bold]{self.fps}[/bold], codec=[bold]{self.codec}[/bold], preset=[bold]{self.preset}[/bold][/grey]")
         if clip.audio is None or clip.audio.duration is None:
@@ -71,14 +115,59 @@ class JoinConverter(BaseConverter):
         else:
             self.log.log(f"[grey]🎵 Audio duration: [bold]{clip.audio.duration}[/bold] seconds[/grey]")
         
-        clip.write_videofile(
-            temp_filename,
-            fps=self.fps,   
-            codec=self.codec,
-            preset=self.preset,
-            audio=False,
-            threads=1
-        )
+        # Every part encoder gets its share of the cores of the job
+        budget = metadata.get("resources")
+        threads = budget.ffmpeg_threads() if budget is not None else 1
+        artifact_cache.detach(temp_filename)
+        with tracing.span("write_videofile", cat="encode", part=index, file=os.path.basename(temp_filename)):
+            frame_sink.write_clip(
+                clip,
+                temp_filename,
+                fps=self.fps,
+                codec=self.codec,
+                preset=self.preset,
+                audio=False,
+                threads=threads,
+                ffmpeg_params=ffmpeg_params,
+                log=self.log
+            )
+        if store is not None:
+            store.put(part_key, extension, temp_filename)
         
         # clip.close()
-        return temp_filename
\ No newline at end of file
+        return temp_filename
+
+    def concat_list_path(self):
+        return os.path.join(self.directory, f"{self.prefix}joined_parts.txt")
+
+    def concat_stream_copy(self, temp_files, metadata):
+        """
+        Concatenates the encoded parts with the ffmpeg concat demuxer and stream copy.
+        :return: Path of the joined file, or None if the parts can not be joined without re-encoding.
+        """
+        streams = [tool.probe_video_stream(f) for f in temp_files]
+        if any(stream is None for stream in streams) or any(stream != streams[0] for stream in streams[1:]):
+            self.log.log("[yellow]⚠️ Parts have different video parameters, joining them with re-encoding[/yellow]")
+            for f, stream in zip(temp_files, streams):
+                self.log.log(f"[grey]{os.path.basename(f)}: {stream}[/grey]")
+            return None
+
+        list_path = self.concat_list_path()
+        with open(list_path, "w", encoding="utf-8") as f:
+            for temp_file in temp_files:
+                escaped = os.path.abspath(temp_file).replace("'", "'\\''")
+                f.write(f"file '{escaped}'\n")
+
+        joined_file = os.path.join(self.directory, f"{self.prefix}joined{self.container}")
+        cmd = [
+            get_setting("FFMPEG_BINARY"), "-v", "error", "-y",
+            "-f", "concat", "-safe", "0", "-i", list_path,
+            "-c", "copy", joined_file,
+        ]
+        self.log.log(f"[grey]🔗 Concatenating {len(temp_files)} parts with stream copy: [bold]{os.path.basename(joined_file)}[/bold][/grey]")
+        with tracing.span("concat_stream_copy", cat="encode", parts=len(temp_files)):
+            result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if result.returncode != 0:
+            self.log.log(f"[yellow]⚠️ Stream copy concat failed, joining with re-encoding: {result.stderr.decode(errors='replace')}[/yellow]")
+            return None
+        return joined_file
\ No newline at end of file
@@ -1,7 +1,12 @@
 import pprint
 import tool
+import compositor
+import slide_store
+from slideshow_clip import Slide, SlideshowClip
 from .base_converter import BaseConverter
-from moviepy.editor import ImageClip, CompositeVideoClip, concatenate_videoclips, VideoClip
+from moviepy.video.VideoClip import VideoClip
+from moviepy.video.fx.crop import crop
+from moviepy.video.fx.resize import resize
 from rich.console import Console
 from rich.table import Table
 import os
@@ -10,6 +15,15 @@ import time
 console = Console()
 
 class SlideshowCreatorConverter(BaseConverter):
+    IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.jfif', '.webp')
+
+    def input_files(self):
+        # Slides and covers
+        return [
+            os.path.join(self.directory, f) for f in sorted(os.listdir(self.directory))
+            if f.lower().endswith(self.IMAGE_EXTENSIONS)
+        ]
+
     def convert(self, clip: VideoClip, metadata, index: int):
         """
         Creates a slideshow from images in the directory and adds it to the clip.
@@ -40,10 +54,9 @@ class SlideshowCreatorConverter(BaseConverter):
         else:
             self.log.log(f"[cyan]⏱️ Using specified duration per image: {duration_per_image} seconds[/cyan]")
 
-        # Process images to generate clips
-        image_clips = self._process_images(image_files, duration_per_image, total_duration)
-
-        slideshow = concatenate_videoclips(image_clips, method="compose")
+        # Process images to generate the slideshow timeline
+        slideshow = self._process_images(image_files, duration_per_image, total_duration)
+        first_slide_size = slideshow.slides[0].size
         self.log.log("[bold blue]✅ Slideshow created successfully.[/bold blue]")
 
         if clip is None:
@@ -52,28 +65,28 @@ class SlideshowCreatorConverter(BaseConverter):
 
         self.log.log("[green]🛠️ Overlaying slideshow onto existing clip.[/green]")
 
-        # if width (image_clips[0].w) smaller tahn 720 display big error
-        if image_clips[0].w < 720:
+        # if width (first_slide_size[0]) smaller tahn 720 display big error
+        if first_slide_size[0] < 720:
             self.log.log("[red]❌ Image width is too small. Minimum width is 720 pixels.[/red]")
             raise ValueError("Image width is too small. Minimum width is 720 pixels.")
 
-        if clip.h != image_clips[0].h or clip.w != image_clips[0].w:
+        if clip.h != first_slide_size[1] or clip.w != first_slide_size[0]:
             original_clip_size = (clip.w, clip.h)
-            self.log.log(f"[yellow]🔄 First image size ↔{image_clips[0].w} ↕{image_clips[0].h} pixels[/yellow]")
-            if image_clips[0].w > clip.w:
-                clip = clip.resize(width=image_clips[0].w).crop(0, 0, width=image_clips[0].w, height=image_clips[0].h)
+            self.log.log(f"[yellow]🔄 First image size ↔{first_slide_size[0]} ↕{first_slide_size[1]} pixels[/yellow]")
+            if first_slide_size[0] > clip.w:
+                clip = clip.fx(resize, width=first_slide_size[0]).fx(crop, 0, 0, width=first_slide_size[0], height=first_slide_size[1])
             else:
-                clip = clip.resize(height=image_clips[0].h).crop(0, 0, width=image_clips[0].w, height=image_clips[0].h)
+                clip = clip.fx(resize, height=first_slide_size[1]).fx(crop, 0, 0, width=first_slide_size[0], height=first_slide_size[1])
             resized_clip_size = (clip.w, clip.h)
             self.log.log(f"[yellow]🔄 Resizing and cropping incoming clip from {original_clip_size} to {resized_clip_size} pixels[/yellow]")
 
-        updated_clip = CompositeVideoClip([clip, slideshow.set_duration(clip.duration)])
+        updated_clip = compositor.composite_clips([clip, slideshow.set_duration(clip.duration)])
         self.log.log("[bold blue]🎉 Slideshow added to existing clip successfully.[/bold blue]")
         return updated_clip
 
-    def _process_images(self, image_files, duration_per_image, total_duration):
+    def _process_images(self, image_files, duration_per_image, total_duration) -> SlideshowClip:
         """
-        Processes images and creates individual clips for each image, adding them to the provided list.
+        Processes images and creates a slide for each image, then the slideshow clip playing them.
         """
         
         transition_config = self.config.get('transition', {})
@@ -100,7 +113,11 @@ class SlideshowCreatorConverter(BaseConverter):
         table.add_column("Start Time", style="blue")
         table.add_column("Duration (s)", style="red")
 
-        image_clips = []
+        slides = []
+
+        # Every image is decoded and resized once, even if the slideshow cycles through it many times
+        store = slide_store.get_slide_store(self.directory, height, width, log=self.log)
+        store.prefetch(image_files)
 
         # Track when each image starts
         start_time = 0
@@ -112,10 +129,10 @@ class SlideshowCreatorConverter(BaseConverter):
                 if f.lower().endswith(('.png', '.jpg', '.jpeg', '.jfif', '.webp')) and f.lower().startswith(cover_name)
             ]                
             if len(cover_file) == 1:
-                result = self._process_image(cover_duration, total_duration, fade_in_duration, fade_out_duration, fade_in_first_image, height, width, table, start_time, index, cover_file[0])
+                result = self._process_image(cover_duration, total_duration, fade_in_duration, fade_out_duration, fade_in_first_image, height, width, table, start_time, index, cover_file[0], store)
                 index += 1            
                 start_time += cover_duration
-                image_clips.append(result)
+                slides.append(result)
             
         
         # Cycle through images repeatedly until the total duration is reached
@@ -125,55 +142,38 @@ class SlideshowCreatorConverter(BaseConverter):
                     break
 
                 result = self._process_image(duration_per_image, total_duration, fade_in_duration, fade_out_duration, 
-                                             fade_in_first_image, height, width, table, start_time, index, image_file)
+                                             fade_in_first_image, height, width, table, start_time, index, image_file, store)
                 index += 1            
                 start_time += duration_per_image
                 if result != None:
-                    image_clips.append(result)
+                    slides.append(result)
                 
         self.log.print(table)
-        return image_clips
+        return SlideshowClip(store, slides)
 
     def _process_image(self, duration_per_image, total_duration, fade_in_duration, fade_out_duration, fade_in_first_image, 
-                       height, width, table, start_time, index, image_file):
-        image_clip = ImageClip(image_file)
-        original_size = (image_clip.w, image_clip.h)
+                       height, width, table, start_time, index, image_file, store: slide_store.SlideStore):
+        original_size = store.original_size(image_file)
         result = None
 
-                # Сначала изменяем размер по высоте
-        if image_clip.h != height:
-            new_width = int(image_clip.w * (height / image_clip.h))
-            image_clip = image_clip.resize(height=height)
-                    
-                # Обрабатываем ширину
-        if width is not None and image_clip.w != width:
-            excess_width = image_clip.w - width
-            if excess_width > 0:
-                crop_left = excess_width // 2
-                image_clip = image_clip.crop(x1=crop_left, width=width)
-                self.log.log(f"[yellow]✂️ Cropping image {os.path.basename(image_file)} to width {width}[/yellow]")
-            else:
-                        # Добавляем черные полосы по бокам
-                from moviepy.editor import ColorClip
-                background = ColorClip(size=(width, height), color=(0,0,0))
-                background = background.set_duration(duration_per_image)
-                x_position = (width - image_clip.w) // 2
-                image_clip = CompositeVideoClip([background, image_clip.set_position((x_position, 0))])
-                self.log.log(f"[yellow]⬛ Adding black bars to image {os.path.basename(image_file)}[/yellow]")
+        # Resizing, cropping and black bars are baked into the slide by the store
+        resized_width = store.resized_size(original_size)[0]
+        if width is not None and resized_width > width:
+            self.log.log(f"[yellow]✂️ Cropping image {os.path.basename(image_file)} to width {width}[/yellow]")
+        elif width is not None and resized_width < width:
+            self.log.log(f"[yellow]⬛ Adding black bars to image {os.path.basename(image_file)}[/yellow]")
 
-        resized_size = (image_clip.w, image_clip.h)
+        resized_size = store.slide_size(original_size)
 
                 # Determine if the image fits within the total duration
         if start_time < total_duration:
                     # Image fits within the total duration
-            image_clip = image_clip.set_duration(duration_per_image)
             if index == 1 and not fade_in_first_image:
-                image_clip = image_clip.fadeout(fade_out_duration)
+                slide = Slide(image_file, duration_per_image, fade_out=fade_out_duration, size=resized_size)
             else:
-                image_clip = image_clip.fadein(fade_in_duration).fadeout(fade_out_duration)
+                slide = Slide(image_file, duration_per_image, fade_in_duration, fade_out_duration, size=resized_size)
             start_time_formatted = tool.transform_to_MMSS(start_time)
-            result = image_clip
-            # image_clips.append(image_clip)
+            result = slide
         else:
                     # Mark as not shown (optional if needed)
             start_time_formatted = "-"
@@ -1,7 +1,7 @@
 from .base_converter import BaseConverter
 from rich.console import Console
 import tool
-from moviepy.editor import VideoClip
+from moviepy.video.VideoClip import VideoClip
 from model import AudioPart
 
 console = Console()
@@ -31,7 +31,10 @@ class SplitConverter(BaseConverter):
                 subclip: VideoClip = clip.subclip(start_time, end_time)
                 self.log.log(f"[green]Subclip [bold]{i+1}[/bold] created with duration [{tool.transform_to_MMSS(subclip.duration)}] seconds. Period: [bold]{tool.transform_to_MMSS(start_time)} - {tool.transform_to_MMSS(end_time)}[/bold][/green]")
                 subclip.filename = f"subclip_{i+1}.avi"
-                metadata["audio_parts"].append(AudioPart(start_time, end_time, audio_parts.audio_file))
+                # Audio parts are positioned in the audio file, which may be cropped by AudioReaderConverter
+                audio_offset = audio_parts.start_time or 0
+                metadata["audio_parts"].append(AudioPart(audio_offset + start_time, audio_offset + end_time, audio_parts.audio_file,
+                                                         audio_parts.sample_rate, pcm=audio_parts.pcm))
                 split_clips.append(subclip)
 
         return split_clips
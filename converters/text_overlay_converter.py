@@ -1,11 +1,16 @@
 from .base_converter import BaseConverter
-from moviepy.editor import TextClip, CompositeVideoClip
+import compositor
+import text_raster
+import tool
 from rich.console import Console
 
 console = Console()
 
 class TextOverlayConverter(BaseConverter):
-    def convert(self, clip, metadata):
+    # 2: the text is rasterized with PIL/FreeType instead of ImageMagick
+    stage_version = 2
+
+    def convert(self, clip, metadata, index: int = 0):
         """
         Adds a text overlay to each video clip in the list.
         If no clips are provided, raises an error.
@@ -34,20 +39,24 @@ class TextOverlayConverter(BaseConverter):
         # Log all text properties to console
         console.print(f"[cyan]Text properties:[/cyan] Text: '{text}', Position: ({position['x']}, {position['y']}), Font: {font['name']}, Size: {font['size']}, Color: {font['color']}, Contour Color: {contour['color']}, Contour Size: {contour['size']}, Fade In: {fade_in_duration}s, Fade Out: {fade_out_duration}s")
 
-        text_clip = TextClip(
+        if text_raster.find_font(font['name']) is None:
+            self.log.warn(f"Font {font['name']} not found, the default font is used")
+
+        # Текст растеризуется один раз (PIL/FreeType), строки кешируются, fade меняет только альфу
+        raster = text_raster.render_text(
             text,
-            fontsize=font_size,
+            font['name'],
+            font_size,
             color=font['color'],
-            font=font['name'],
             stroke_color=contour['color'],
             stroke_width=contour['size']
-        ).set_position((position['x'], position['y'])) \
-        .set_end(end_time) \
-        .set_start(start_time) \
-        .fadein(fade_in_duration) \
-        .fadeout(fade_out_duration)
+        )
+        end_time = min(end_time, clip.duration)
+        text_clip = text_raster.TextRasterClip(raster, max(0, end_time - start_time), fade_in_duration, fade_out_duration) \
+            .set_position((tool.convert_position(position['x'], clip.w), tool.convert_position(position['y'], clip.h))) \
+            .set_start(start_time)
 
-        updated_clip = CompositeVideoClip([clip, text_clip])
+        updated_clip = compositor.composite_clips([clip, text_clip])
         updated_clip.filename = clip.filename
         self.log.log(f"[green]Adding text overlay to clip with duration {clip.duration} seconds.[/green]")
         return updated_clip
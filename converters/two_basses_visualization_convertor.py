@@ -5,7 +5,10 @@ from rich.console import Console
 from rich.table import Table
 import numpy as np
 import cv2
-import librosa
+import audio_analysis
+from dot_renderer import DotStampRenderer
+import compositor
+import tracing
 
 console = Console()
 
@@ -51,30 +54,20 @@ class TwoSpotsVisualizationConverter(BaseConverter):
                             colormap=colormap, debug_mode=False, fps=fps, metadata=metadata)        
         tool.inspect_clip("equalizer_clip", equalizer_clip, self.log)
 
-        # Делаем фон прозрачным (удаляем определенный цвет)
-        equalizer_clip = equalizer_clip.fx(vfx.mask_color, color=[0, 0, 0], thr=100, s=5) # thr=100, s=5
-        tool.inspect_clip("equalizer_clip", equalizer_clip, self.log)
-        # equalizer_clip = equalizer_clip.mask_color(color=[0, 0, 0], thr=100, s=5) # thr=100, s=5
-        equalizer_clip = equalizer_clip.set_opacity(0.2)  # Опционально: установить прозрачность
-        tool.inspect_clip("equalizer_clip", equalizer_clip, self.log)
-
-        composite_clip = CompositeVideoClip([clip, equalizer_clip])
+        composite_clip = compositor.composite_clips([clip, equalizer_clip])
         tool.inspect_clip("composite_clip", composite_clip, self.log)
 
         return composite_clip
     
-    # @retry(stop_max_attempt_number=5, wait_fixed=5000)
-    def load_audio(self, clip, audio_part, sample_rate):
-        # try:
-            return tool.load_audio_from_videoclip(clip, self.log, audio_part=audio_part, sample_rate=sample_rate)
-        # except Exception as e:
-        #     self.log.warn(f"[yellow]Error loading audio from {clip.filename} : {e}. Trying again...[/yellow]")
-        #     raise e
-        
     # all color maps : https://learnopencv.com/wp-content/uploads/2015/07/colormap_opencv_example.jpg
     def create_equalizer_clip(self, clip: VideoClip, fps, size, index, colormap=cv2.COLORMAP_JET,
-                            debug_mode=False, metadata=None):
-        
+                            debug_mode=False, metadata=None, opacity=0.2):
+        """
+        Creates the equalizer clip with its mask: the black background is transparent and the dots
+        are drawn with `opacity`. The mask is rendered from the same dots as the frame, the keying
+        of vfx.mask_color(color=[0, 0, 0], thr=100, s=5) is applied to the palette only.
+        """
+
         # circle_radius=300,
         # center_dot_size=15, edge_dot_size=5,
         # num_dots=10,
@@ -162,47 +155,18 @@ class TwoSpotsVisualizationConverter(BaseConverter):
             {'band': (255, 500), 'amplification': 1.0}, # yellow
             {'band': (500, 8000), 'amplification': 4.00}, # red
         ]
-        # Load audio file
-        # y, sr = librosa.load(audio_file, sr=None, mono=False)
-        sample_rate = self.config.get('audio', {}).get('sample_rate', 48000)
-
-        # try:
+        # Band energies of the whole track are computed once and shared by all split parts
         audio_part = metadata["audio_parts"][index]
-        y, sr = self.load_audio(clip, audio_part, sample_rate)
-        # except Exception as e:
-        #     self.log.warn(f"[yellow]Error loading audio from {clip.filename} : {e}. Trying to load from file...[/yellow]")
-        #     time.sleep(10)
-        #     try:    
-        #         y, sr = tool.load_audio_from_videoclip(clip, self.log, fps, metadata=metadata, sample_rate=sample_rate)
-        #     except Exception as e:
-        #         self.log.error(f"[red]Error loading audio from {clip.filename} : {e}[/red]")
-        #         return clip
+        # Частота дискретизации анализа, по умолчанию родная частота файла
+        sample_rate = (self.config.get('audio') or {}).get('sample_rate')
+        analysis = audio_analysis.get_band_analysis(
+            audio_part.audio_file, [band_info['band'] for band_info in frequency_bands], fps=fps, n_fft=2048, log=self.log,
+            sample_rate=sample_rate)
+        amplifications = np.array([band_info.get('amplification', 1.0) for band_info in frequency_bands], dtype=np.float32)
+        part_bands = analysis.slice(audio_part) * amplifications[None, :, None]
 
         self.log.log(f"[grey]🎨Used colormap: {tool.get_colormap_name(colormap)}[/grey]")        
 
-        # Ensure audio is stereo
-        if y.ndim == 1:
-            y = np.array([y, y])
-
-        # Parameters for audio processing
-        hop_length = int(sr / fps)
-        n_fft = 2048
-
-        # Get spectrograms for left and right channels
-        S_left = np.abs(librosa.stft(y[0], n_fft=n_fft, hop_length=hop_length))
-        S_right = np.abs(librosa.stft(y[1], n_fft=n_fft, hop_length=hop_length))
-
-        # Frequency scale
-        frequencies = librosa.fft_frequencies(sr=sr, n_fft=n_fft)
-
-        # Function to aggregate spectrogram over frequency bands
-        def aggregate_band_amplitude(S, band):
-            freq_mask = (frequencies >= band[0]) & (frequencies < band[1])
-            if np.any(freq_mask):
-                return np.mean(S[freq_mask, :], axis=0)
-            else:
-                return np.zeros(S.shape[1])
-
         # Extract amplitudes for each frequency band with amplification
         band_amplitudes_left = []
         band_amplitudes_right = []
@@ -220,11 +184,11 @@ class TwoSpotsVisualizationConverter(BaseConverter):
 
         band_data = []
 
-        for band_info in frequency_bands:
+        for i, band_info in enumerate(frequency_bands):
             band = band_info['band']
             amplification = band_info.get('amplification', 1.0)
-            amp_left = aggregate_band_amplitude(S_left, band) * amplification
-            amp_right = aggregate_band_amplitude(S_right, band) * amplification
+            amp_left = part_bands[:, i, 0]
+            amp_right = part_bands[:, i, 1]
             band_amplitudes_left.append(amp_left)
             band_amplitudes_right.append(amp_right)
             
@@ -269,8 +233,8 @@ class TwoSpotsVisualizationConverter(BaseConverter):
 
         self.log.print(table)
 
-        # Normalize amplitudes
-        max_amp = max([band.max() for band in band_amplitudes_left + band_amplitudes_right])
+        # Normalize amplitudes over the whole track, so that levels do not jump between parts
+        max_amp = (analysis.bands * amplifications[None, :, None]).max()
         if max_amp == 0:
             max_amp = 1e-6  # Avoid division by zero
         band_amplitudes_left = [band / max_amp for band in band_amplitudes_left]
@@ -289,30 +253,12 @@ class TwoSpotsVisualizationConverter(BaseConverter):
                                             np.arange(len(band)), band)
                                     for band in band_amplitudes_right]
 
-        # Compute dot positions within circle
-        def compute_dot_positions(center):
-            positions = []
-            for i in range(num_dots):
-                for j in range(num_dots):
-                    # Normalized positions between -1 and 1
-                    x_norm = -1 + 2 * i / (num_dots - 1)
-                    y_norm = -1 + 2 * j / (num_dots - 1)
-                    # Check if point is inside circle
-                    if x_norm**2 + y_norm**2 <= 1:
-                        x = center[0] + x_norm * circle_radius
-                        y = center[1] + y_norm * circle_radius
-                        positions.append((int(x), int(y), x_norm, y_norm))
-            return positions
-
         # Circle positions
         vertical_pos = size[1] * (circle_vertical_position_percent / 100)
 
         left_center = (int(size[0] * 0.1), int(vertical_pos))   # Left speaker
         right_center = (int(size[0] * 0.9), int(vertical_pos))  # Right speaker
 
-        left_positions = compute_dot_positions(left_center)
-        right_positions = compute_dot_positions(right_center)
-
         # Generate colors from colormap at specified positions
         colormap_colors = [cv2.applyColorMap(
             np.array([[int(pos * 255)]], dtype=np.uint8), colormap)[0][0]
@@ -320,8 +266,14 @@ class TwoSpotsVisualizationConverter(BaseConverter):
         # Convert BGR to RGB
         colormap_colors = [(int(c[2]), int(c[1]), int(c[0])) for c in colormap_colors]
 
-        # For debugging, we will store dot sizes
-        debug_info = []
+        # Dot positions, base sizes and disc stamps are computed once per clip
+        renderer = DotStampRenderer(size, [left_center, right_center],
+                                    [interpolated_bands_left, interpolated_bands_right],
+                                    colormap_colors, num_dots=num_dots, circle_radius=circle_radius,
+                                    center_dot_size=center_dot_size, edge_dot_size=edge_dot_size)
+        # Делаем фон прозрачным (удаляем черный цвет) и точки полупрозрачными
+        renderer.set_color_key(threshold=100, softness=5, opacity=opacity)
+        debug_frames = {}
 
         def make_frame(t):
             # Get the current frame index
@@ -329,74 +281,13 @@ class TwoSpotsVisualizationConverter(BaseConverter):
             if frame_idx >= num_frames:
                 frame_idx = num_frames - 1
 
-            # Create an empty frame
-            frame = np.zeros((size[1], size[0], 3), dtype=np.uint8)
-
-            # Clear debug_info for this frame
-            if debug_mode:
-                debug_info.clear()
-
-            # Function to draw dots
-            def draw_dots(positions, band_amplitudes, channel_name):
-                # For debugging information
-                frame_debug_info = []
-
-                for x, y, x_norm, y_norm in positions:
-                    # Calculate base dot size based on position
-                    distance = np.sqrt(x_norm**2 + y_norm**2)
-                    dot_size = edge_dot_size + (center_dot_size - edge_dot_size) * (1 - distance)
-
-                    # List to store current_dot_size for each band
-                    current_dot_sizes = []
-
-                    # Draw four mini-dots with different colors
-                    for idx, color in enumerate(colormap_colors):
-                        amp = band_amplitudes[idx][frame_idx]  # Amplitude from corresponding frequency band
-                        # Increase the range of size variation
-                        current_dot_size = dot_size * (0.0 + 2.0 * amp)  # Adjust size based on amplitude
-                        current_dot_size = max(1, int(current_dot_size))
-
-                        current_dot_sizes.append(current_dot_size // 2)
-
-                        offset = (idx - 1.5) * current_dot_size / 3  # Position mini-dots around the main point
-                        xi = int(x + offset)
-                        yi = int(y + offset)
-                        if 0 <= xi < size[0] and 0 <= yi < size[1]:
-                            cv2.circle(frame, (xi, yi), current_dot_size // 2, color, -1)
-
-                    # Save debugging information only for the Left channel
-                    if channel_name == 'Left' and debug_mode:
-                        frame_debug_info.append({
-                            'position': (x, y),
-                            'distance': distance,
-                            'dot_size': dot_size,
-                            'amplitudes': [band[frame_idx] for band in band_amplitudes],
-                            'current_dot_sizes': current_dot_sizes  # List of current_dot_size for each band
-                        })
-
-                if channel_name == 'Left' and debug_mode:
-                    debug_info.extend(frame_debug_info)
-
-            # Draw dots for Left channel
-            draw_dots(left_positions, interpolated_bands_left, 'Left')
-            # Draw dots for Right channel (can skip if only interested in Left)
-            draw_dots(right_positions, interpolated_bands_right, 'Right')
+            # Draw dots for Left and Right channels
+            frame = renderer.render(frame_idx)
 
             # If debug mode is on, display information
             if debug_mode:
-                # Sum current_dot_sizes over all points
-                num_points = len(debug_info)
-                total_current_dot_sizes = [0] * len(frequency_bands)
-
-                for point_info in debug_info:
-                    for idx, current_dot_size in enumerate(point_info['current_dot_sizes']):
-                        total_current_dot_sizes[idx] += current_dot_size
-
-                # Compute average current_dot_size for each band
-                if num_points > 0:
-                    avg_current_dot_sizes = [total_current_dot_sizes[idx] / num_points for idx in range(len(frequency_bands))]
-                else:
-                    avg_current_dot_sizes = [0] * len(frequency_bands)
+                # Average current_dot_size of the Left channel dots for each band
+                avg_current_dot_sizes = renderer.dot_radii(0, frame_idx).mean(axis=0)
 
                 # Display text information on the frame
                 debug_texts = []
@@ -435,6 +326,9 @@ class TwoSpotsVisualizationConverter(BaseConverter):
                     y_position = text_y + i * 30
                     cv2.putText(frame, text, (text_x, y_position), font,
                                 font_scale, color, thickness, cv2.LINE_AA)
+                # The debug text is not in the palette, its mask is keyed from the frame itself
+                debug_frames.clear()
+                debug_frames[frame_idx] = frame
 
             # Check amplitude threshold
             if all(band[frame_idx] < amplitude_threshold for band in interpolated_bands_left):
@@ -443,8 +337,23 @@ class TwoSpotsVisualizationConverter(BaseConverter):
 
             return frame
 
+        def make_mask(t):
+            frame_idx = min(int(t * fps), num_frames - 1)
+            if debug_mode:
+                frame = debug_frames.get(frame_idx)
+                if frame is None:
+                    frame = make_frame(t)
+                return renderer.color_key_alpha(frame, threshold=100, softness=5, opacity=opacity)
+            return renderer.render_mask(frame_idx)
+
         # Create video clip for the frame
-        equalizer_clip = VideoClip(make_frame, duration=duration).set_fps(fps)
+        equalizer_clip = VideoClip(tracing.traced("two_spots.make_frame", cat="frame")(make_frame), duration=duration).set_fps(fps)
+        mask_clip = VideoClip(make_mask, ismask=True, duration=duration).set_fps(fps)
+        equalizer_clip = equalizer_clip.set_mask(mask_clip)
+        if not debug_mode:
+            # The compositor blends only the boxes around the circles
+            compositor.set_regions(equalizer_clip, tracing.traced("two_spots.regions", cat="frame")(
+                lambda t: renderer.render_regions(min(int(t * fps), num_frames - 1))))
 
         # get_max_dot_sizes_per_band(debug_info, len(frequency_bands))
 
@@ -470,124 +379,3 @@ class TwoSpotsVisualizationConverter(BaseConverter):
             print(f"Максимальный размер точки для диапазона {idx+1}: {max_size}")
 
         return max_dot_sizes_per_band
-
-
-    def create_equalizer_clip_bars_upper(audio_file, duration, fps=24, size=(1280, 720),
-                            colormap=cv2.COLORMAP_JET, equalizer_width_percent=10,
-                            max_bar_height_percent=90, num_bars=60):
-        # Загружаем аудио файл
-        y, sr = librosa.load(audio_file, sr=None, mono=False)
-
-        # Убедимя, что аудио стерео
-        if y.ndim == 1:
-            y = np.array([y, y])
-
-        # Параметры для обработки аудио
-        hop_length = int(sr / fps)
-        n_fft = 4096  # Увеличиваем FFT для лучшего разрешения по частоте
-
-        # Получаем спектрограммы для лево��о и правого каналов
-        S_left = np.abs(librosa.stft(y[0], n_fft=n_fft, hop_length=hop_length))
-        S_right = np.abs(librosa.stft(y[1], n_fft=n_fft, hop_length=hop_length))
-
-        # Частотная шкала
-        frequencies = librosa.fft_frequencies(sr=sr, n_fft=n_fft)
-
-        # Определяем границы частот для каждого столбика (логарифмическая шкала)
-        freq_bins = np.logspace(np.log10(frequencies[1]), np.log10(frequencies[-1]), num=num_bars+1)
-
-        # Функция для агрегирования спектрограммы по частотным диапазонам
-        def aggregate_spectrum(S, freq_bins):
-            spectrum_bars = np.zeros((len(S[0]), num_bars))
-            for i in range(num_bars):
-                freq_mask = (frequencies >= freq_bins[i]) & (frequencies < freq_bins[i+1])
-                if np.any(freq_mask):
-                    spectrum_bars[:, i] = S[freq_mask, :].mean(axis=0)
-            return spectrum_bars
-
-        # Агрегируем спектры по частотным диапазонам
-        left_bars = aggregate_spectrum(S_left, freq_bins)
-        right_bars = aggregate_spectrum(S_right, freq_bins)
-
-        # Нормализуем амплитуды
-        max_amp = max(left_bars.max(), right_bars.max())
-        left_bars /= max_amp
-        right_bars /= max_amp
-
-        # Убеждаемся, что количество кадров соответствует длительности и fps
-        num_frames = int(duration * fps)
-        times = np.linspace(0, left_bars.shape[0]-1, num_frames).astype(int)
-        left_bars = left_bars[times, :]
-        right_bars = right_bars[times, :]
-
-        # Вычисляем параметры один раз перед циклом
-        equalizer_width = int(size[0] * (equalizer_width_percent / 100))  # Ширина каждого эквалайзера
-        bar_width = equalizer_width // num_bars  # Ширина одного столбика
-
-        # Мксимальная высота столбика в пикселях
-        max_bar_height = int(size[1] * (max_bar_height_percent / 100))
-
-        # Начальные позиции для левого и правого эквалайзеров
-        left_start_x = 0  # Левый эквалайзер прижат к левому краю
-        right_start_x = size[0] - equalizer_width  # Правый эквалайзер прижат к правому краю
-
-        def make_frame(t):
-            # Создаем пустой кадр RGB
-            frame = np.zeros((size[1], size[0], 3), dtype=np.uint8)
-            # Создаем маску (одноканальный кадр)
-            mask = np.zeros((size[1], size[0]), dtype=np.uint8)
-
-            frame_idx = int(t * fps)
-            if frame_idx >= num_frames:
-                frame_idx = num_frames - 1
-
-            # Рисуем столбики для левого канала (низкие частоты по краям)
-            for i in range(num_bars):
-                amplitude = left_bars[frame_idx, num_bars - i - 1]  # Инвертируем индекс для частот
-                bar_height = int(amplitude * max_bar_height)
-                x = left_start_x + i * bar_width
-                y = 0  # Начало от верхнего края
-                color_intensity = int(amplitude * 255)
-                color_bgr = cv2.applyColorMap(
-                    np.array([[color_intensity]], dtype=np.uint8), colormap)[0][0]
-                color_rgb = (int(color_bgr[2]), int(color_bgr[1]), int(color_bgr[0]))  # Конвертация BGR в RGB
-                # Рисуем столбик на кадре
-                cv2.rectangle(frame, (x, y), (x + bar_width - 2, y + bar_height), color_rgb, -1)
-                # Рисуем столбик на маске (белый цвет - непрозрачный)
-                cv2.rectangle(mask, (x, y), (x + bar_width - 2, y + bar_height), 255, -1)
-
-            # Рисуем столбики для правого канала (столбики идут от правого края к центру)
-            for i in range(num_bars):
-                amplitude = right_bars[frame_idx, i]
-                bar_height = int(amplitude * max_bar_height)
-                x = right_start_x + (num_bars - i - 1) * bar_width
-                y = 0
-                color_intensity = int(amplitude * 255)
-                color_bgr = cv2.applyColorMap(
-                    np.array([[color_intensity]], dtype=np.uint8), colormap)[0][0]
-                color_rgb = (int(color_bgr[2]), int(color_bgr[1]), int(color_bgr[0]))  # Конвертация BGR в RGB
-                # Рисуем столбик на кадре
-                cv2.rectangle(frame, (x, y), (x + bar_width - 2, y + bar_height), color_rgb, -1)
-                # Рисуем столбик на маске
-                cv2.rectangle(mask, (x, y), (x + bar_width - 2, y + bar_height), 255, -1)
-
-            return frame, mask / 255.0  # Возвращаем кадр и маску (маска должна быть от 0 до 1)
-
-        # Создаем VideoClip для кадра и маски
-        def make_frame_rgb(t):
-            frame, _ = make_frame(t)
-            return frame
-
-        def make_frame_mask(t):
-            _, mask = make_frame(t)
-            return mask
-
-        # Создаем видео клип для кадра
-        equalizer_clip = VideoClip(make_frame_rgb, duration=duration).set_fps(fps)
-        # Создаем маску
-        mask_clip = VideoClip(make_frame_mask, ismask=True, duration=duration).set_fps(fps)
-        # Устанавливаем маску для клипа
-        equalizer_clip = equalizer_clip.set_mask(mask_clip)
-
-        return equalizer_clip
-
@@ -1,15 +1,35 @@
 from .base_converter import BaseConverter
+from moviepy.config import get_setting
 from rich.console import Console
 import os
+import subprocess
 import time
+import artifact_cache
+import frame_sink
+import resources
+import tool
+import tracing
 
 console = Console()
 
+# Audio codecs a container takes as they are, other codecs are encoded once
+CONTAINER_AUDIO_CODECS = {
+    ".mp4": ("aac", "mp3", "alac", "ac3", "opus"),
+    ".m4v": ("aac", "mp3", "alac", "ac3"),
+    ".mov": ("aac", "mp3", "alac", "ac3", "pcm_s16le"),
+    ".mkv": None,  # any codec
+}
+
 class VideoExportConverter(BaseConverter):
     def convert(self, clip, metadata, index: int):
         """
         Exports the final video clip to a file.
         If no clip is provided, raises an error.
+
+        `mode: encode` (default) renders and encodes the clip. `mode: mux` copies the video stream
+        joined by JoinConverter (copy mode) and adds the audio file cropped to the AudioReaderConverter
+        times, without decoding the video; it falls back to encoding when a converter after the join
+        changes the frames. `mode: auto` muxes when possible without a warning.
         """
         if clip is None:
             raise ValueError("No clip provided for export.")
@@ -42,7 +62,34 @@ class VideoExportConverter(BaseConverter):
         # clip = CompositeVideoClip([clip, metadata['right'], metadata['left']])
 
         # Export the video clip
-        clip.write_videofile(output_path, fps=fps, codec=codec, preset=quality_preset, threads=4)
+        # Keep the sample rate of the audio, resampling by moviepy is nearest-sample only
+        audio_fps = getattr(clip.audio, "fps", None) or 44100
+        stage_key = metadata.get("stage_key")
+        store = artifact_cache.get_store(self.directory) if stage_key else None
+        mode = self.config.get('mode', 'encode')
+        can_mux = mode in ('mux', 'auto') and self.can_mux(clip, metadata)
+        if mode == 'mux' and not can_mux:
+            self.log.warn("Mux export needs the joined stream of JoinConverter (copy mode) with no converter changing the frames after it, encoding the clip")
+        if store is not None and store.restore(stage_key, ".mp4", output_path):
+            self.log.log(f"[green]♻️ Video is unchanged, reusing the exported file from the cache: {output_path}[/green]")
+        elif can_mux:
+            artifact_cache.detach(output_path)
+            with tracing.span("mux", cat="encode", file=os.path.basename(output_path)):
+                self.mux(metadata, output_path)
+            if store is not None:
+                store.put(stage_key, ".mp4", output_path)
+        else:
+            # A single encoder, it gets all cores of the job
+            budget = metadata.get("resources")
+            threads = 4
+            if budget is not None:
+                threads = budget.enter(resources.PHASE_EXPORT).ffmpeg_threads()
+                self.log.log(f"[grey]⚙️ {budget.describe()}[/grey]")
+            artifact_cache.detach(output_path)
+            with tracing.span("write_videofile", cat="encode", file=os.path.basename(output_path)):
+                frame_sink.write_clip(clip, output_path, fps=fps, codec=codec, preset=quality_preset, threads=threads, audio_fps=audio_fps, log=self.log)
+            if store is not None:
+                store.put(stage_key, ".mp4", output_path)
 
         temp_files = metadata.get("temp_files", [])
         for file in temp_files:
@@ -52,3 +99,51 @@ class VideoExportConverter(BaseConverter):
 
         clip.close()
         return clip
+
+    def can_mux(self, clip, metadata):
+        """True if the frames of the clip are those of the joined file, only the audio was attached after the join."""
+        joined_clip = metadata.get("joined_clip")
+        joined_file = metadata.get("joined_file")
+        return (
+            joined_clip is not None and joined_file is not None and os.path.exists(joined_file)
+            and clip.make_frame is joined_clip.make_frame
+            and clip.mask is None
+            and tuple(clip.size) == tuple(joined_clip.size)
+        )
+
+    def mux(self, metadata, output_path):
+        """
+        Writes the output with stream copy of the joined video. The audio file is cropped at the
+        container level and copied when the container takes its codec, otherwise encoded once.
+        """
+        joined_file = metadata["joined_file"]
+        audio_file = metadata.get("audio_file")
+        cmd = [get_setting("FFMPEG_BINARY"), "-v", "error", "-y", "-i", joined_file]
+        maps = ["-map", "0:v:0"]
+        audio_args = []
+        if audio_file:
+            audio_parts = metadata.get("audio_parts") or []
+            start_time = audio_parts[0].start_time if audio_parts else 0
+            end_time = audio_parts[0].end_time if audio_parts else None
+            if start_time:
+                cmd.extend(["-ss", str(start_time)])
+            if end_time is not None:
+                cmd.extend(["-to", str(end_time)])
+            cmd.extend(["-i", audio_file])
+            maps.extend(["-map", "1:a:0"])
+
+            audio_codec = tool.probe_audio_codec(audio_file)
+            extension = os.path.splitext(output_path)[1].lower()
+            codecs = CONTAINER_AUDIO_CODECS.get(extension, ())
+            if codecs is None or audio_codec in codecs:
+                audio_args = ["-c:a", "copy"]
+            else:
+                quality = self.config.get('quality', {})
+                audio_args = ["-c:a", quality.get('audio_codec', 'aac'), "-b:a", quality.get('audio_bitrate', '192k')]
+            self.log.log(f"[grey]🎵 Audio {os.path.basename(audio_file)} ({audio_codec}): {' '.join(audio_args[1:])}[/grey]")
+        cmd.extend(maps + ["-c:v", "copy"] + audio_args + ["-shortest", output_path])
+
+        self.log.log(f"[green]📦 Muxing {os.path.basename(joined_file)} without re-encoding the video: {output_path}[/green]")
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if result.returncode != 0:
+            raise RuntimeError(f"ffmpeg failed to mux {output_path}: {result.stderr.decode(errors='replace')}")
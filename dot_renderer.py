@@ -0,0 +1,235 @@
+import cv2
+import numpy as np
+
+
+class DotStampRenderer:
+    """
+    Renders the frames of the two spots equalizer by stamping precomputed discs.
+
+    Everything that does not depend on the audio (dot positions, base dot sizes and the
+    disc stamp for every possible radius) is computed once per clip, so a frame costs a few
+    vectorized NumPy operations instead of thousands of cv2.circle calls.
+    The stamps are rasterized with cv2.circle itself, so frames match it pixel for pixel.
+    """
+
+    def __init__(self, size, centers, band_amplitudes, colors, num_dots, circle_radius,
+                 center_dot_size, edge_dot_size):
+        """
+        :param size: Frame size (width, height).
+        :param centers: Circle center (x, y) for every channel, in drawing order.
+        :param band_amplitudes: Array (channels, bands, frames) of amplitudes in [0, 1].
+        :param colors: RGB color of every band.
+        :param num_dots: Number of dots along the circle diameter.
+        :param circle_radius: Radius of the circle in pixels.
+        :param center_dot_size: Size of the dot in the center of the circle.
+        :param edge_dot_size: Size of the dots on the circle edge.
+        """
+        self.size = size
+        self.band_amplitudes = np.clip(np.asarray(band_amplitudes, dtype=np.float64), 0, 1)
+        self.num_frames = self.band_amplitudes.shape[2]
+        self.num_bands = len(colors)
+
+        # Palette index 0 is the background, band `b` is drawn with index `b + 1`
+        self.palette = np.zeros((self.num_bands + 1, 3), dtype=np.uint8)
+        self.palette[1:] = colors
+        self.band_indices = np.arange(self.num_bands, dtype=np.uint8) + 1
+        # Mini-dots of the bands are shifted around the main point
+        self.band_offsets = np.arange(self.num_bands) - 1.5
+
+        self.positions = []
+        self.dot_sizes = []
+        for center in centers:
+            x, y, x_norm, y_norm = self._compute_dot_positions(center, num_dots, circle_radius)
+            distance = np.sqrt(x_norm**2 + y_norm**2)
+            self.positions.append((x, y))
+            self.dot_sizes.append(edge_dot_size + (center_dot_size - edge_dot_size) * (1 - distance))
+
+        # A dot is at most twice its base size (amplitude 1.0)
+        max_dot_size = max(1, int(max(center_dot_size, edge_dot_size) * 2.0))
+        self._build_stamp_atlas(max_dot_size // 2)
+        self._build_buffers(max_dot_size // 2 + 1)
+
+        # Opacity of every palette entry, fully opaque dots by default
+        self.palette_alpha = np.ones(self.num_bands + 1, dtype=np.float32)
+        self.palette_alpha[0] = 0
+        # The RGB frame and the mask of the same frame share one rendering
+        self._last_rendered = (None, None)
+
+    @staticmethod
+    def _compute_dot_positions(center, num_dots, circle_radius):
+        positions = []
+        for i in range(num_dots):
+            for j in range(num_dots):
+                # Normalized positions between -1 and 1
+                x_norm = -1 + 2 * i / (num_dots - 1)
+                y_norm = -1 + 2 * j / (num_dots - 1)
+                # Check if point is inside circle
+                if x_norm**2 + y_norm**2 <= 1:
+                    x = center[0] + x_norm * circle_radius
+                    y = center[1] + y_norm * circle_radius
+                    positions.append((int(x), int(y), x_norm, y_norm))
+        x, y, x_norm, y_norm = zip(*positions)
+        return (np.array(x, dtype=np.int64), np.array(y, dtype=np.int64),
+                np.array(x_norm), np.array(y_norm))
+
+    def _build_stamp_atlas(self, max_radius):
+        """
+        Rasterizes a filled disc for every radius up to `max_radius` with cv2.circle and
+        stores the pixel offsets of all of them one after another in a flat atlas.
+        """
+        stamps_dy, stamps_dx = [], []
+        for radius in range(max_radius + 1):
+            canvas = np.zeros((2 * radius + 3, 2 * radius + 3), dtype=np.uint8)
+            cv2.circle(canvas, (radius + 1, radius + 1), radius, 1, -1)
+            dy, dx = np.nonzero(canvas)
+            stamps_dy.append(dy - (radius + 1))
+            stamps_dx.append(dx - (radius + 1))
+
+        self.max_radius = max_radius
+        self.stamp_lengths = np.array([len(dy) for dy in stamps_dy], dtype=np.int64)
+        self.stamp_starts = np.cumsum(self.stamp_lengths) - self.stamp_lengths
+        self.atlas_dy = np.concatenate(stamps_dy).astype(np.int64)
+        self.atlas_dx = np.concatenate(stamps_dx).astype(np.int64)
+
+    def _build_buffers(self, max_offset):
+        """
+        Every circle is stamped into its own buffer, large enough that no stamp ever needs clipping:
+        dot centers are kept inside the frame and a stamp reaches at most `max_radius` around them.
+        Circles whose buffers overlap (narrow frames) share one buffer to keep the drawing order.
+        """
+        width, height = self.size
+        boxes = []
+        for channel, (x, y) in enumerate(self.positions):
+            box = [max(0, x.min() - max_offset) - self.max_radius,
+                   max(0, y.min() - max_offset) - self.max_radius,
+                   min(width - 1, x.max() + max_offset) + self.max_radius + 1,
+                   min(height - 1, y.max() + max_offset) + self.max_radius + 1]
+            for merged in boxes:
+                merged_box = merged[0]
+                if (box[0] < merged_box[2] and merged_box[0] < box[2]
+                        and box[1] < merged_box[3] and merged_box[1] < box[3]):
+                    merged[0] = [min(box[0], merged_box[0]), min(box[1], merged_box[1]),
+                                 max(box[2], merged_box[2]), max(box[3], merged_box[3])]
+                    merged[1].append(channel)
+                    break
+            else:
+                boxes.append([box, [channel]])
+
+        self.buffers = []
+        for (x0, y0, x1, y1), channels in boxes:
+            buffer_width = int(x1 - x0)
+            self.buffers.append({
+                "origin": (int(x0), int(y0)),
+                "shape": (int(y1 - y0), buffer_width),
+                "channels": channels,
+                # Atlas offsets flattened for the width of this buffer
+                "atlas": self.atlas_dy * buffer_width + self.atlas_dx,
+                # Part of the buffer which is inside the frame
+                "crop": (slice(int(max(0, -y0)), int(min(y1, height) - y0)),
+                         slice(int(max(0, -x0)), int(min(x1, width) - x0))),
+            })
+
+    def _clamp(self, frame_idx):
+        return min(frame_idx, self.num_frames - 1)
+
+    def dot_sizes_at(self, channel, frame_idx):
+        """Size in pixels of every mini-dot (positions x bands) of a channel."""
+        amplitudes = self.band_amplitudes[channel, :, self._clamp(frame_idx)]
+        # Increase the range of size variation
+        dot_sizes = self.dot_sizes[channel][:, None] * (0.0 + 2.0 * amplitudes[None, :])
+        return np.maximum(1, dot_sizes.astype(np.int64))
+
+    def dot_radii(self, channel, frame_idx):
+        """Radius of every mini-dot (positions x bands) of a channel."""
+        return self.dot_sizes_at(channel, frame_idx) // 2
+
+    def _stamp_channel(self, indexed, buffer, channel, frame_idx):
+        """Stamps the dots of a channel into the palette indexed buffer, in drawing order."""
+        width, height = self.size
+        origin_x, origin_y = buffer["origin"]
+        x, y = self.positions[channel]
+        dot_sizes = self.dot_sizes_at(channel, frame_idx)
+
+        # Position mini-dots around the main point
+        offsets = self.band_offsets[None, :] * dot_sizes / 3
+        xi = (x[:, None] + offsets).astype(np.int64)
+        yi = (y[:, None] + offsets).astype(np.int64)
+        # cv2.circle was only called for dots whose center is inside the frame
+        visible = (xi >= 0) & (xi < width) & (yi >= 0) & (yi < height)
+        radii = (dot_sizes // 2)[visible]
+        if len(radii) == 0:
+            return
+        centers = (yi[visible] - origin_y) * buffer["shape"][1] + (xi[visible] - origin_x)
+        bands = np.broadcast_to(self.band_indices, dot_sizes.shape)[visible]
+
+        # Gather the stamp of every dot from the atlas, one dot after another
+        lengths = self.stamp_lengths[radii]
+        first = np.cumsum(lengths) - lengths
+        atlas_idx = np.arange(first[-1] + lengths[-1]) + np.repeat(self.stamp_starts[radii] - first, lengths)
+        pixels = np.take(buffer["atlas"], atlas_idx) + np.repeat(centers, lengths)
+        # np.put writes sequentially, so the dot drawn last wins, as with cv2.circle calls
+        np.put(indexed, pixels, np.repeat(bands, lengths))
+
+    @staticmethod
+    def color_key_alpha(colors, threshold=100, softness=5, opacity=1.0):
+        """
+        Opacity of colors keyed against black, as vfx.mask_color(color=[0, 0, 0], thr, s) followed by
+        set_opacity(opacity) computes it for every pixel: d**s / (thr**s + d**s), d is the distance to black.
+        :param colors: Array (..., 3) of RGB colors.
+        :return: Float32 array (...) of opacities in [0, 1].
+        """
+        distance = np.sqrt((np.asarray(colors, dtype=np.float64) ** 2).sum(axis=-1))
+        if threshold:
+            alpha = distance**softness / (threshold**softness + distance**softness)
+        else:
+            alpha = 1.0 * (distance != 0)
+        return (opacity * alpha).astype(np.float32)
+
+    def set_color_key(self, threshold=100, softness=5, opacity=1.0):
+        """Makes the background transparent and the dots translucent, like vfx.mask_color with set_opacity."""
+        self.palette_alpha = self.color_key_alpha(self.palette, threshold, softness, opacity)
+
+    def render_indexed(self, frame_idx):
+        """
+        Renders the dots as palette indices, only around the circles.
+        :return: List of non-overlapping regions (x, y, indexed), `indexed` is a uint8 array of palette indices.
+        """
+        last_idx, last_regions = self._last_rendered
+        if last_idx == frame_idx:
+            return last_regions
+
+        regions = []
+        for buffer in self.buffers:
+            indexed = np.zeros(buffer["shape"], dtype=np.uint8)
+            for channel in buffer["channels"]:
+                self._stamp_channel(indexed, buffer, channel, frame_idx)
+            rows, cols = buffer["crop"]
+            regions.append((buffer["origin"][0] + cols.start, buffer["origin"][1] + rows.start,
+                            indexed[rows, cols]))
+        self._last_rendered = (frame_idx, regions)
+        return regions
+
+    def render(self, frame_idx):
+        """Renders a full RGB frame with the dots on a black background."""
+        width, height = self.size
+        frame = np.zeros((height, width, 3), dtype=np.uint8)
+        for x, y, indexed in self.render_indexed(frame_idx):
+            frame[y:y + indexed.shape[0], x:x + indexed.shape[1]] = np.take(self.palette, indexed, axis=0)
+        return frame
+
+    def render_mask(self, frame_idx):
+        """Renders the float mask of the frame from the palette opacities, without keying the RGB frame."""
+        width, height = self.size
+        mask = np.zeros((height, width), dtype=np.float32)
+        for x, y, indexed in self.render_indexed(frame_idx):
+            mask[y:y + indexed.shape[0], x:x + indexed.shape[1]] = np.take(self.palette_alpha, indexed)
+        return mask
+
+    def render_regions(self, frame_idx):
+        """
+        Renders only the regions around the circles, for compositor.set_regions.
+        :return: List of regions (x, y, rgb, alpha), `alpha` is the uint8 opacity of every pixel.
+        """
+        alpha_lut = (self.palette_alpha * 255 + 0.5).astype(np.uint8)
+        return [(x, y, np.take(self.palette, indexed, axis=0), np.take(alpha_lut, indexed))
+                for x, y, indexed in self.render_indexed(frame_idx)]
@@ -0,0 +1,168 @@
+"""
+Raw frame sink to ffmpeg, the encoder of JoinConverter and VideoExportConverter.
+
+moviepy's write_videofile converts every frame with astype, copies it with tobytes and writes it
+to ffmpeg. The sink writes frames that already are contiguous uint8 RGB (what the compositor and
+the renderers produce) without any copy, converts the other ones into a small pool of preallocated
+buffers, and writes from a background thread, so the next frame is rendered while the previous one
+goes through the pipe. The ffmpeg command line is the one of moviepy, the output files are identical.
+"""
+import os
+import queue
+import subprocess
+import threading
+import numpy as np
+from moviepy.config import get_setting
+from moviepy.tools import find_extension
+import tracing
+
+# Buffers of converted frames in flight between the renderer and the writer thread
+POOL_SIZE = 3
+F_SETPIPE_SZ = 1031
+
+class FrameSink:
+    """ffmpeg rawvideo encoder fed from the renderer thread by a writer thread."""
+
+    def __init__(self, filename, size, fps, codec="libx264", preset="medium", audiofile=None,
+                 threads=None, ffmpeg_params=None, bitrate=None, pool_size=POOL_SIZE):
+        """
+        :param filename: Output file.
+        :param size: Frame size (width, height).
+        :param audiofile: Audio file muxed with stream copy, as moviepy does it.
+        :param pool_size: Number of conversion buffers, also the number of frames queued for the writer.
+        """
+        self.filename = filename
+        self.size = (int(size[0]), int(size[1]))
+        self.shape = (self.size[1], self.size[0], 3)
+
+        # Same arguments and order as moviepy's FFMPEG_VideoWriter
+        cmd = [
+            get_setting("FFMPEG_BINARY"), '-y', '-loglevel', 'error',
+            '-f', 'rawvideo', '-vcodec', 'rawvideo',
+            '-s', '%dx%d' % self.size, '-pix_fmt', 'rgb24', '-r', '%.02f' % fps,
+            '-an', '-i', '-',
+        ]
+        if audiofile is not None:
+            cmd.extend(['-i', audiofile, '-acodec', 'copy'])
+        cmd.extend(['-vcodec', codec, '-preset', preset])
+        if ffmpeg_params is not None:
+            cmd.extend(ffmpeg_params)
+        if bitrate is not None:
+            cmd.extend(['-b', bitrate])
+        if threads is not None:
+            cmd.extend(['-threads', str(threads)])
+        if codec == 'libx264' and self.size[0] % 2 == 0 and self.size[1] % 2 == 0:
+            cmd.extend(['-pix_fmt', 'yuv420p'])
+        cmd.append(filename)
+
+        popen_params = {"stdout": subprocess.DEVNULL, "stderr": subprocess.PIPE, "stdin": subprocess.PIPE, "bufsize": 0}
+        if os.name == "nt":
+            popen_params["creationflags"] = 0x08000000  # CREATE_NO_WINDOW
+        self.proc = subprocess.Popen(cmd, **popen_params)
+        self._enlarge_pipe()
+
+        self._free = queue.Queue()
+        for _ in range(max(1, pool_size)):
+            self._free.put(np.empty(self.shape, dtype=np.uint8))
+        self._pending = queue.Queue(maxsize=max(1, pool_size))
+        self._error = None
+        self._writer = threading.Thread(target=self._write_loop, name="frame-sink", daemon=True)
+        self._writer.start()
+
+    def _enlarge_pipe(self):
+        # Один кадр целиком помещается в канал, ffmpeg и рендер меньше ждут друг друга (Linux only)
+        try:
+            import fcntl
+            with open("/proc/sys/fs/pipe-max-size") as f:
+                max_size = int(f.read())
+            fcntl.fcntl(self.proc.stdin.fileno(), F_SETPIPE_SZ, min(max_size, int(np.prod(self.shape))))
+        except (ImportError, OSError, ValueError):
+            pass
+
+    def _write_loop(self):
+        while True:
+            item = self._pending.get()
+            if item is None:
+                return
+            frame, pooled = item
+            try:
+                if self._error is None:
+                    view = memoryview(frame).cast("B")
+                    while view:
+                        written = self.proc.stdin.write(view)
+                        view = view[written:]
+            except OSError as e:
+                self._error = e
+            finally:
+                if pooled:
+                    self._free.put(frame)
+
+    def write_frame(self, frame):
+        """Queues a frame. Contiguous uint8 RGB frames are written as they are and must not be modified afterwards."""
+        if self._error is not None:
+            self._raise()
+        frame = np.asarray(frame)
+        if frame.dtype == np.uint8 and frame.shape == self.shape and frame.flags.c_contiguous:
+            self._pending.put((frame, False))
+            return
+        buffer = self._free.get()
+        # Same conversion as iter_frames(dtype="uint8"), without allocating
+        np.copyto(buffer, frame[:, :, :3] if frame.ndim == 3 else frame[:, :, None], casting="unsafe")
+        self._pending.put((buffer, True))
+
+    def close(self):
+        self._pending.put(None)
+        self._writer.join()
+        if self.proc.stdin:
+            try:
+                self.proc.stdin.close()
+            except OSError as e:
+                self._error = self._error or e
+        stderr = self.proc.stderr.read() if self.proc.stderr else b""
+        returncode = self.proc.wait()
+        if self._error is not None or returncode != 0:
+            self._raise(stderr)
+
+    def _raise(self, stderr=None):
+        if stderr is None:
+            self.proc.kill()
+            stderr = self.proc.stderr.read() if self.proc.stderr else b""
+        raise IOError(f"ffmpeg failed while writing {self.filename}: {self._error or ''}\n{stderr.decode(errors='replace')}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            # The render failed, the partial output is not waited for
+            self.proc.kill()
+            self._pending.put(None)
+            self._writer.join()
+            self.proc.wait()
+
+
+def write_clip(clip, filename, fps, codec="libx264", preset="medium", threads=None, ffmpeg_params=None,
+               bitrate=None, audio=True, audio_fps=44100, audio_codec="libmp3lame", log=None):
+    """
+    Encodes a clip as write_videofile does: the audio first into a temporary file next to the output,
+    then the frames at `fps` through a FrameSink.
+    """
+    audiofile = None
+    if audio and clip.audio is not None:
+        name = os.path.splitext(os.path.basename(filename))[0]
+        audiofile = os.path.join(os.path.dirname(filename), f"{name}TEMP_MPY_wvf_snd.{find_extension(audio_codec)}")
+        with tracing.span("write_audiofile", cat="encode", file=os.path.basename(filename)):
+            clip.audio.write_audiofile(audiofile, audio_fps, 4, 2000, audio_codec, logger=None)
+
+    if log:
+        log.log(f"[grey]🎞️ Encoding [bold]{os.path.basename(filename)}[/bold] ↔{clip.w} ↕{clip.h}, {fps} fps, {codec} {preset}, {threads or 'auto'} threads[/grey]")
+    try:
+        with FrameSink(filename, clip.size, fps, codec=codec, preset=preset, audiofile=audiofile,
+                       threads=threads, ffmpeg_params=ffmpeg_params, bitrate=bitrate) as sink:
+            for t in np.arange(0, clip.duration, 1.0 / fps):
+                sink.write_frame(clip.get_frame(t))
+    finally:
+        if audiofile is not None and os.path.exists(audiofile):
+            os.remove(audiofile)
@@ -0,0 +1,175 @@
+import bisect
+import json
+import os
+import threading
+import cv2
+import numpy as np
+from moviepy.video.VideoClip import VideoClip
+from PIL import Image
+import compositor
+import tool
+from artifact_cache import make_key
+
+# Bump when the baking changes, so that old baked GIFs are not reused
+GIF_CACHE_VERSION = 2
+
+# Frames with a shorter delay are shown for DEFAULT_DELAY_MS, as ffmpeg (and browsers) do
+MIN_DELAY_MS = 20
+DEFAULT_DELAY_MS = 100
+
+class GifFrames:
+    """
+    Frames of an animated image, decoded, resized and chroma-keyed once.
+
+    The baked frames are one RGBA array (frames, height, width, 4): RGB resized by `scale` as
+    moviepy's resize does it with cv2, alpha computed as moviepy's mask_color(color, thr, s) and
+    rounded to uint8 as the compositor would. They are persisted as .npy in the `.cache/gifs`
+    directory next to the image, keyed by its path, modification time and the baking parameters,
+    and memory-mapped on the next runs, so every part and every clip directory shares them.
+    """
+
+    def __init__(self, path, scale=1.0, color=(0, 0, 0), thr=100, s=5, log=None):
+        self.path = os.path.abspath(path)
+        self.scale = scale
+        self.color = tuple(color)
+        self.thr = thr
+        self.s = s
+        self.log = log
+        self._init_runtime()
+
+    def _init_runtime(self):
+        self._frames = None
+        self._info = None
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # Worker processes map the baked file again
+        state = self.__dict__.copy()
+        for name in ("_frames", "_info", "_lock", "log"):
+            state.pop(name, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.log = None
+        self._init_runtime()
+
+    def key(self):
+        mtime = os.stat(self.path).st_mtime_ns
+        return make_key("gif", GIF_CACHE_VERSION, self.path, mtime, self.scale, self.color, self.thr, self.s)
+
+    def baked_path(self):
+        cache_dir = tool.get_cache_dir(os.path.dirname(self.path), "gifs")
+        return os.path.join(cache_dir, f"{self.key()[:16]}.npy")
+
+    @property
+    def frames(self) -> np.ndarray:
+        """Read-only RGBA frames (frames, height, width, 4)."""
+        self._load()
+        return self._frames
+
+    @property
+    def durations(self):
+        """Duration in seconds of every frame."""
+        self._load()
+        return self._info["durations"]
+
+    @property
+    def size(self):
+        return self.frames.shape[2], self.frames.shape[1]
+
+    def _load(self):
+        with self._lock:
+            if self._frames is not None:
+                return
+            path = self.baked_path()
+            info_path = f"{os.path.splitext(path)[0]}.json"
+            # The info is written last, a baked file without it is incomplete
+            if os.path.exists(info_path) and os.path.exists(path):
+                with open(info_path, encoding="utf-8") as f:
+                    self._info = json.load(f)
+                self._frames = np.load(path, mmap_mode="r")
+                return
+
+            frames, durations = self.bake()
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                np.save(f, frames)
+            os.replace(tmp_path, path)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"durations": durations}, f)
+            os.replace(tmp_path, info_path)
+            if self.log:
+                self.log.log(f"[grey]🎞️ Baked GIF [bold]{os.path.basename(self.path)}[/bold] {len(frames)} frames ↔{frames.shape[2]} ↕{frames.shape[1]}[/grey]")
+            frames.flags.writeable = False
+            self._frames, self._info = frames, {"durations": durations}
+
+    def bake(self):
+        """Decodes every frame and builds the RGBA array. :return: (frames, durations in seconds)."""
+        frames = []
+        durations = []
+        with Image.open(self.path) as image:
+            w, h = image.size
+            # Same size and interpolation as moviepy's resize with cv2
+            new_size = (int(w * self.scale), int(h * self.scale))
+            interpolation = cv2.INTER_LINEAR if new_size[0] > w or new_size[1] > h else cv2.INTER_AREA
+            color = np.array(self.color)
+            for index in range(getattr(image, "n_frames", 1)):
+                image.seek(index)
+                delay = image.info.get("duration") or 0
+                durations.append((delay if delay >= MIN_DELAY_MS else DEFAULT_DELAY_MS) / 1000)
+                rgba = np.asarray(image.convert("RGBA"))
+                # Transparent pixels are black, as ffmpeg decodes them
+                rgb = np.where(rgba[:, :, 3:] == 0, np.uint8(0), rgba[:, :, :3])
+                if new_size != (w, h):
+                    rgb = cv2.resize(rgb, new_size, interpolation=interpolation)
+                distance = np.sqrt(((rgb - color) ** 2).sum(axis=2))
+                mask = distance ** self.s / (self.thr ** self.s + distance ** self.s) if self.thr else 1.0 * (distance != 0)
+                alpha = (mask.astype(np.float32) * 255 + 0.5).astype(np.uint8)
+                frames.append(np.dstack([rgb, alpha]))
+        return np.ascontiguousarray(np.stack(frames)), durations
+
+
+class GifClip(VideoClip):
+    """
+    Looping clip of baked GIF frames: the frame at time `t` is an index into the baked array,
+    modulo the GIF length. No image processing happens per frame.
+    """
+
+    def __init__(self, gif: GifFrames, duration):
+        VideoClip.__init__(self)
+        self.gif = gif
+        durations = gif.durations
+        self.starts = list(np.cumsum([0] + durations)[:-1])
+        self.length = float(sum(durations))
+        self.size = gif.size
+        self.duration = self.end = duration
+        self.make_frame = self._make_frame
+        self.mask = VideoClip(self._make_mask, ismask=True, duration=duration)
+        compositor.set_regions(self, self._regions)
+        compositor.set_frame_key(self)
+
+    def frame_key(self, t):
+        return bisect.bisect_right(self.starts, t % self.length) - 1
+
+    def _make_frame(self, t):
+        return self.gif.frames[self.frame_key(t), :, :, :3]
+
+    def _make_mask(self, t):
+        return self.gif.frames[self.frame_key(t), :, :, 3] / np.float32(255)
+
+    def _regions(self, t):
+        frame = self.gif.frames[self.frame_key(t)]
+        return [(0, 0, frame[:, :, :3], frame[:, :, 3])]
+
+
+_gifs = {}
+_gifs_lock = threading.Lock()
+
+def get_gif_frames(path, scale=1.0, log=None) -> GifFrames:
+    """Returns the baked frames of an animated image at a scale, shared by all clips of the process."""
+    key = (os.path.abspath(path), scale)
+    with _gifs_lock:
+        if key not in _gifs:
+            _gifs[key] = GifFrames(path, scale, log=log)
+        return _gifs[key]
@@ -1,25 +1,136 @@
 from rich.console import Console
 from rich.text import Text
 from rich.table import Table
+import atexit
+import os
+import queue
 import re
+import threading
 from datetime import datetime
 from pathlib import Path
 
 # Инициализация консоли
 console = Console()
 
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+LEVELS = {"DEBUG": DEBUG, "INFO": INFO, "WARNING": WARNING, "WARN": WARNING, "ERROR": ERROR}
+
+# Rich теги -> Markdown, компилируются один раз
+CONVERSIONS = [(re.compile(pattern), replacement) for pattern, replacement in [
+    (r'\[red\](.*?)\[\/red\]', r'**❌ <span style="color:red">\1</span>**'),
+    (r'\[yellow\](.*?)\[\/yellow\]', r'**⚠️ <span style="color:yellow">\1</span>**'),
+    (r'\[green\](.*?)\[\/green\]', r'**✅ <span style="color:green">\1</span>**'),
+    (r'\[blue\](.*?)\[\/blue\]', r'*<span style="color:blue">\1</span>*'),
+    (r'\[bold blue\](.*?)\[\/bold blue\]', r'**<span style="color:blue">\1</span>**'),
+    (r'\[cyan\](.*?)\[\/cyan\]', r'<span style="color:cyan">\1</span>'),
+    (r'\[grey\](.*?)\[\/grey\]', r'<span style="color:grey">\1</span>'),
+]]
+
+def default_level():
+    """Log level from the VIDMAKER_LOG_LEVEL environment variable (DEBUG, INFO, WARNING, ERROR), INFO by default."""
+    return LEVELS.get(os.environ.get("VIDMAKER_LOG_LEVEL", "INFO").upper(), INFO)
+
+
+class LogWriter:
+    """
+    Background thread printing log messages to the console and appending them to the Markdown files.
+
+    Loggers of all threads only put messages into a queue. The writer takes everything that is queued,
+    converts it to Markdown and writes it with one open/write per file, so parallel parts never wait
+    for the console or for file appends.
+    """
+
+    def __init__(self):
+        self.queue = queue.SimpleQueue()
+        self.thread = None
+        self.pid = None
+        self.lock = threading.Lock()
+
+    def put(self, item):
+        self._ensure_thread()
+        self.queue.put(item)
+
+    def _ensure_thread(self):
+        # A forked worker process inherits the object but not the thread
+        if self.thread is None or self.pid != os.getpid():
+            with self.lock:
+                if self.thread is None or self.pid != os.getpid():
+                    self.queue = queue.SimpleQueue()
+                    self.pid = os.getpid()
+                    self.thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+                    self.thread.start()
+
+    def flush(self):
+        """Waits until everything logged so far is printed and written."""
+        if self.thread is None or self.pid != os.getpid():
+            return
+        done = threading.Event()
+        self.queue.put(done)
+        done.wait()
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            # Все, что уже накопилось, пишем одним блоком
+            while True:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._write_batch(batch)
+
+    def _write_batch(self, batch):
+        files = {}
+        events = []
+        for item in batch:
+            if isinstance(item, threading.Event):
+                events.append(item)
+                continue
+            logger, message = item
+            try:
+                console.print(message)
+                files.setdefault(logger.log_file, []).append(logger._convert_rich_to_markdown(message) + "\n")
+            except Exception as e:
+                console.print(f"[red]Error formatting log message: {str(e)}[/red]")
+
+        for log_file, lines in files.items():
+            try:
+                with open(log_file, "a", encoding="utf-8") as f:
+                    f.write("".join(lines))
+            except Exception as e:
+                console.print(f"[red]Error writing to log file: {str(e)}[/red]")
+
+        for event in events:
+            event.set()
+
+_writer = LogWriter()
+atexit.register(_writer.flush)
+
+def flush():
+    """Waits until all queued log messages of this process are printed and written."""
+    _writer.flush()
+
+
 class HierarchicalLogger:
-    def __init__(self, indent_level=0, indent_step=2, prefix="", directory="./logs"):
+    def __init__(self, indent_level=0, indent_step=2, prefix="", directory="./logs", level=None, file_prefix=""):
         self.indent_level = indent_level  # Текущий уровень отступа
         self.indent_step = indent_step    # Количество пробелов для одного уровня
         self.prefix = prefix
+        self.level = default_level() if level is None else level
         
         # Используем переданную директорию вместо фиксированной
         self.log_dir = Path(directory)
         
         # Создаем новый файл с текущей датой и временем
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        self.log_file = self.log_dir / f"log_{timestamp}.md"
+        # Префикс задачи, чтобы задачи одной директории не писали в один файл
+        self.log_file = self.log_dir / f"{file_prefix}log_{timestamp}.md"
+
+    def is_enabled(self, level):
+        return level >= self.level
         
     def _convert_rich_to_markdown(self, message):
 
@@ -30,18 +141,9 @@ class HierarchicalLogger:
                 
         """Конвертирует форматирование Rich в Markdown с учетом иерархии"""
         # Сначала конвертируем Rich теги
-        conversions = {
-            r'\[red\](.*?)\[\/red\]': r'**❌ <span style="color:red">\1</span>**',
-            r'\[yellow\](.*?)\[\/yellow\]': r'**⚠️ <span style="color:yellow">\1</span>**', 
-            r'\[green\](.*?)\[\/green\]': r'**✅ <span style="color:green">\1</span>**',
-            r'\[blue\](.*?)\[\/blue\]': r'*<span style="color:blue">\1</span>*',
-            r'\[bold blue\](.*?)\[\/bold blue\]': r'**<span style="color:blue">\1</span>**',
-            r'\[cyan\](.*?)\[\/cyan\]': r'<span style="color:cyan">\1</span>',
-            r'\[grey\](.*?)\[\/grey\]': r'<span style="color:grey">\1</span>',
-        }
-        
-        for pattern, replacement in conversions.items():
-            message = re.sub(pattern, replacement, message)
+        message = str(message)
+        for pattern, replacement in CONVERSIONS:
+            message = pattern.sub(replacement, message)
 
         # Определяем уровень отступа для Markdown (2 пробела = 1 уровень)
         indent_level = self.indent_level // 2
@@ -70,33 +172,31 @@ class HierarchicalLogger:
         
         return markdown
 
-    def _write_to_file(self, message):
-        """Записывает сообщение в файл с учетом иерархии"""
-        try:
-            md_message = self._convert_rich_to_markdown(message)
-            with open(self.log_file, "a", encoding="utf-8") as f:
-                f.write(md_message + "\n")
-        except Exception as e:
-            console.print(f"[red]Error writing to log file: {str(e)}[/red]")
+    def _write(self, message):
+        """Передает сообщение фоновому потоку: вывод в консоль и запись в файл с учетом иерархии"""
+        _writer.put((self, message))
 
-    def print(self, message):
-        console.print(message)
-        self._write_to_file(message)
+    def print(self, message, level=INFO):
+        if level >= self.level:
+            self._write(message)
 
-    def log(self, message):
-        text = self.prefix + " " * self.indent_level + str(message)
-        console.print(text)
-        self._write_to_file(text)
+    def log(self, message, level=INFO):
+        if level >= self.level:
+            self._write(self.prefix + " " * self.indent_level + str(message))
+
+    def debug(self, message):
+        self.log(message, DEBUG)
 
     def error(self, text):
-        message = self.prefix + " " * self.indent_level + f"[red]❌ {text}[/red]"
-        console.print(message)
-        self._write_to_file(message)
+        if ERROR >= self.level:
+            self._write(self.prefix + " " * self.indent_level + f"[red]❌ {text}[/red]")
 
     def warn(self, text):
-        message = self.prefix + " " * self.indent_level + f"[yellow]⚠️ {text}[/yellow]"
-        console.print(message)
-        self._write_to_file(message)
+        if WARNING >= self.level:
+            self._write(self.prefix + " " * self.indent_level + f"[yellow]⚠️ {text}[/yellow]")
+
+    def flush(self):
+        flush()
 
     def sub_logger(self, prefix=""):
         # Передаем ту же директорию в под-логгер
@@ -104,7 +204,8 @@ class HierarchicalLogger:
             self.indent_level + self.indent_step, 
             self.indent_step, 
             prefix,
-            directory=self.log_dir
+            directory=self.log_dir,
+            level=self.level
         )
         logger.log_file = self.log_file
         return logger
@@ -1,19 +1,19 @@
+import argparse
 import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
 import yaml
-from converters.audio_reader_converter import AudioReaderConverter
 from rich.console import Console
-from icecream import ic
+from rich.table import Table
 import traceback
 
-from converters.channel_bars_visualizer import ChannelBarsVisualizer
-from converters.image_overlay_converter import ImageOverlayConverter
-from converters.join_converter import JoinConverter
-from converters.slideshow_creator_converter import SlideshowCreatorConverter
-from converters.split_converter import SplitConverter
-from converters.text_overlay_converter import TextOverlayConverter
-from converters.two_basses_visualization_convertor import TwoSpotsVisualizationConverter
-from converters.video_export_converter import VideoExportConverter
+# Converter modules (moviepy, librosa, cv2) are imported on first use by the registry
+import converters
 from hierarchical_logger import HierarchicalLogger
+import planner
+import resources
+from scheduler import Job, JobScheduler
+import tracing
 
 console = Console()
 
@@ -31,13 +31,22 @@ def get_clip_directories(base_directory):
     ]
 
 # Main processing function
-def process_directory(directory, tasks):
-    for task in tasks:
+def process_directory(directory, tasks, task_index=0, cores=None):
+    """
+    Runs tasks of a directory one after another.
+    :param cores: Cores given to the job by the scheduler, all cores if None.
+    """
+    for index, task in enumerate(tasks, start=task_index):
         console.rule(f"Processing Task: {task['name']}")
         converters = task.get('converters', [])
         clips = []
-        metadata = {}
-        logger = HierarchicalLogger(directory=directory)
+        # Temporary files and the log of the task are prefixed, so tasks of a directory never share them
+        metadata = {"task_prefix": f"task{index + 1}_"}
+        logger = HierarchicalLogger(directory=directory, file_prefix=metadata["task_prefix"])
+        # Threads of ffmpeg, OpenCV and the workers share the cores of the job
+        budget = metadata["resources"] = resources.ResourceBudget(cores, task.get('resources'))
+        budget.apply_nice()
+        logger.log(f"[grey]⚙️ Resources: {budget.cores} cores[/grey]")
 
 
         for converter_data in converters:
@@ -46,39 +55,131 @@ def process_directory(directory, tasks):
             converter = create_converter(converter_type, directory, config, logger)
 
             if converter:
-                clips = converter.process(clips, metadata)
+                # Key of the stage output, stages writing files reuse them from the artifact store
+                metadata["stage_key"] = converter.stage_key(metadata.get("stage_key"))
+                with tracing.span(converter_type, cat="converter", task=task['name']):
+                    clips = converter.process(clips, metadata)
             else:
                 console.print(f"[red]Unknown converter type: {converter_type}[/red]")
 
         # for clip in clips:
         #     clip.close()
+        logger.flush()
+
+    trace_file = tracing.write(directory)
+    if trace_file:
+        console.print(f"[grey]🧭 Trace written to {trace_file}[/grey]")
 
 # Create converter instance
 def create_converter(converter_type, directory, config, logger: HierarchicalLogger):
-    converter_map = {
-        "AudioReaderConverter": AudioReaderConverter,
-        "SlideshowCreatorConverter": SlideshowCreatorConverter,
-        "TextOverlayConverter": TextOverlayConverter,
-        "ImageOverlayConverter": ImageOverlayConverter,
-        "SplitConverter": SplitConverter,
-        "TwoSpotsVisualizationConverter": TwoSpotsVisualizationConverter,
-        "ChannelBarsVisualizer": ChannelBarsVisualizer,
-        "JoinConverter": JoinConverter,
-        "VideoExportConverter": VideoExportConverter,
-    }
-    converter_class = converter_map.get(converter_type)
+    imported = converter_type in converters.import_times
+    converter_class = converters.get_converter_class(converter_type)
     if converter_class:
+        if not imported:
+            logger.debug(f"[grey]📦 {converter_type} imported in {converters.import_times[converter_type]:.2f} s[/grey]")
         return converter_class(directory, config, logger)
     return None
 
+def validate_directory(directory):
+    """
+    Checks the config.yaml of a directory without importing the converters.
+    :return: Tuple (task names, list of problems).
+    """
+    config_path = os.path.join(directory, 'config.yaml')
+    if not os.path.exists(config_path):
+        return [], ["no config.yaml"]
+    try:
+        config = load_config(config_path) or {}
+    except yaml.YAMLError as e:
+        return [], [f"invalid config.yaml: {e}"]
+    tasks = config.get('tasks') or []
+    problems = [] if tasks else ["no tasks"]
+    for task in tasks:
+        for converter_data in task.get('converters', []):
+            if not converters.is_known(converter_data.get('type')):
+                problems.append(f"{task.get('name')}: unknown converter type {converter_data.get('type')}")
+    return [task.get('name') for task in tasks], problems
+
+def print_directories(clip_directories):
+    table = Table(title="📂 Clip directories")
+    table.add_column("Directory")
+    table.add_column("Tasks")
+    table.add_column("Status")
+    for directory in clip_directories:
+        tasks, problems = validate_directory(directory)
+        table.add_row(directory, ", ".join(map(str, tasks)), "✅" if not problems else "❌ " + "; ".join(problems))
+    console.print(table)
+
+def suggest_bands(clip_directories, num_bands, output=None):
+    """
+    Prints the suggested frequency bands of the audio of every directory, analysed in parallel.
+    :param output: Optional YAML file receiving the bands of every directory, as `frequency_bands` entries.
+    """
+    import audio_analysis
+
+    def suggest(directory):
+        audio_files = planner.list_files(directory, ('.mp3', '.wav', '.aac'))
+        if not audio_files:
+            return None, "no audio files"
+        try:
+            return audio_analysis.suggest_frequency_bands(audio_files[0], num_bands), None
+        except Exception as e:
+            return None, f"{type(e).__name__}: {e}"
+
+    with ThreadPoolExecutor(max_workers=resources.detected_cores()) as executor:
+        results = dict(zip(clip_directories, executor.map(suggest, clip_directories)))
+
+    table = Table(title="🎵 Suggested frequency bands")
+    table.add_column("Directory")
+    table.add_column("Bands")
+    for directory, (bands, error) in results.items():
+        table.add_row(directory, f"[red]{error}[/red]" if error else ", ".join(f"{low} - {high} Hz" for low, high in bands))
+    console.print(table)
+
+    if output:
+        bands_by_directory = {directory: [{"band": [low, high]} for low, high in bands]
+                              for directory, (bands, error) in results.items() if bands}
+        with open(output, 'w', encoding='utf-8') as f:
+            yaml.safe_dump(bands_by_directory, f, allow_unicode=True, sort_keys=False)
+        console.print(f"[green]✅ Bands written to {output}[/green]")
+    return all(error is None for _, error in results.values())
+
+def print_import_times():
+    table = Table(title="📦 Converter import times (fresh interpreter)")
+    table.add_column("Converter")
+    table.add_column("Import time", justify="right")
+    for converter_type in converters.converter_names():
+        table.add_row(converter_type, f"{converters.measure_import_time(converter_type):.2f} s")
+    console.print(table)
+
+def positive_int(value):
+    """argparse type of counts that must be at least 1."""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+    return number
+
 if __name__ == "__main__":
-    # Set base directory
-    base_directory = '.'
+    parser = argparse.ArgumentParser(description="Creates the videos of all Clip* directories")
+    parser.add_argument("base_directory", nargs="?", default=".", help="Directory containing the Clip* directories")
+    parser.add_argument("--jobs", "-j", type=int, default=None,
+                        help="CPU cores shared by the concurrent jobs (default: all cores, 1 runs the jobs one after another)")
+    parser.add_argument("--memory-budget", type=int, default=None,
+                        help="Memory in MB shared by the concurrent jobs (default: 75%% of the physical memory)")
+    parser.add_argument("--list", action="store_true", help="List the Clip* directories and check their config.yaml, without processing")
+    parser.add_argument("--plan", action="store_true", help="Print the timeline and estimates of every task from media headers only, without rendering")
+    parser.add_argument("--suggest-bands", type=positive_int, nargs="?", const=4, default=None, metavar="N",
+                        help="Print N (default 4) suggested frequency bands for the audio of every directory, without processing")
+    parser.add_argument("--bands-output", default=None, help="YAML file receiving the suggested bands")
+    parser.add_argument("--import-times", action="store_true", help="Import every converter and print the time spent")
+    args = parser.parse_args()
 
-    IMAGEMAGICK_BINARY = "D:\\Prog\\ImageMagick\\magick.exe"
-    
-    from moviepy.config import change_settings
-    change_settings({"IMAGEMAGICK_BINARY": IMAGEMAGICK_BINARY})
+    if args.import_times:
+        print_import_times()
+        sys.exit(0)
+
+    # Set base directory
+    base_directory = args.base_directory
 
     # Get directories to process
     clip_directories = get_clip_directories(base_directory)
@@ -86,17 +187,47 @@ if __name__ == "__main__":
         console.print(f"[yellow]No clip directories found in {base_directory}.[/yellow]")
         exit(1)
 
-    # Process each directory
+    if args.list:
+        print_directories(clip_directories)
+        sys.exit(0)
+
+    if args.suggest_bands is not None:
+        sys.exit(0 if suggest_bands(clip_directories, args.suggest_bands, args.bands_output) else 1)
+
+    if args.plan:
+        valid = True
+        for directory in clip_directories:
+            tasks, problems = validate_directory(directory)
+            if problems:
+                console.print(f"[red]❌ {directory}: {'; '.join(problems)}[/red]")
+                valid = False
+                continue
+            valid = planner.plan_directory(directory, load_config(os.path.join(directory, 'config.yaml'))['tasks']) and valid
+        sys.exit(0 if valid else 1)
+
+    # Every task of every directory is a job, the scheduler runs them concurrently within the budget
+    jobs = []
     for directory in clip_directories:
-        console.rule(f"Processing Directory: {directory}", characters="=")
         try:
             config_path = os.path.join(directory, 'config.yaml')
             if os.path.exists(config_path):
                 config = load_config(config_path)
                 tasks = config.get('tasks', [])
-                process_directory(directory, tasks)
+                for index, task in enumerate(tasks):
+                    job = Job(directory, index, task)
+                    # A task whose plan is invalid would fail late in the render, it is not started
+                    plan = planner.plan_task(directory, task, index)
+                    if not plan.ok:
+                        job.status, job.error, job.wall_time = "invalid", "; ".join(plan.errors), 0
+                        console.print(f"[red]❌ Invalid plan of {directory} / {job.name}: {job.error}[/red]")
+                    jobs.append(job)
             else:
                 console.print(f"[red]No config.yaml found in directory {directory}. Skipping...[/red]")
         except Exception as e:
-            console.print(f"[red]Error processing directory {directory}: {str(e)}[/red]")
-            console.print(f"[red]{traceback.format_exc()}[/red]")
\ No newline at end of file
+            console.print(f"[red]Error reading config of directory {directory}: {str(e)}[/red]")
+            console.print(f"[red]{traceback.format_exc()}[/red]")
+
+    scheduler = JobScheduler(cpu_budget=args.jobs, memory_budget_mb=args.memory_budget)
+    jobs = scheduler.run(jobs)
+    if any(job.status != "ok" for job in jobs):
+        sys.exit(1)
\ No newline at end of file
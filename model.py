@@ -4,11 +4,13 @@ class AudioPart:
     audio_file: str
     sample_rate: int
 
-    def __init__(self, start_time, end_time, audio_file, sample_rate=48000):
+    def __init__(self, start_time, end_time, audio_file, sample_rate=48000, pcm=None):
         self.start_time = start_time
         self.end_time = end_time
         self.audio_file = audio_file
         self.sample_rate = sample_rate
+        # PcmStore with the whole audio file decoded, shared by all parts
+        self.pcm = pcm
 
         self.offset = start_time
 
@@ -16,3 +18,8 @@ class AudioPart:
             self.duration = end_time - start_time
         else:
             self.duration = None
+
+    @property
+    def samples(self):
+        """Zero-copy view (channels, samples) of the part in the PCM store."""
+        return self.pcm.view(self.start_time, self.end_time)
@@ -0,0 +1,152 @@
+import json
+import os
+import subprocess
+import threading
+import numpy as np
+from moviepy.audio.AudioClip import AudioClip
+from moviepy.config import get_setting
+from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+import tool
+import tracing
+
+class PcmStore:
+    """
+    Float32 PCM of an audio file, decoded once into a memory-mapped file.
+
+    `samples` is a read-only array (samples, channels) backed by the file, so every consumer
+    (spectral analysis, moviepy audio, export) reads the same pages without decoding the audio again.
+    The store is pickled by path only, worker processes map the same file.
+    """
+
+    def __init__(self, path, sample_rate, channels, source_file=None):
+        self.path = path
+        self.sample_rate = int(sample_rate)
+        self.channels = int(channels)
+        self.source_file = source_file
+        self._samples = None
+
+    @property
+    def samples(self):
+        if self._samples is None:
+            self._samples = np.memmap(self.path, dtype=np.float32, mode="r").reshape(-1, self.channels)
+        return self._samples
+
+    def __len__(self):
+        return os.path.getsize(self.path) // (4 * self.channels)
+
+    @property
+    def duration(self):
+        return len(self) / self.sample_rate
+
+    def index_range(self, start_time=0, end_time=None):
+        """Sample range (start, stop) between two times in seconds."""
+        length = len(self)
+        start = min(int(round((start_time or 0) * self.sample_rate)), length)
+        stop = length if end_time is None else min(int(round(end_time * self.sample_rate)), length)
+        return start, max(start, stop)
+
+    def view(self, start_time=0, end_time=None):
+        """Zero-copy view (channels, samples) of the audio between two times, as librosa.load(mono=False) returns it."""
+        start, stop = self.index_range(start_time, end_time)
+        return self.samples[start:stop].T
+
+    def audio_clip(self, start_time=0, end_time=None):
+        """Moviepy audio clip playing the store between two times."""
+        return PcmAudioClip(self, *self.index_range(start_time, end_time))
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_samples"] = None
+        return state
+
+
+class PcmAudioClip(AudioClip):
+    """Moviepy audio clip reading a sample range of a PcmStore, without copying it."""
+
+    def __init__(self, store: PcmStore, start_index, end_index):
+        AudioClip.__init__(self)
+        self.store = store
+        self.start_index = start_index
+        self.end_index = end_index
+        self.fps = store.sample_rate
+        self.nchannels = store.channels
+        self.duration = self.end = (end_index - start_index) / store.sample_rate
+        self.make_frame = self._make_frame
+
+    def _make_frame(self, t):
+        samples = self.store.samples
+        if isinstance(t, np.ndarray):
+            indices = (self.fps * t).astype(int) + self.start_index
+            in_range = (indices >= self.start_index) & (indices < self.end_index)
+            result = np.zeros((len(t), self.nchannels))
+            result[in_range] = samples[indices[in_range]]
+            return result
+
+        i = int(self.fps * t) + self.start_index
+        if i < self.start_index or i >= self.end_index:
+            return np.zeros(self.nchannels)
+        return samples[i]
+
+
+_stores = {}
+_store_locks = {}
+_store_locks_guard = threading.Lock()
+
+def open_pcm_store(audio_file, log=None, channels=2, sample_rate=None) -> PcmStore:
+    """
+    Returns the PCM store of an audio file, decoding it with ffmpeg on first use.
+
+    Stores are shared by everything in the process and kept in the `.cache/pcm` directory next
+    to the audio file, keyed by the file content hash, so a directory is decoded only once.
+    :param sample_rate: Sample rate the audio is resampled to, the native rate of the file if None.
+    """
+    key = tool.file_hash(audio_file)
+    if sample_rate:
+        key = f"{key}.{int(sample_rate)}"
+    with _store_locks_guard:
+        lock = _store_locks.setdefault(key, threading.Lock())
+
+    with lock:
+        if key in _stores:
+            return _stores[key]
+
+        cache_dir = tool.get_cache_dir(os.path.dirname(audio_file), "pcm")
+        path = os.path.join(cache_dir, f"{key}.f32")
+        info_path = f"{path}.json"
+        if os.path.exists(path) and os.path.exists(info_path):
+            with open(info_path, "r", encoding="utf-8") as f:
+                info = json.load(f)
+        else:
+            info = decode_audio(audio_file, path, channels, log, sample_rate)
+            # Other job processes may read the info at any time, it is published complete
+            tmp_path = f"{info_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(info, f)
+            os.replace(tmp_path, info_path)
+
+        store = PcmStore(path, info["sample_rate"], info["channels"], source_file=audio_file)
+        if log:
+            log.log(f"[grey]🎵 PCM store: [bold]{os.path.basename(path)}[/bold], {store.sample_rate} Hz, {tool.transform_to_MMSS(store.duration)}[/grey]")
+        _stores[key] = store
+        return store
+
+@tracing.traced("decode_audio", cat="audio")
+def decode_audio(audio_file, path, channels, log=None, sample_rate=None):
+    """Decodes the whole audio file to raw float32 PCM, at its native sample rate if `sample_rate` is None."""
+    sample_rate = int(sample_rate) if sample_rate else ffmpeg_parse_infos(audio_file)["audio_fps"]
+    if log:
+        log.log(f"[grey]🎵 Decoding [bold]{audio_file}[/bold] once to float32 PCM ({sample_rate} Hz)[/grey]")
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    cmd = [
+        get_setting("FFMPEG_BINARY"), "-v", "error", "-y",
+        "-i", audio_file,
+        "-vn", "-ac", str(channels), "-ar", str(sample_rate),
+        "-f", "f32le", "-acodec", "pcm_f32le",
+        tmp_path,
+    ]
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise IOError(f"ffmpeg failed to decode {audio_file}: {result.stderr.decode(errors='replace')}")
+    os.replace(tmp_path, path)
+    return {"sample_rate": sample_rate, "channels": channels, "source": os.path.basename(audio_file)}
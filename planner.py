@@ -0,0 +1,305 @@
+"""
+Dry run of a task: the timeline of the video computed from media headers only.
+
+The planner follows the converters of a task as they would run, but reads only what the headers
+tell: the audio duration (ffmpeg probe), the image sizes and the GIF length (PIL). It builds the
+slides, split parts, overlay windows and output files, reports the problems the converters would
+raise late in a render, and estimates the frames to render and encode.
+"""
+import os
+import time
+from PIL import Image
+from rich.console import Console
+from rich.table import Table
+import converters
+import tool
+
+console = Console()
+
+# Rough cost of compositing and encoding one megapixel frame, measured with libx264 preset medium
+SECONDS_PER_MEGAPIXEL_FRAME = 0.03
+MIN_SLIDE_WIDTH = 720
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.jfif', '.webp')
+
+class Plan:
+    """Timeline, outputs, problems and estimates of one task."""
+
+    def __init__(self, directory, task_name):
+        self.directory = directory
+        self.task_name = task_name
+        self.duration = None
+        self.size = None
+        self.parts = []
+        self.part_count = 1
+        # The parts are joined with stream copy, the export may only mux
+        self.joined = False
+        self.timeline = []
+        self.outputs = []
+        self.encodes = []
+        self.errors = []
+        self.warnings = []
+
+    def add(self, kind, name, start, end, detail=""):
+        self.timeline.append((kind, name, start, end, detail))
+
+    def error(self, converter_type, message):
+        self.errors.append(f"{converter_type}: {message}")
+
+    def warn(self, converter_type, message):
+        self.warnings.append(f"{converter_type}: {message}")
+
+    @property
+    def ok(self):
+        return not self.errors
+
+    def estimated_frames(self):
+        return sum(frames for _, frames, _ in self.encodes)
+
+    def estimated_seconds(self):
+        return sum(frames * (size[0] * size[1] / 1e6) * SECONDS_PER_MEGAPIXEL_FRAME for _, frames, size in self.encodes if size)
+
+    def print(self):
+        console.rule(f"📋 Plan: {self.directory} / {self.task_name}")
+        table = Table(title="🗓️ Timeline")
+        for column in ("Kind", "Name", "Start", "End", "Detail"):
+            table.add_column(column)
+        for kind, name, start, end, detail in self.timeline:
+            table.add_row(kind, name, f"{start:.2f}", f"{end:.2f}" if end is not None else "-", detail)
+        if self.timeline:
+            console.print(table)
+
+        table = Table(title="🎞️ Encoding")
+        for column in ("Output", "Frames", "Size"):
+            table.add_column(column)
+        for output, frames, size in self.encodes:
+            table.add_row(os.path.basename(output), str(frames), f"↔{size[0]} ↕{size[1]}" if size else "?")
+        if self.encodes:
+            console.print(table)
+
+        duration = tool.transform_to_MMSS(self.duration) if self.duration else "?"
+        console.print(f"[cyan]⏱️ Duration {duration}, {self.part_count} parts, "
+                      f"~{self.estimated_frames()} frames to encode, estimated render time ~{tool.transform_to_MMSS(self.estimated_seconds())}[/cyan]")
+        for warning in self.warnings:
+            console.print(f"[yellow]⚠️ {warning}[/yellow]")
+        for error in self.errors:
+            console.print(f"[red]❌ {error}[/red]")
+        if self.ok:
+            console.print("[green]✅ Plan is valid[/green]")
+
+
+def image_size(path):
+    with Image.open(path) as image:
+        return image.size
+
+def gif_info(path):
+    """Size and length in seconds of an animated image, from its frame durations."""
+    with Image.open(path) as image:
+        size = image.size
+        frames = getattr(image, "n_frames", 1)
+        length = 0.0
+        for index in range(frames):
+            image.seek(index)
+            length += image.info.get("duration", 100) / 1000
+    return size, length
+
+def list_files(directory, extensions):
+    return [os.path.join(directory, f) for f in sorted(os.listdir(directory)) if f.lower().endswith(extensions)]
+
+def plan_task(directory, task, task_index=0):
+    """Computes the plan of a task without decoding any media."""
+    plan = Plan(directory, task.get('name', f"Task {task_index + 1}"))
+    has_clip = False
+    prefix = f"task{task_index + 1}_"
+
+    for converter_data in task.get('converters', []):
+        converter_type = converter_data.get('type')
+        config = converter_data.get('config') or {}
+        if not converters.is_known(converter_type):
+            plan.error(converter_type, "unknown converter type")
+            continue
+        planner = PLANNERS.get(converter_type)
+        if planner is None:
+            continue
+        if converter_type != "AudioReaderConverter" and not has_clip:
+            plan.error(converter_type, "no clip from the previous converters")
+            continue
+        planner(plan, directory, config, prefix)
+        # A failed audio reader leaves no clip (and no duration) for the next converters
+        has_clip = plan.duration is not None
+    return plan
+
+def _plan_audio(plan, directory, config, prefix):
+    audio_files = list_files(directory, ('.mp3', '.wav', '.aac'))
+    if not audio_files:
+        plan.error("AudioReaderConverter", f"no audio files found in {directory}")
+        return
+    duration = tool.probe_duration(audio_files[0])
+    if duration is None:
+        plan.error("AudioReaderConverter", f"can not read the duration of {os.path.basename(audio_files[0])}")
+        return
+    start_time = config.get('start_time', 0)
+    end_time = config.get('end_time', None)
+    end_time = duration if end_time is None else min(end_time, duration)
+    if end_time <= start_time:
+        plan.error("AudioReaderConverter", f"empty audio range {start_time} - {end_time}")
+        return
+    if plan.duration is None:
+        plan.duration = end_time - start_time
+        plan.size = plan.size or (1024, 1024)
+        plan.add("audio", os.path.basename(audio_files[0]), 0, plan.duration, f"{start_time} - {end_time} s of {duration:.2f} s")
+
+def _plan_slideshow(plan, directory, config, prefix):
+    from slide_store import SlideStore
+
+    all_images = list_files(directory, IMAGE_EXTENSIONS)
+    images = [f for f in all_images if not os.path.basename(f).lower().startswith("cover")]
+    if not images:
+        plan.error("SlideshowCreatorConverter", f"no image files found in {directory}")
+        return
+    slideshow = config.get('slideshow', {})
+    total_duration = plan.duration
+    duration_per_image = slideshow.get('duration', None)
+    if duration_per_image is None:
+        duration_per_image = max(total_duration / len(images), 2) if total_duration else 2
+    store = SlideStore(directory, slideshow.get('height', 1024), slideshow.get('width', None))
+
+    cover_name = config.get('cover', {}).get('name', None)
+    cover_duration = config.get('cover', {}).get('duration', duration_per_image or 5)
+    schedule = []
+    if cover_name:
+        covers = [f for f in all_images if os.path.basename(f).lower().startswith(cover_name)]
+        if len(covers) == 1:
+            schedule.append((covers[0], cover_duration))
+    start_time = sum(duration for _, duration in schedule)
+    while start_time < total_duration:
+        for image_file in images:
+            if start_time >= total_duration:
+                break
+            schedule.append((image_file, duration_per_image))
+            start_time += duration_per_image
+
+    start_time = 0
+    sizes = {}
+    for image_file, duration in schedule:
+        if image_file not in sizes:
+            try:
+                sizes[image_file] = store.slide_size(image_size(image_file))
+            except OSError as e:
+                plan.error("SlideshowCreatorConverter", f"can not read {os.path.basename(image_file)}: {e}")
+                return
+        size = sizes[image_file]
+        plan.add("slide", os.path.basename(image_file), start_time, start_time + duration, f"↔{size[0]} ↕{size[1]}")
+        start_time += duration
+
+    first_size = sizes[schedule[0][0]]
+    if first_size[0] < MIN_SLIDE_WIDTH:
+        plan.error("SlideshowCreatorConverter", f"image width {first_size[0]} of {os.path.basename(schedule[0][0])} is too small, minimum width is {MIN_SLIDE_WIDTH} pixels")
+    narrow = [os.path.basename(f) for f, size in sizes.items() if size[0] < MIN_SLIDE_WIDTH]
+    if narrow:
+        plan.warn("SlideshowCreatorConverter", f"slides narrower than {MIN_SLIDE_WIDTH} px: {', '.join(narrow)}")
+    plan.size = first_size
+
+def _plan_split(plan, directory, config, prefix):
+    parts = plan.part_count = config.get('parts', 3)
+    plan.parts = [tool.get_segment_duration(plan.duration, i, parts) for i in range(parts)]
+    for i, (start, end) in enumerate(plan.parts):
+        plan.add("part", f"part {i + 1}", start, end)
+
+def _plan_text(plan, directory, config, prefix):
+    import text_raster
+
+    font_name = config.get('font', {}).get('name', 'Arial')
+    if text_raster.find_font(font_name) is None:
+        plan.warn("TextOverlayConverter", f"font {font_name} not found, the default font will be used")
+    start_time = config.get('start_time', 0)
+    end_time = config.get('end_time', None)
+    for i, (part_start, part_end) in enumerate(plan.parts or [(0, plan.duration)]):
+        # Times are relative to every clip
+        end = min(part_end - part_start, end_time if end_time is not None else part_end - part_start)
+        if end <= start_time:
+            plan.warn("TextOverlayConverter", f"text is never shown in part {i + 1} ({start_time} - {end} s)")
+        plan.add("text", repr(config.get('text', 'Default Text')), part_start + start_time, part_start + max(end, start_time), f"part {i + 1}")
+
+def _plan_image(plan, directory, config, prefix):
+    image_path = config.get('image', {}).get('path')
+    if not image_path or not os.path.exists(image_path):
+        plan.error("ImageOverlayConverter", f"image file not found or path not specified: {image_path}")
+        return
+    try:
+        size, length = gif_info(image_path)
+    except OSError as e:
+        plan.error("ImageOverlayConverter", f"can not read {image_path}: {e}")
+        return
+    timing = config.get('timing', {})
+    for i, (part_start, part_end) in enumerate(plan.parts or [(0, plan.duration)]):
+        # Same window as ImageOverlayConverter.add_gif
+        clip_duration = part_end - part_start
+        start_time = timing.get('start_time', 0)
+        duration = timing.get('duration', None)
+        if duration is None:
+            duration = -start_time if start_time < 0 else 16.0
+        if start_time < 0:
+            start_time = max(0, clip_duration + start_time)
+        duration = min(duration, clip_duration - start_time - 2)
+        if duration <= 0:
+            plan.warn("ImageOverlayConverter", f"{os.path.basename(image_path)} is never shown in part {i + 1}")
+            continue
+        plan.add("overlay", os.path.basename(image_path), part_start + start_time, part_start + start_time + duration,
+                 f"{length:.2f} s loop, ↔{size[0]} ↕{size[1]}")
+
+def _plan_visualization(plan, directory, config, prefix):
+    import cv2
+    colormap = config.get('visualization', {}).get('colormap', 'COLORMAP_JET')
+    if not hasattr(cv2, colormap):
+        plan.error("Visualization", f"unknown colormap {colormap}")
+
+def _plan_join(plan, directory, config, prefix):
+    fps = config.get("fps", 24)
+    container = config.get("container", ".mp4") if config.get("mode", "copy") == "copy" else ".avi"
+    for i, (start, end) in enumerate(plan.parts or [(0, plan.duration)]):
+        output = os.path.join(directory, f"{prefix}subclip_{i + 1}{container}")
+        plan.encodes.append((output, int(round((end - start) * fps)), plan.size))
+        plan.outputs.append(output)
+    plan.parts = []
+    plan.joined = config.get("mode", "copy") == "copy"
+
+def _plan_export(plan, directory, config, prefix):
+    mp3_files = [f for f in os.listdir(directory) if f.endswith('.mp3')]
+    if not mp3_files:
+        plan.error("VideoExportConverter", f"no mp3 file found in {directory}, can not determine output file name")
+        return
+    output_file = config.get('output_file', f"{os.path.splitext(mp3_files[0])[0]}.mp4")
+    output_path = os.path.join(directory, output_file)
+    if os.path.exists(output_path):
+        plan.warn("VideoExportConverter", f"{output_file} exists, a timestamped file name will be used")
+    plan.outputs.append(output_path)
+    mode = config.get('mode', 'encode')
+    if mode in ('mux', 'auto') and plan.joined:
+        plan.add("mux", output_file, 0, plan.duration, "video stream copy")
+        return
+    if mode == 'mux':
+        plan.warn("VideoExportConverter", "mux export needs JoinConverter in copy mode, the clip will be encoded")
+    fps = config.get('quality', {}).get('fps', 24)
+    plan.encodes.append((output_path, int(round(plan.duration * fps)), plan.size))
+
+PLANNERS = {
+    "AudioReaderConverter": _plan_audio,
+    "SlideshowCreatorConverter": _plan_slideshow,
+    "SplitConverter": _plan_split,
+    "TextOverlayConverter": _plan_text,
+    "ImageOverlayConverter": _plan_image,
+    "TwoSpotsVisualizationConverter": _plan_visualization,
+    "ChannelBarsVisualizer": _plan_visualization,
+    "EqualizerBarsConverter": _plan_visualization,
+    "JoinConverter": _plan_join,
+    "VideoExportConverter": _plan_export,
+}
+
+def plan_directory(directory, tasks):
+    """Prints the plan of every task. :return: True if all plans are valid."""
+    start = time.perf_counter()
+    plans = [plan_task(directory, task, index) for index, task in enumerate(tasks)]
+    for plan in plans:
+        plan.print()
+    console.print(f"[grey]📋 Planned in {time.perf_counter() - start:.2f} s[/grey]")
+    return all(plan.ok for plan in plans)
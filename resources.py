@@ -0,0 +1,85 @@
+"""
+Core budget of a job: the threads of ffmpeg, OpenCV and the render workers, sized together.
+
+A job gets a number of cores from the scheduler. During the render phase the parts of the job are
+rendered and encoded at the same time, every worker gets an equal share of the cores for its encoder
+and for OpenCV. During the export phase one encoder gets all cores of the job.
+
+The `resources` section of a task in config.yaml overrides the computed values:
+
+    tasks:
+      - name: "Main"
+        resources:
+          cores: 4            # cores of the job, default: given by the scheduler
+          workers: 2          # parts rendered at the same time, default: one per core
+          ffmpeg_threads: 2   # threads of every encoder, default: the share of the cores of a worker
+          cv2_threads: 1      # OpenCV threads of every worker, default: the same share
+          nice: 5             # niceness added to the job process and its workers, default: 0
+"""
+import os
+
+# Niceness already added to this process, a job process may run several tasks
+_applied_nice = 0
+
+PHASE_RENDER = "render"
+PHASE_EXPORT = "export"
+
+def detected_cores():
+    """Cores this process may run on (the CPU affinity on Linux)."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+class ResourceBudget:
+    """Thread counts of a job for the current phase. Travels with the metadata to the worker processes."""
+
+    def __init__(self, cores=None, overrides=None):
+        """
+        :param cores: Cores given to the job, all detected cores if None.
+        :param overrides: The `resources` section of the task config.
+        """
+        self.overrides = overrides or {}
+        self.cores = max(1, int(self.overrides.get('cores') or cores or detected_cores()))
+        self.phase = PHASE_RENDER
+        self.parallel = 1
+
+    def workers(self, num_parts):
+        """Parts rendered at the same time."""
+        workers = self.overrides.get('workers') or min(num_parts, self.cores)
+        return max(1, int(workers))
+
+    def share(self):
+        """Cores of one worker in the current phase."""
+        return max(1, self.cores // self.parallel)
+
+    def ffmpeg_threads(self):
+        return max(1, int(self.overrides.get('ffmpeg_threads') or self.share()))
+
+    def cv2_threads(self):
+        return max(1, int(self.overrides.get('cv2_threads') or self.share()))
+
+    def enter(self, phase, parallel=1):
+        """Switches to a phase with `parallel` workers and applies the OpenCV thread count to this process."""
+        self.phase = phase
+        self.parallel = max(1, parallel) if phase == PHASE_RENDER else 1
+        self.apply()
+        return self
+
+    def apply(self):
+        """Applies the OpenCV thread count of the current phase, also called in every worker process."""
+        import cv2
+        cv2.setNumThreads(self.cv2_threads())
+
+    def apply_nice(self):
+        """Lowers the priority of the job process, worker processes inherit it."""
+        global _applied_nice
+        nice = int(self.overrides.get('nice', 0) or 0)
+        if nice > _applied_nice and hasattr(os, "nice"):
+            os.nice(nice - _applied_nice)
+            _applied_nice = nice
+
+    def describe(self):
+        return (f"{self.cores} cores, {self.phase} phase with {self.parallel} workers: "
+                f"ffmpeg {self.ffmpeg_threads()} threads, OpenCV {self.cv2_threads()} threads")
@@ -0,0 +1,163 @@
+import os
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from rich.console import Console
+from rich.table import Table
+import tool
+
+console = Console()
+
+class Job:
+    """One task of one Clip directory, the unit of scheduling."""
+
+    def __init__(self, directory, task_index, task):
+        self.directory = directory
+        self.task_index = task_index
+        self.task = task
+        self.name = task.get('name', f"Task {task_index + 1}")
+        self.cpus, self.memory_mb = estimate_job_resources(task)
+        # Cores given to the job when it starts, its threads are sized from them
+        self.cores = self.cpus
+        self.status = "pending"
+        self.error = None
+        self.wall_time = None
+
+
+def estimate_job_resources(task):
+    """
+    Rough resource needs of a task, from its converter configs only:
+    CPU cores (parts rendered in worker processes) and peak memory in MB (a few full frames per part).
+    """
+    parts, processes, height, width = 1, False, 1024, None
+    for converter in task.get('converters', []):
+        config = converter.get('config') or {}
+        if converter.get('type') == "SplitConverter":
+            parts = config.get('parts', 3)
+        if converter.get('type') == "SlideshowCreatorConverter":
+            height = config.get('slideshow', {}).get('height', height)
+            width = config.get('slideshow', {}).get('width', width)
+        # Only the join renders its parts in worker processes, see BaseConverter.get_parallel_config
+        if converter.get('type') == "JoinConverter" and (config.get('parallel') or {}).get('backend') == "process":
+            processes = True
+    width = width or height * 16 // 9
+    frame_mb = width * height * 3 / (1024 * 1024)
+    cpus = (task.get('resources') or {}).get('cores') or (parts if processes else 1)
+    # Interpreter, moviepy and librosa, plus the frames of the compositing chain and the encoder of every part
+    memory_mb = 400 + (250 if processes else 0) * (parts - 1) + frame_mb * 12 * parts
+    return cpus, int(memory_mb)
+
+def available_memory_mb():
+    """Physical memory of the machine in MB, None if unknown (Windows)."""
+    try:
+        return os.sysconf('SC_PHYS_PAGES') * os.sysconf('SC_PAGE_SIZE') // (1024 * 1024)
+    except (AttributeError, ValueError, OSError):
+        return None
+
+def run_job(directory, task_index, task, cores=None):
+    """Runs one task of a directory. Errors are returned, so one failing directory does not stop the others."""
+    import main
+    start = time.time()
+    try:
+        main.process_directory(directory, [task], task_index=task_index, cores=cores)
+        return "ok", None, time.time() - start
+    except Exception as e:
+        console.print(f"[red]Error processing directory {directory}, task {task.get('name')}: {str(e)}[/red]")
+        console.print(f"[red]{traceback.format_exc()}[/red]")
+        return "failed", f"{type(e).__name__}: {e}", time.time() - start
+
+
+class JobScheduler:
+    """
+    Runs the jobs of several directories concurrently within a CPU and a memory budget.
+
+    Every job runs in its own worker process, so a crash stays isolated in its job. A job is started
+    when its estimated cores and memory fit into what the running jobs leave free, the first job
+    always starts even if it is larger than the budget. Jobs of the same directory run one after
+    another: they share its output names and its artifact cache. With a budget of one core the jobs
+    run one after another in this process.
+    """
+
+    def __init__(self, cpu_budget=None, memory_budget_mb=None):
+        self.cpu_budget = cpu_budget or os.cpu_count() or 1
+        if memory_budget_mb is None:
+            memory = available_memory_mb()
+            memory_budget_mb = int(memory * 0.75) if memory else None
+        self.memory_budget_mb = memory_budget_mb
+
+    def fits(self, job, running):
+        cpus = sum(j.cpus for j in running)
+        memory = sum(j.memory_mb for j in running)
+        if not running:
+            return True
+        if cpus + min(job.cpus, self.cpu_budget) > self.cpu_budget:
+            return False
+        return self.memory_budget_mb is None or memory + job.memory_mb <= self.memory_budget_mb
+
+    def run(self, jobs):
+        # Jobs rejected before scheduling (invalid plan) keep their status
+        pending = [job for job in jobs if job.status == "pending"]
+        console.print(f"[blue]🗓️ Scheduling {len(pending)} jobs: budget {self.cpu_budget} cores, "
+                      f"{self.memory_budget_mb or '?'} MB[/blue]")
+        for job in pending:
+            # A job gets at least its estimate and an equal share of the budget, a single job gets all of it.
+            # Cores set in the `resources` section of the task are taken as they are
+            job.cores = (job.task.get('resources') or {}).get('cores') or \
+                min(self.cpu_budget, max(job.cpus, self.cpu_budget // max(1, len(pending))))
+        if self.cpu_budget <= 1:
+            for job in pending:
+                self._finish(job, run_job(job.directory, job.task_index, job.task, job.cores))
+        else:
+            self._run_concurrently(pending)
+        self.print_summary(jobs)
+        return jobs
+
+    def _run_concurrently(self, jobs):
+        pending = list(jobs)
+        running = {}
+        while pending or running:
+            # Start every pending job that fits, in order, smaller ones may pass a large one
+            busy = {job.directory for job in running.values()}
+            for job in list(pending):
+                if job.directory not in busy and self.fits(job, running.values()):
+                    busy.add(job.directory)
+                    pending.remove(job)
+                    executor = ProcessPoolExecutor(max_workers=1)
+                    future = executor.submit(run_job, job.directory, job.task_index, job.task, job.cores)
+                    running[future] = job
+                    job.executor = executor
+                    job.started = time.time()
+                    job.status = "running"
+                    console.print(f"[cyan]▶️ Started {job.directory} / {job.name} ({job.cores} cores, ~{job.memory_mb} MB)[/cyan]")
+
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in done:
+                job = running.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    # The worker process died (out of memory, native crash)
+                    result = ("failed", f"{type(e).__name__}: {e}", time.time() - job.started)
+                job.executor.shutdown(wait=False)
+                del job.executor
+                self._finish(job, result)
+
+    def _finish(self, job, result):
+        job.status, job.error, job.wall_time = result
+        color = "green" if job.status == "ok" else "red"
+        console.print(f"[{color}]⏹️ Finished {job.directory} / {job.name}: {job.status} in {tool.transform_to_MMSS(job.wall_time)}[/{color}]")
+
+    def print_summary(self, jobs):
+        table = Table(title="🗓️ Jobs summary")
+        table.add_column("Directory")
+        table.add_column("Task")
+        table.add_column("Status")
+        table.add_column("⏱️ Wall time", justify="right")
+        table.add_column("Cores", justify="right")
+        table.add_column("Memory (est.)", justify="right")
+        table.add_column("Error")
+        for job in jobs:
+            status = "✅" if job.status == "ok" else "❌"
+            wall_time = tool.transform_to_MMSS(job.wall_time) if job.wall_time is not None else "-"
+            table.add_row(job.directory, job.name, status, wall_time, str(job.cores), f"{job.memory_mb} MB", job.error or "")
+        console.print(table)
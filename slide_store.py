@@ -0,0 +1,162 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import imageio
+import numpy as np
+from PIL import Image
+import tool
+
+# Bump when the baking changes, so that old baked slides are not reused
+BAKE_VERSION = 2
+
+class SlideStore:
+    """
+    Slides of a slideshow, decoded, resized, cropped or letterboxed once per image file.
+
+    A baked slide is the final RGB array of the slide: resized to `height` and, when `width` is set,
+    cropped or letterboxed with black bars to `width`, exactly as the slideshow did with ImageClip.resize/crop.
+    Baked slides are persisted as .npy in the `.cache/slides` directory and memory-mapped on the next runs.
+    At most `window` slides are kept in memory, `prefetch` bakes the upcoming ones in background threads.
+    """
+
+    def __init__(self, directory, height, width=None, window=4, workers=None, log=None):
+        self.directory = directory
+        self.height = int(height)
+        self.width = int(width) if width is not None else None
+        self.window = max(1, int(window))
+        self.workers = workers or min(4, os.cpu_count() or 1)
+        self.log = log
+        self._init_runtime()
+
+    def _init_runtime(self):
+        self._slides = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def __getstate__(self):
+        # Worker processes get an empty store and map the baked files again
+        state = self.__dict__.copy()
+        for name in ("_slides", "_pending", "_lock", "_executor", "log"):
+            state.pop(name, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.log = None
+        self._init_runtime()
+
+    @property
+    def mode(self):
+        """Part of the baked file name: the target size, so a new height or width bakes the slides again."""
+        return f"h{self.height}" if self.width is None else f"{self.width}x{self.height}"
+
+    def original_size(self, image_file):
+        """Size (width, height) of the image, read from its header only."""
+        with Image.open(image_file) as image:
+            return image.size
+
+    def resized_size(self, original_size):
+        """Size (width, height) of the image after resizing to the slide height, before cropping or letterboxing."""
+        w, h = original_size
+        if h != self.height:
+            w = int(w * self.height / h)
+        return w, self.height
+
+    def slide_size(self, original_size):
+        """Size (width, height) of the baked slide."""
+        w, h = self.resized_size(original_size)
+        return (w if self.width is None else self.width), h
+
+    def baked_path(self, image_file):
+        cache_dir = tool.get_cache_dir(self.directory, "slides")
+        return os.path.join(cache_dir, f"{tool.file_hash(image_file)}.v{BAKE_VERSION}.{self.mode}.npy")
+
+    def get(self, image_file) -> np.ndarray:
+        """Returns the read-only baked slide (height, width, 3) of the image file."""
+        with self._lock:
+            if image_file in self._slides:
+                self._slides.move_to_end(image_file)
+                return self._slides[image_file]
+            future = self._pending.pop(image_file, None)
+
+        slide = future.result() if future is not None else self._load_or_bake(image_file)
+
+        with self._lock:
+            self._slides[image_file] = slide
+            self._slides.move_to_end(image_file)
+            while len(self._slides) > self.window:
+                self._slides.popitem(last=False)
+        return slide
+
+    def prefetch(self, image_files):
+        """Starts baking the next slides in background threads, up to the window size."""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers)
+            for image_file in list(dict.fromkeys(image_files))[:self.window]:
+                if image_file not in self._slides and image_file not in self._pending:
+                    self._pending[image_file] = self._executor.submit(self._load_or_bake, image_file)
+
+    def _load_or_bake(self, image_file):
+        path = self.baked_path(image_file)
+        if os.path.exists(path):
+            return np.load(path, mmap_mode="r")
+
+        slide = self.bake(image_file)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, slide)
+        os.replace(tmp_path, path)
+        if self.log:
+            self.log.log(f"[grey]🖼️ Baked slide [bold]{os.path.basename(image_file)}[/bold] ↔{slide.shape[1]} ↕{slide.shape[0]}[/grey]")
+        slide.flags.writeable = False
+        return slide
+
+    def bake(self, image_file) -> np.ndarray:
+        """Decodes the image and builds the final slide array."""
+        image = imageio.imread(image_file)
+        if image.ndim == 2:
+            image = np.dstack(3 * [image])
+        image = np.asarray(image[:, :, :3], dtype=np.uint8)
+
+        # Сначала изменяем размер по высоте (as moviepy resize with cv2 does)
+        w, h = self.resized_size((image.shape[1], image.shape[0]))
+        if (w, h) != (image.shape[1], image.shape[0]):
+            interpolation = cv2.INTER_LINEAR if w > image.shape[1] or h > image.shape[0] else cv2.INTER_AREA
+            image = cv2.resize(image, (w, h), interpolation=interpolation)
+
+        # Обрабатываем ширину
+        if self.width is not None and w != self.width:
+            if w > self.width:
+                crop_left = (w - self.width) // 2
+                image = image[:, crop_left:crop_left + self.width]
+            else:
+                # Добавляем черные полосы по бокам
+                canvas = np.zeros((h, self.width, 3), dtype=np.uint8)
+                x_position = (self.width - w) // 2
+                canvas[:, x_position:x_position + w] = image
+                image = canvas
+
+        return np.ascontiguousarray(image)
+
+    def close(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+            self._pending.clear()
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def get_slide_store(directory, height, width=None, log=None) -> SlideStore:
+    """Returns the slide store of a directory and slide size, shared by all clips of the process."""
+    key = (os.path.abspath(directory), int(height), int(width) if width is not None else None)
+    with _stores_lock:
+        if key not in _stores:
+            _stores[key] = SlideStore(directory, height, width, log=log)
+        return _stores[key]
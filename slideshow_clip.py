@@ -0,0 +1,120 @@
+import bisect
+import numpy as np
+from moviepy.video.VideoClip import VideoClip
+import compositor
+from slide_store import SlideStore
+
+class Slide:
+    """One slot of the slideshow timeline: an image shown for `duration` seconds with its fades."""
+
+    def __init__(self, image_file, duration, fade_in=0.0, fade_out=0.0, size=None):
+        self.image_file = image_file
+        self.duration = duration
+        self.fade_in = fade_in or 0.0
+        self.fade_out = fade_out or 0.0
+        self.size = size
+
+    def fade_factors(self, t):
+        """Brightness factors (fade in, fade out) of the slide at local time `t`, as fadein(fade_in).fadeout(fade_out) computes them."""
+        fade_in = t / self.fade_in if t < self.fade_in else 1.0
+        fade_out = (self.duration - t) / self.fade_out if self.duration - t < self.fade_out else 1.0
+        return fade_in, fade_out
+
+
+class SlideshowClip(VideoClip):
+    """
+    Slideshow of baked slides played one after another, centered on a black canvas.
+
+    Equivalent to concatenate_videoclips(method="compose") of faded ImageClips, but the clip knows its
+    timeline: during a hold it returns the same read-only frame, a fade is one scalar multiply of the
+    baked slide. `frame_key(t)` is equal for times with identical frames, so consumers can skip work.
+    """
+
+    def __init__(self, store: SlideStore, slides, size=None, prefetch=3):
+        VideoClip.__init__(self)
+        self.store = store
+        self.slides = slides
+        self.prefetch = prefetch
+        self.starts = list(np.cumsum([0] + [slide.duration for slide in slides])[:-1])
+        self.duration = self.end = float(sum(slide.duration for slide in slides))
+
+        for slide in slides:
+            if slide.size is None:
+                slide.size = store.slide_size(store.original_size(slide.image_file))
+        self.size = size or (max(slide.size[0] for slide in slides), max(slide.size[1] for slide in slides))
+        self._canvas = (None, None)
+        self._prefetched = None
+        self.make_frame = self._make_frame
+
+        # Slides smaller than the canvas leave transparent borders, as with the compose method
+        if any(tuple(slide.size) != tuple(self.size) for slide in slides):
+            self.mask = VideoClip(self._make_mask, ismask=True, duration=self.duration)
+        compositor.set_regions(self, self._regions)
+        compositor.set_frame_key(self)
+
+    def slide_at(self, t):
+        """Index of the slide playing at time `t` and the local time, or (None, None) after the end."""
+        if t < 0 or t >= self.duration:
+            return None, None
+        index = bisect.bisect_right(self.starts, t) - 1
+        return index, t - self.starts[index]
+
+    def frame_key(self, t):
+        index, local_t = self.slide_at(t)
+        if index is None:
+            return None, None
+        return index, self.slides[index].fade_factors(local_t)
+
+    def slide_frame(self, index, factors):
+        """The baked slide with its brightness factors, read-only and shared during holds."""
+        slide = self.slides[index]
+        if self._prefetched != index:
+            # Read-ahead of the next slides while this one is shown
+            self._prefetched = index
+            self.store.prefetch([s.image_file for s in self.slides[index:index + 1 + self.prefetch]])
+        baked = self.store.get(slide.image_file)
+        if all(factor >= 1.0 for factor in factors):
+            return baked
+        # Same float64 products and truncation as the moviepy fades
+        faded = baked
+        for factor in factors:
+            if factor < 1.0:
+                faded = faded * factor
+        faded = faded.astype(np.uint8)
+        faded.flags.writeable = False
+        return faded
+
+    def offset(self, index):
+        w, h = self.slides[index].size
+        return int((self.size[0] - w) / 2), int((self.size[1] - h) / 2)
+
+    def _regions(self, t):
+        index, factors = self.frame_key(t)
+        if index is None:
+            return []
+        x, y = self.offset(index)
+        return [(x, y, self.slide_frame(index, factors), None)]
+
+    def _make_frame(self, t):
+        index, factors = self.frame_key(t)
+        if index is not None and tuple(self.slides[index].size) == tuple(self.size):
+            return self.slide_frame(index, factors)
+
+        key = (index, factors)
+        if self._canvas[0] == key:
+            return self._canvas[1]
+        canvas = np.zeros((self.size[1], self.size[0], 3), dtype=np.uint8)
+        for x, y, rgb, _ in self._regions(t):
+            canvas[y:y + rgb.shape[0], x:x + rgb.shape[1]] = rgb
+        canvas.flags.writeable = False
+        self._canvas = (key, canvas)
+        return canvas
+
+    def _make_mask(self, t):
+        mask = np.zeros((self.size[1], self.size[0]), dtype=np.float32)
+        index, _ = self.slide_at(t)
+        if index is not None:
+            x, y = self.offset(index)
+            w, h = self.slides[index].size
+            mask[y:y + h, x:x + w] = 1.0
+        return mask
@@ -0,0 +1,39 @@
+import os
+import sys
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import compositor
+from gif_cache import GifClip, GifFrames
+from slide_store import SlideStore
+from slideshow_clip import Slide, SlideshowClip
+
+
+def make_slideshow(directory):
+    slides = []
+    for i, color in enumerate([(200, 40, 40), (40, 200, 40), (40, 40, 200)]):
+        path = os.path.join(directory, f"slide{i}.png")
+        Image.new("RGB", (96, 64), color).save(path)
+        slides.append(Slide(path, 2.5, fade_in=0.5, fade_out=0.5))
+    return SlideshowClip(SlideStore(directory, 64), slides)
+
+def make_gif(directory):
+    path = os.path.join(directory, "overlay.gif")
+    frames = [Image.new("RGB", (32, 32), (255, 255, 255 - 60 * i)) for i in range(4)]
+    frames[0].save(path, save_all=True, append_images=frames[1:], duration=100, loop=0)
+    return GifClip(GifFrames(path), duration=4).set_position((10, 10))
+
+def test_subclipped_composite_matches_direct_render(tmp_path):
+    directory = str(tmp_path)
+    background = make_slideshow(directory).subclip(2, 6)
+    gif_clip = make_gif(directory)
+    composite = compositor.composite_clips([background, gif_clip])
+    assert isinstance(composite, compositor.LayeredCompositeClip)
+
+    fps = 24
+    for t in np.arange(0, 4, 1.0 / fps):
+        # A new compositor for every frame can not reuse a frame from another time
+        expected = compositor.composite_clips([background, gif_clip]).get_frame(t)
+        assert np.array_equal(composite.get_frame(t), expected), f"frame at {t:.3f} s"
@@ -0,0 +1,23 @@
+import os
+import sys
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import gif_cache
+from gif_cache import GifClip, GifFrames
+
+
+def test_zero_delay_frames_get_the_default_delay(tmp_path):
+    path = os.path.join(str(tmp_path), "fast.gif")
+    frames = [Image.new("RGB", (16, 16), (60 * i, 255, 255)) for i in range(3)]
+    frames[0].save(path, save_all=True, append_images=frames[1:], duration=0, loop=0)
+    with Image.open(path) as image:
+        assert not image.info.get("duration")
+
+    gif = GifFrames(path)
+    assert gif.durations == [gif_cache.DEFAULT_DELAY_MS / 1000] * 3
+
+    clip = GifClip(gif, duration=1)
+    assert [clip.frame_key(t) for t in (0.0, 0.15, 0.25, 0.35)] == [0, 1, 2, 0]
+    assert clip.get_frame(0.5).shape == (16, 16, 3)
@@ -0,0 +1,167 @@
+import threading
+import numpy as np
+from moviepy.video.VideoClip import VideoClip
+from PIL import Image, ImageColor, ImageDraw, ImageFont
+import compositor
+
+class TextRaster:
+    """RGB and uint8 alpha of a rendered text, read-only and shared by every clip showing it."""
+
+    def __init__(self, rgb, alpha):
+        rgb.flags.writeable = False
+        alpha.flags.writeable = False
+        self.rgb = rgb
+        self.alpha = alpha
+
+    @property
+    def size(self):
+        return self.rgb.shape[1], self.rgb.shape[0]
+
+
+_fonts = {}
+_font_paths = {}
+_lines = {}
+_lock = threading.Lock()
+
+def find_font(name):
+    """
+    Font file of a font name as the config gives it ("Arial", "arial.ttf" or a path), found by FreeType
+    in the system font directories. :return: The name to pass to ImageFont.truetype, None if not found.
+    """
+    with _lock:
+        if name in _font_paths:
+            return _font_paths[name]
+    found = None
+    for candidate in dict.fromkeys([name, f"{name}.ttf", f"{name.lower()}.ttf", f"{name.replace(' ', '')}.ttf"]):
+        try:
+            ImageFont.truetype(candidate, 10)
+        except OSError:
+            continue
+        found = candidate
+        break
+    with _lock:
+        _font_paths[name] = found
+    return found
+
+def get_font(name, size):
+    """FreeType font of a name and pixel size, the default font if the name is not found."""
+    size = max(1, int(round(size)))
+    key = (name, size)
+    with _lock:
+        if key in _fonts:
+            return _fonts[key]
+    path = find_font(name)
+    font = ImageFont.truetype(path, size) if path else ImageFont.load_default(size)
+    with _lock:
+        _fonts[key] = font
+    return font
+
+def render_line(line, font, color, stroke_color=None, stroke_width=0):
+    """
+    Raster of one line of text: the fill drawn over its stroke (contour).
+    The line box is the font height plus the stroke above and below, so lines of a font stack evenly.
+    """
+    key = (line, id(font), color, stroke_color, stroke_width)
+    with _lock:
+        if key in _lines:
+            return _lines[key]
+
+    stroke_width = int(stroke_width or 0) if stroke_color else 0
+    ascent, descent = font.getmetrics()
+    left, _, right, _ = font.getbbox(line or " ", stroke_width=stroke_width)
+    x0 = min(left, 0)
+    size = (max(1, right - x0), ascent + descent + 2 * stroke_width)
+    origin = (-x0, stroke_width)
+
+    fill = Image.new("L", size, 0)
+    ImageDraw.Draw(fill).text(origin, line, font=font, fill=255)
+    fill = np.asarray(fill, dtype=np.uint16)[:, :, None]
+    fill_color = np.array(ImageColor.getrgb(color)[:3], dtype=np.uint16)
+
+    if stroke_width:
+        outline = Image.new("L", size, 0)
+        ImageDraw.Draw(outline).text(origin, line, font=font, fill=255, stroke_width=stroke_width, stroke_fill=255)
+        outline = np.asarray(outline, dtype=np.uint16)
+        stroke = np.array(ImageColor.getrgb(stroke_color)[:3], dtype=np.uint16)
+        # Заливка поверх контура, в целочисленной арифметике
+        rgb = ((fill_color * fill + stroke * (255 - fill) + 127) // 255).astype(np.uint8)
+        alpha = np.maximum(outline, fill[:, :, 0]).astype(np.uint8)
+    else:
+        rgb = np.broadcast_to(fill_color.astype(np.uint8), (size[1], size[0], 3)).copy()
+        alpha = fill[:, :, 0].astype(np.uint8)
+
+    raster = TextRaster(rgb, alpha)
+    with _lock:
+        _lines[key] = raster
+    return raster
+
+def render_text(text, font_name, font_size, color="white", stroke_color=None, stroke_width=0, line_spacing=0):
+    """Raster of a text of one or more lines, centered as ImageMagick labels are. Lines are cached separately."""
+    font = get_font(font_name, font_size)
+    lines = [render_line(line, font, color, stroke_color, stroke_width) for line in str(text).split("\n")]
+    if len(lines) == 1:
+        return lines[0]
+
+    ascent, descent = font.getmetrics()
+    step = ascent + descent + line_spacing
+    width = max(line.size[0] for line in lines)
+    height = step * (len(lines) - 1) + lines[-1].size[1]
+    rgb = np.zeros((height, width, 3), dtype=np.uint8)
+    alpha = np.zeros((height, width), dtype=np.uint8)
+    for i, line in enumerate(lines):
+        x, y = (width - line.size[0]) // 2, i * step
+        h, w = line.alpha.shape
+        # Контур строки может заходить на соседнюю, берется максимум
+        region = alpha[y:y + h, x:x + w]
+        take = line.alpha >= region
+        rgb[y:y + h, x:x + w][take] = line.rgb[take]
+        region[take] = line.alpha[take]
+    return TextRaster(rgb, alpha)
+
+
+class TextRasterClip(VideoClip):
+    """
+    Clip of a text raster with fades. Frames are the cached raster itself, a fade only scales its
+    alpha, so the compositor blends the small text region and nothing is rendered per frame.
+    """
+
+    def __init__(self, raster: TextRaster, duration, fade_in=0.0, fade_out=0.0):
+        VideoClip.__init__(self)
+        self.raster = raster
+        self.size = raster.size
+        self.duration = self.end = duration
+        self.fade_in = fade_in or 0.0
+        self.fade_out = fade_out or 0.0
+        self._faded = (None, None)
+        self.make_frame = self._make_frame
+        self.mask = VideoClip(self._make_mask, ismask=True, duration=duration)
+        compositor.set_regions(self, self._regions)
+        compositor.set_frame_key(self)
+
+    def frame_key(self, t):
+        """Opacity of the text at time `t`."""
+        factor = 1.0
+        if t < self.fade_in:
+            factor *= t / self.fade_in
+        if self.duration - t < self.fade_out:
+            factor *= (self.duration - t) / self.fade_out
+        return min(max(factor, 0.0), 1.0)
+
+    def alpha(self, t):
+        factor = self.frame_key(t)
+        if factor >= 1.0:
+            return self.raster.alpha
+        if self._faded[0] != factor:
+            faded = (self.raster.alpha * np.float32(factor) + np.float32(0.5)).astype(np.uint8)
+            faded.flags.writeable = False
+            self._faded = (factor, faded)
+        return self._faded[1]
+
+    def _make_frame(self, t):
+        return self.raster.rgb
+
+    def _make_mask(self, t):
+        return self.alpha(t) / np.float32(255)
+
+    def _regions(self, t):
+        return [(0, 0, self.raster.rgb, self.alpha(t))]
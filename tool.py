@@ -1,9 +1,16 @@
+import hashlib
+import os
+import re
+import subprocess
+import threading
 import time
-import cv2
+from typing import TYPE_CHECKING
 import numpy as np
-from moviepy.editor import VideoClip
-import librosa  
 from model import AudioPart
+import tracing
+
+if TYPE_CHECKING:
+    from moviepy.video.VideoClip import VideoClip
 
 def transform_to_MMSS(seconds: int) -> str:
     return time.strftime('%M:%S', time.gmtime(seconds))
@@ -62,7 +69,8 @@ def inspect_clip(name, clip, log, debug=False):
         log.log("🎨 This clip is RGB (no transparency).")
     log.log("[bold blue]==============================[/bold blue]")
 
-def load_audio_from_videoclip(clip: VideoClip, log, type="librosa", metadata=None, sample_rate=None, audio_part:AudioPart =None):
+@tracing.traced("load_audio_from_videoclip")
+def load_audio_from_videoclip(clip: "VideoClip", log, type="librosa", metadata=None, sample_rate=None, audio_part:AudioPart =None):
     """
     Extracts audio from a video clip and returns it in a format compatible with librosa.load or moviepy output.
 
@@ -114,13 +122,101 @@ def load_audio_from_videoclip(clip: VideoClip, log, type="librosa", metadata=Non
         offset = audio_part.offset
         duration = audio_part.duration  
 
+        if audio_part.pcm is not None:
+            # Zero-copy view into the audio decoded once for the whole directory
+            log.log(f"[grey]🎵 Reading audio from PCM store. Offset: [bold]{offset}[/bold], Duration: [bold]{duration}[/bold][/grey]")
+            return audio_part.samples, audio_part.pcm.sample_rate
+
         log.log(f"[grey]🎵 Loading audio from file: [bold]{audio_part.audio_file}[/bold]. Offset: [bold]{offset}[/bold], Duration: [bold]{duration}[/bold][/grey]")
+        import librosa
         y, sr = librosa.load(audio_part.audio_file, sr=None, mono=False, offset=offset, duration=duration)
         log.log(f"[grey]🎵 Loaded audio with sample rate: [bold]{sr}[/bold] Hz[/grey]")
         # log.log(f"[grey]🔢 First 50 values of audio:[/grey]")
         # log.log(f"[grey]{y[:50]}[/grey]")
         return y, sr
 
+# Name of the cache directory created inside the clip directories
+CACHE_DIRECTORY = ".cache"
+
+def get_cache_dir(directory, *names):
+    """Returns the cache sub-directory `names` inside `directory`, creating it if needed."""
+    path = os.path.join(directory, CACHE_DIRECTORY, *names)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+_file_hashes = {}
+_file_hashes_lock = threading.Lock()
+
+def file_hash(path, chunk_size=1024 * 1024):
+    """
+    Returns the SHA-1 of the file content.
+    The hash is remembered for the process while the file size and modification time stay the same.
+    """
+    stat = os.stat(path)
+    cache_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    with _file_hashes_lock:
+        if cache_key in _file_hashes:
+            return _file_hashes[cache_key]
+
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha1.update(chunk)
+    digest = sha1.hexdigest()
+
+    with _file_hashes_lock:
+        _file_hashes[cache_key] = digest
+    return digest
+
+def _ffmpeg_header(path):
+    """Header output of `ffmpeg -i` for a media file (stream and duration lines), read without decoding it."""
+    from moviepy.config import get_setting
+
+    result = subprocess.run([get_setting("FFMPEG_BINARY"), "-hide_banner", "-i", path],
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    return result.stderr.decode(errors="replace")
+
+def probe_video_stream(path):
+    """
+    Reads the parameters of the first video stream of a media file from the ffmpeg header output.
+    :return: dict with codec, profile, pix_fmt, size, fps and time_base, or None if there is no video stream.
+    """
+    for line in _ffmpeg_header(path).splitlines():
+        if "Video:" not in line:
+            continue
+        codec = re.search(r"Video: (\w+)(?: \(([^)]*)\))?", line)
+        pix_fmt_size = re.search(r", (\w+)(?:\([^)]*\))?, (\d+)x(\d+)", line)
+        fps = re.search(r"([\d.]+) fps", line)
+        time_base = re.search(r"([\d.]+k?) tbn", line)
+        return {
+            "codec": codec.group(1) if codec else None,
+            "profile": codec.group(2) if codec else None,
+            "pix_fmt": pix_fmt_size.group(1) if pix_fmt_size else None,
+            "size": (int(pix_fmt_size.group(2)), int(pix_fmt_size.group(3))) if pix_fmt_size else None,
+            "fps": float(fps.group(1)) if fps else None,
+            "time_base": time_base.group(1) if time_base else None,
+        }
+    return None
+
+def probe_audio_codec(path):
+    """
+    Reads the codec of the first audio stream of a media file from the ffmpeg header output.
+    :return: Codec name (mp3, aac, ...), None if there is no audio stream.
+    """
+    match = re.search(r"Audio: (\w+)", _ffmpeg_header(path))
+    return match.group(1) if match else None
+
+def probe_duration(path):
+    """
+    Reads the duration of a media file from the ffmpeg header output, without decoding it.
+    :return: Duration in seconds, None if ffmpeg does not report it.
+    """
+    match = re.search(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)", _ffmpeg_header(path))
+    if match is None:
+        return None
+    hours, minutes, seconds = match.groups()
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
 def get_segment_duration(total_duration, segment_number, total_segments):
     # Вычисляем длительность одного сегмента
     segment_length = total_duration / total_segments
@@ -133,4 +229,14 @@ def get_segment_duration(total_duration, segment_number, total_segments):
     if segment_number == total_segments + 1:
         end_time = total_duration - 1
 
-    return start_time, end_time
\ No newline at end of file
+    return start_time, end_time
+
+def convert_position(value, frame_dimension):
+    """Position of the config ("10pt", "5%", "center", "left" or pixels) as moviepy's set_position takes it."""
+    if isinstance(value, str):
+        if value.endswith('pt'):
+            return int(value.replace('pt', ''))
+        elif value.endswith('%'):
+            # Percent of the frame size, in pixels (a fraction alone would be read as pixels)
+            return int(frame_dimension * float(value.replace('%', '')) / 100)
+    return value
\ No newline at end of file
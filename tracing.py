@@ -0,0 +1,121 @@
+"""
+Opt-in span tracing in the Chrome trace event format (chrome://tracing, https://ui.perfetto.dev).
+
+Tracing is enabled by the VIDMAKER_TRACE environment variable: "1" writes `trace_<timestamp>.json`
+into the processed directory, any other value is used as the trace file path.
+When disabled, `span` returns a shared no-op context manager and `traced` calls the function directly.
+
+    with tracing.span("stft", part=index):
+        ...
+
+    @tracing.traced("load_audio")
+    def load_audio(...):
+        ...
+"""
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+
+ENV_VAR = "VIDMAKER_TRACE"
+
+_enabled = os.environ.get(ENV_VAR, "").lower() not in ("", "0", "false", "no")
+_events = []
+_thread_names = {}
+_NULL_SPAN = contextlib.nullcontext()
+
+def enabled():
+    return _enabled
+
+def enable(value="1"):
+    """Enables tracing for this process and the worker processes started after it."""
+    global _enabled
+    os.environ[ENV_VAR] = value
+    _enabled = True
+
+def _now_us():
+    # CLOCK_MONOTONIC is shared by all processes, worker events line up with the main process
+    return time.perf_counter_ns() / 1000
+
+class _Span:
+    __slots__ = ("name", "cat", "args", "start")
+
+    def __init__(self, name, cat, args):
+        self.name = name
+        self.cat = cat
+        self.args = args
+
+    def __enter__(self):
+        self.start = _now_us()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = _now_us()
+        pid, tid = os.getpid(), threading.get_native_id()
+        if (pid, tid) not in _thread_names:
+            _thread_names[(pid, tid)] = threading.current_thread().name
+        event = {"name": self.name, "cat": self.cat, "ph": "X", "ts": self.start, "dur": end - self.start,
+                 "pid": pid, "tid": tid}
+        if self.args:
+            event["args"] = self.args
+        if exc_type is not None:
+            event.setdefault("args", {})["error"] = exc_type.__name__
+        # list.append is atomic, spans of all threads go to the same list
+        _events.append(event)
+        return False
+
+def span(name, cat="pipeline", **args):
+    """Context manager recording the time spent in the block, with `args` shown in the trace viewer."""
+    if not _enabled:
+        return _NULL_SPAN
+    return _Span(name, cat, args)
+
+def traced(name=None, cat="pipeline"):
+    """Decorator recording every call of the function as a span."""
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _Span(span_name, cat, None):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def drain():
+    """Removes and returns the events recorded so far (worker processes send them back to the main process)."""
+    events = _events[:]
+    del _events[:len(events)]
+    names = [{"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+             for (pid, tid), name in _thread_names.items()]
+    _thread_names.clear()
+    return names + events
+
+def merge(events):
+    """Adds events recorded in another process."""
+    for event in events:
+        if event.get("ph") == "M":
+            _thread_names[(event["pid"], event["tid"])] = event["args"]["name"]
+        else:
+            _events.append(event)
+
+def write(directory):
+    """
+    Writes the recorded events as a Chrome trace JSON and clears them.
+    :return: Path of the trace file, None if tracing is disabled.
+    """
+    if not _enabled:
+        return None
+    value = os.environ.get(ENV_VAR, "1")
+    if value.lower() in ("1", "true", "yes"):
+        path = os.path.join(directory, f"trace_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    else:
+        path = value
+    events = drain()
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+    return path